@@ -2,21 +2,37 @@
 API视图 - 支持前端通信
 """
 
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import status
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
-from core.models import User
+from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from core.models import User, DesktopIcon, Resource
+from core.serializers import DesktopIconSerializer
+from core.desktop_utils import prefetch_icons, folder_tree
+from core.facets import library_facets
+from core.cache_utils import get_user_version
+from core.quota import usage_payload
+from core.health import health_status, health_gauges
+from core.metrics import render as render_metrics
+from core.throttling import LoginIPRateThrottle, LoginUsernameRateThrottle, password_hash_slot
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+import hashlib
+import hmac
 import json
+from datetime import datetime, timezone as dt_timezone
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginIPRateThrottle, LoginUsernameRateThrottle])
 def api_login(request):
-    """API登录接口 - 使用SimpleJWT"""
+    """API登录接口 - 使用SimpleJWT (超出 IP / 用户名限流时在哈希之前返回 429)"""
     try:
         username = request.data.get('username')
         password = request.data.get('password')
@@ -27,9 +43,20 @@ def api_login(request):
                 'detail': '用户名和密码不能为空'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        user = authenticate(username=username, password=password)
+        # 限制同时进行的密码哈希数量，避免撞库流量占满所有 worker
+        with password_hash_slot() as acquired:
+            if not acquired:
+                response = Response({
+                    'success': False,
+                    'detail': '服务器繁忙，请稍后重试'
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                response['Retry-After'] = '1'
+                return response
+            user = authenticate(username=username, password=password)
         
         if user:
+            LoginUsernameRateThrottle().reset(request)
+
             # 生成JWT token
             refresh = RefreshToken.for_user(user)
             
@@ -70,23 +97,26 @@ def api_logout(request):
             'detail': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _user_payload(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_staff': user.is_staff,
+        'date_joined': user.date_joined,
+        'storage': usage_payload(user)
+    }
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def api_user_info(request):
     """获取用户信息接口"""
     try:
-        user = request.user
         return Response({
             'success': True,
-            'data': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'is_staff': user.is_staff,
-                'date_joined': user.date_joined
-            }
+            'data': _user_payload(request.user)
         })
     except Exception as e:
         return Response({
@@ -94,52 +124,81 @@ def api_user_info(request):
             'detail': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+BOOTSTRAP_CACHE_TIMEOUT = 60
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_bootstrap(request):
+    """
+    桌面启动数据接口：一次返回用户信息、桌面顶级图标 (含预览)、文件夹树和各库统计。
+    结果按用户缓存 (桌面版本号变化即失效)，支持 ETag / If-None-Match 返回 304。
+    """
+    try:
+        user = request.user
+        cache_key = f'bootstrap:{user.id}:{get_user_version(user.id)}'
+        cached = cache.get(cache_key)
+
+        if cached is None:
+            icons = prefetch_icons(
+                DesktopIcon.objects.filter(user=user, parent_folder__isnull=True)
+                .select_related('content_type')
+            )
+            payload = {
+                'user': _user_payload(user),
+                'desktop': DesktopIconSerializer(icons, many=True).data,
+                'folders': folder_tree(user),
+                'libraries': library_facets(user.id),
+            }
+            body = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True)
+            cached = {'etag': '"%s"' % hashlib.md5(body.encode('utf-8')).hexdigest(), 'data': payload}
+            cache.set(cache_key, cached, BOOTSTRAP_CACHE_TIMEOUT)
+
+        if cached['etag'] in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({'success': True, 'data': cached['data']})
+        response['ETag'] = cached['etag']
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    except Exception as e:
+        return Response({
+            'success': False,
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def api_files_list(request):
-    """获取文件列表接口"""
+    """获取文件列表接口 (大小等信息来自上传时记录的字段，不访问磁盘)"""
     try:
-        # 这里应该从数据库或文件系统获取真实数据
-        # 暂时返回模拟数据
-        mock_files = [
-            {
-                'id': 1,
-                'name': '工作报告.docx',
-                'type': 'document',
-                'size': 2048576,
-                'modified': '2024-01-15T10:30:00Z',
-                'path': '/documents/工作报告.docx'
-            },
-            {
-                'id': 2,
-                'name': '项目截图.png',
-                'type': 'image',
-                'size': 1024000,
-                'modified': '2024-01-14T15:20:00Z',
-                'path': '/images/项目截图.png'
-            },
-            {
-                'id': 3,
-                'name': '演示视频.mp4',
-                'type': 'video',
-                'size': 15728640,
-                'modified': '2024-01-13T09:45:00Z',
-                'path': '/videos/演示视频.mp4'
-            },
+        try:
+            limit = min(max(int(request.GET.get('limit', 100)), 1), 500)
+            offset = max(int(request.GET.get('offset', 0)), 0)
+        except ValueError:
+            return Response({
+                'success': False,
+                'detail': 'limit / offset 必须是整数'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = Resource.objects.filter(author=request.user).exclude(file='').order_by('-created_at')
+        rows = qs.values('id', 'title', 'kind', 'mime_type', 'file_size', 'created_at', 'file')[offset:offset + limit]
+        files = [
             {
-                'id': 4,
-                'name': '音乐文件.mp3',
-                'type': 'music',
-                'size': 5242880,
-                'modified': '2024-01-12T20:15:00Z',
-                'path': '/music/音乐文件.mp3'
+                'id': row['id'],
+                'name': row['title'],
+                'type': row['kind'],
+                'mime_type': row['mime_type'],
+                'size': row['file_size'],
+                'modified': row['created_at'],
+                'path': default_storage.url(row['file'])
             }
+            for row in rows
         ]
         
         return Response({
             'success': True,
-            'data': mock_files,
-            'count': len(mock_files)
+            'data': files,
+            'count': qs.count()
         })
     except Exception as e:
         return Response({
@@ -213,9 +272,27 @@ def api_upload_file(request):
 
 @csrf_exempt
 def health_check(request):
-    """健康检查接口"""
+    """健康检查接口：数据库 / 磁盘 / 缓存 / 队列探测 (结果缓存数秒)，数据库不可用时返回 503"""
+    result = health_status()
     return JsonResponse({
-        'status': 'healthy',
-        'timestamp': '2024-01-15T10:00:00Z',
-        'version': '1.0.0'
-    })
\ No newline at end of file
+        'status': result['status'],
+        'timestamp': datetime.fromtimestamp(result['checked_at'], tz=dt_timezone.utc).isoformat(),
+        'version': '1.0.0',
+        'checks': result['checks'],
+    }, status=503 if result['status'] == 'unhealthy' else 200)
+
+
+@csrf_exempt
+def metrics_view(request):
+    """
+    Prometheus 抓取接口：设置了 METRICS_TOKEN 时需携带 Authorization: Bearer <token>，
+    否则只允许 METRICS_ALLOWED_IPS 中的地址 (默认仅本机) 访问
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        return HttpResponse(status=403)
+    body = render_metrics(health_gauges(health_status()))
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
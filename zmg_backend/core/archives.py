@@ -0,0 +1,225 @@
+"""
+压缩包浏览 - 不解压即可列出压缩包内容，并单独下载其中一个文件
+
+- zip：只读取文件末尾的中央目录 (zipfile 会 seek 过去)，与压缩包大小无关；
+- tar：未压缩的 tar 逐个读取 512 字节的头部并 seek 跳过文件内容；tar.gz 等只能顺序解压读取头部；
+- gz (单个文件)：文件名取自 gzip 头部，原始大小取自末尾 4 字节 (ISIZE)，无需解压；
+- 7z：需要可选依赖 py7zr (pip install py7zr)，只支持列目录。
+
+列表结果按存储文件名缓存 (文件写入后不再改变，替换文件总是保存为新文件名)；
+单个文件的下载边解压边输出，不落盘。
+"""
+import gzip
+import hashlib
+import lzma
+import struct
+import tarfile
+import zipfile
+import zlib
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import py7zr
+except ImportError:
+    py7zr = None
+
+CACHE_TIMEOUT = 7 * 24 * 3600
+CHUNK_SIZE = 64 * 1024
+# 压缩包损坏时各个解压库抛出的异常
+CORRUPT_ERRORS = (zipfile.BadZipFile, tarfile.TarError, EOFError, struct.error, OSError, zlib.error, lzma.LZMAError)
+
+
+class UnsupportedArchive(Exception):
+    """无法识别或不支持的压缩格式"""
+
+
+def list_limit():
+    return getattr(settings, 'ARCHIVE_LIST_LIMIT', 5000)
+
+
+def archive_key(resource):
+    """列表缓存的标识：存储文件名的摘要 (不使用客户端可影响的 content_hash)"""
+    return hashlib.sha256(resource.file.name.encode('utf-8')).hexdigest()
+
+
+def detect_format(fileobj, name):
+    """按文件头识别格式：zip / tar / gz / 7z，其余返回 None"""
+    fileobj.seek(0)
+    head = fileobj.read(512)
+    fileobj.seek(0)
+    if head[:4] in (b'PK\x03\x04', b'PK\x05\x06'):
+        return 'zip'
+    if head[:6] == b'7z\xbc\xaf\x27\x1c':
+        return '7z'
+    if head[257:262] == b'ustar':
+        return 'tar'
+    if head[:2] == b'\x1f\x8b':
+        # .tar.gz / .tgz 按 tar 处理 (tarfile 自动解压)，否则视为单个文件的 gzip
+        lower = name.lower()
+        return 'tar' if lower.endswith(('.tar.gz', '.tgz')) else 'gz'
+    if head[:3] == b'BZh' or head[:6] == b'\xfd7zXZ\x00':
+        return 'tar'
+    return None
+
+
+def _entry(name, size, compressed, is_dir, modified):
+    return {
+        'name': name,
+        'size': size,
+        'compressed_size': compressed,
+        'is_dir': is_dir,
+        'modified': modified.isoformat() if modified else None,
+    }
+
+
+def _zip_entries(fileobj):
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            try:
+                modified = datetime(*info.date_time)
+            except ValueError:
+                modified = None
+            yield _entry(info.filename, info.file_size, info.compress_size, info.is_dir(), modified)
+
+
+def _tar_entries(fileobj):
+    with tarfile.open(fileobj=fileobj, mode='r:*') as archive:
+        # 逐个读取成员头部 (不调用 getmembers)，调用方读够数量后即停止
+        for member in archive:
+            if member.isfile() or member.isdir():
+                yield _entry(member.name, member.size, None, member.isdir(),
+                             datetime.fromtimestamp(member.mtime) if member.mtime else None)
+
+
+def _gz_entries(fileobj, title):
+    """单个文件的 gzip：从头部读原文件名 (没有时取资源标题去掉 .gz)，从末尾读原始大小 (模 4GB)"""
+    fileobj.seek(0)
+    header = fileobj.read(10)
+    flags, mtime = header[3], struct.unpack('<I', header[4:8])[0]
+    original = None
+    if flags & 0x04:  # FEXTRA
+        (length,) = struct.unpack('<H', fileobj.read(2))
+        fileobj.read(length)
+    if flags & 0x08:  # FNAME
+        raw = b''
+        while (byte := fileobj.read(1)) not in (b'', b'\x00'):
+            raw += byte
+        original = raw.decode('latin-1')
+    fileobj.seek(-4, 2)
+    (size,) = struct.unpack('<I', fileobj.read(4))
+    compressed = fileobj.tell()
+    if not original:
+        original = title.rsplit('/', 1)[-1].removesuffix('.gz') or 'data'
+    yield _entry(original, size, compressed, False, datetime.fromtimestamp(mtime) if mtime else None)
+
+
+def _7z_entries(fileobj):
+    if py7zr is None:
+        raise UnsupportedArchive('7z 需要安装 py7zr')
+    with py7zr.SevenZipFile(fileobj) as archive:
+        for info in archive.list():
+            yield _entry(info.filename, info.uncompressed, info.compressed, info.is_directory, info.creationtime)
+
+
+def list_entries(resource):
+    """
+    列出压缩包内容，返回 {format, entries, truncated}；结果按存储文件名缓存。
+    超过 ARCHIVE_LIST_LIMIT 项时只返回前面的部分，并停止读取 (truncated=True)。
+    """
+    cache_key = f'archive_list:{archive_key(resource)}'
+    data = cache.get(cache_key)
+    if data is not None:
+        return data
+
+    limit = list_limit()
+    with resource.file.open('rb') as f:
+        fmt = detect_format(f, resource.file.name)
+        if fmt == 'zip':
+            entries = _zip_entries(f)
+        elif fmt == 'tar':
+            entries = _tar_entries(f)
+        elif fmt == 'gz':
+            entries = _gz_entries(f, resource.title)
+        elif fmt == '7z':
+            entries = _7z_entries(f)
+        else:
+            raise UnsupportedArchive('无法识别的压缩格式')
+        listed, truncated = [], False
+        try:
+            for entry in entries:
+                if len(listed) >= limit:
+                    truncated = True
+                    break
+                listed.append(entry)
+        except CORRUPT_ERRORS as e:
+            raise UnsupportedArchive(f'压缩包已损坏：{e}')
+        except (RuntimeError, NotImplementedError) as e:
+            raise UnsupportedArchive(f'不支持的压缩包：{e}')
+        finally:
+            entries.close()
+
+    data = {'format': fmt, 'entries': listed, 'truncated': truncated}
+    cache.set(cache_key, data, CACHE_TIMEOUT)
+    return data
+
+
+def _close(*opened):
+    for f in opened:
+        if f is not None:
+            f.close()
+
+
+def stream_entry(resource, name):
+    """
+    打开压缩包中的一个文件，返回 (字节块生成器, 原始大小)；不存在时抛出 KeyError。
+    加密、不支持的压缩方式和损坏的数据抛出 UnsupportedArchive：打开成员并预先读取第一块，
+    这些错误在开始输出之前就能发现。生成器在输出完毕 (或被关闭) 时关闭压缩包。
+    """
+    archive = member = None
+    source = resource.file.open('rb')
+    try:
+        fmt = detect_format(source, resource.file.name)
+        if fmt == 'zip':
+            archive = zipfile.ZipFile(source)
+            info = archive.getinfo(name)
+            if info.is_dir():
+                raise KeyError(name)
+            member, size = archive.open(info), info.file_size
+        elif fmt == 'tar':
+            archive = tarfile.open(fileobj=source, mode='r:*')
+            info = archive.getmember(name)
+            if not info.isfile():
+                raise KeyError(name)
+            member, size = archive.extractfile(info), info.size
+        elif fmt == 'gz':
+            if next(_gz_entries(source, resource.title))['name'] != name:
+                raise KeyError(name)
+            source.seek(0)
+            member, size = gzip.GzipFile(fileobj=source), None
+        else:
+            raise UnsupportedArchive('该格式不支持单独提取文件' if fmt else '无法识别的压缩格式')
+        first = member.read(CHUNK_SIZE)
+    except CORRUPT_ERRORS as e:
+        _close(member, archive, source)
+        raise UnsupportedArchive(f'压缩包已损坏：{e}')
+    except (RuntimeError, NotImplementedError) as e:
+        # zipfile：加密的文件 (需要密码) 抛出 RuntimeError，不支持的压缩方式抛出 NotImplementedError
+        _close(member, archive, source)
+        raise UnsupportedArchive(f'不支持提取该文件：{e}')
+    except Exception:
+        _close(member, archive, source)
+        raise
+
+    def chunks():
+        try:
+            if first:
+                yield first
+                for chunk in iter(lambda: member.read(CHUNK_SIZE), b''):
+                    yield chunk
+        finally:
+            _close(member, archive, source)
+
+    return chunks(), size
@@ -0,0 +1,31 @@
+"""
+缓存工具 - 按用户维护的版本号，用于让派生缓存 (启动数据、目录树等) 整体失效
+"""
+from django.core.cache import cache
+
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _version_key(namespace, user_id):
+    return f'ver:{namespace}:{user_id}'
+
+
+def get_user_version(user_id, namespace='desktop'):
+    """读取用户在某个命名空间下的版本号，不存在时初始化为 1"""
+    key = _version_key(namespace, user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, VERSION_TIMEOUT)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_user_version(user_id, namespace='desktop'):
+    """版本号 +1，旧版本对应的缓存项自然失效"""
+    key = _version_key(namespace, user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # key 不存在 (过期或从未写入)
+        cache.set(key, 2, VERSION_TIMEOUT)
+        return 2
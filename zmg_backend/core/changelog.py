@@ -0,0 +1,119 @@
+"""
+桌面变更日志 - 记录图标的新增/修改/删除，供客户端增量同步
+"""
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+
+from . import facets
+from .cache_utils import bump_user_version
+from .events import publish
+from .models import DesktopChange, DesktopIcon
+
+# 单次增量超过该条数时，让客户端直接全量重新加载更划算
+MAX_CHANGES_PER_SYNC = 1000
+
+
+def log_changes(action, icons):
+    """
+    批量写入变更记录。icons 为 DesktopIcon 对象或 (icon_id, user_id) 元组。
+    """
+    icons = list(icons)
+    rows = []
+    for icon in icons:
+        if isinstance(icon, DesktopIcon):
+            icon_id, user_id = icon.pk, icon.user_id
+        else:
+            icon_id, user_id = icon
+        rows.append(DesktopChange(user_id=user_id, icon_id=icon_id, action=action))
+    if not rows:
+        return
+    DesktopChange.objects.bulk_create(rows)
+
+    # 目录树缓存按版本号失效
+    for user_id in {row.user_id for row in rows}:
+        bump_user_version(user_id, 'tree')
+
+    # 维护库统计缓存
+    if action == 'insert':
+        facets.on_icons_created([icon for icon in icons if isinstance(icon, DesktopIcon)])
+    elif action == 'delete':
+        facets.invalidate(row.user_id for row in rows)
+
+    # 推送给该用户在线的各个会话 (其他标签页 / 设备)
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row.user_id, []).append(row)
+    for user_id, user_rows in by_user.items():
+        publish(user_id, {
+            'type': 'desktop',
+            'version': max((r.id or 0) for r in user_rows),
+            'changes': [{'id': r.icon_id, 'action': r.action} for r in user_rows],
+        })
+
+
+def current_version(user):
+    last = DesktopChange.objects.filter(user=user).order_by('-id').values_list('id', flat=True).first()
+    return last or 0
+
+
+def changes_since(user, since):
+    """
+    返回 (version, reset, changes)。
+    changes 为 [(version, icon_id, action)]，同一图标只保留最新一条。
+    reset=True 表示客户端落后太多 (早于压缩点或变更过多)，需要全量重新同步。
+    """
+    version = current_version(user)
+    # reset 标记的 icon_id 为已清理的最后一条墓碑的版本号 (旧版本写入的标记为 0，按标记自身的版本号处理)
+    marker = DesktopChange.objects.filter(user=user, action='reset').order_by('-id') \
+        .values_list('id', 'icon_id').first()
+    if marker and since < (marker[1] or marker[0]):
+        return version, True, []
+
+    rows = list(
+        DesktopChange.objects.filter(user=user, id__gt=since).exclude(action='reset')
+        .order_by('id').values_list('id', 'icon_id', 'action')[:MAX_CHANGES_PER_SYNC + 1]
+    )
+    if len(rows) > MAX_CHANGES_PER_SYNC:
+        return version, True, []
+
+    latest = {}
+    for row in rows:
+        latest[row[1]] = row
+    return version, False, sorted(latest.values())
+
+
+def compact(cutoff):
+    """
+    压缩变更日志：
+    1. 删除被同一图标更新记录覆盖的旧记录 (无损，增量接口总是返回最新状态)
+    2. 删除早于 cutoff 的删除记录 (墓碑)，并为受影响的用户写入 reset 标记，
+       标记中记录被清理的最后一条墓碑的版本号，只有落后于该版本的客户端需要全量同步
+    返回 (合并条数, 清理墓碑条数)
+    """
+    with transaction.atomic():
+        newer = DesktopChange.objects.filter(
+            user_id=OuterRef('user_id'), icon_id=OuterRef('icon_id'), id__gt=OuterRef('id'),
+        ).exclude(action='reset')
+        superseded, _ = DesktopChange.objects.exclude(action='reset').filter(Exists(newer)).delete()
+
+        tombstones = DesktopChange.objects.filter(action='delete', created_at__lt=cutoff)
+        last_purged = dict(
+            tombstones.order_by().values('user_id').annotate(last=Max('id')).values_list('user_id', 'last')
+        )
+        purged = 0
+        if last_purged:
+            previous = dict(
+                DesktopChange.objects.filter(action='reset', user_id__in=last_purged)
+                .order_by('id').values_list('user_id', 'icon_id')
+            )
+            purged, _ = tombstones.delete()
+            DesktopChange.objects.bulk_create([
+                DesktopChange(user_id=uid, icon_id=max(last, previous.get(uid, 0)), action='reset')
+                for uid, last in last_purged.items()
+            ])
+            # 每个用户只需保留最新的 reset 标记
+            newer_marker = DesktopChange.objects.filter(
+                user_id=OuterRef('user_id'), action='reset', id__gt=OuterRef('id'),
+            )
+            DesktopChange.objects.filter(action='reset').filter(Exists(newer_marker)).delete()
+    return superseded, purged
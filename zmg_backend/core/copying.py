@@ -0,0 +1,134 @@
+"""
+复制 / 创建副本 - 只复制数据库记录，不复制文件内容 (写时复制)
+
+新的 Resource 与源资源指向同一个存储文件 (file / cover / link 相同)。
+系统中的文件一经写入不会被原地修改 (重新上传、在线编辑都会保存为新文件名)，
+因此共享文件是安全的；物理删除时 trash._remove_files 会先确认没有其他资源仍引用该文件。
+
+整棵子树按层读取 (每层一次查询)，再用 bulk_create 逐层写入，全部在一个事务内完成。
+用户配额按逻辑大小计算：副本与原文件一样计入已用空间。
+"""
+from django.db import transaction
+
+from .changelog import log_changes
+from .models import Category, DesktopIcon, Resource
+from .placement import Placement
+from .quota import release_resources
+
+
+class SubtreeCopy:
+    """
+    一组图标 (连同文件夹内的全部内容) 的复制计划。
+    构造时读取源数据并计算总大小 (供调用方先检查配额)，run() 执行写入。
+    """
+
+    def __init__(self, user, icons):
+        self.user = user
+        icons = list(icons)
+        # 已选中的图标若位于另一个选中文件夹的子树中，随该文件夹复制即可
+        self.levels = [icons]
+        visited = set()
+        frontier = self._folder_ids(icons, visited)
+        inner = []
+        while frontier:
+            children = list(DesktopIcon.objects.filter(user=user, parent_folder_id__in=frontier))
+            inner.extend(children)
+            self.levels.append(children)
+            frontier = self._folder_ids(children, visited)
+        inner_ids = {icon.id for icon in inner}
+        self.levels[0] = [icon for icon in icons if icon.id not in inner_ids]
+
+        self.categories = Category.objects.in_bulk(visited)
+        resource_ids = [
+            icon.object_id for level in self.levels for icon in level
+            if icon.target_type == 'resource' and not icon.is_shortcut
+        ]
+        self.resources = {row['id']: row for row in Resource.objects.filter(id__in=resource_ids).values()}
+        self.size = sum(row['file_size'] or 0 for row in self.resources.values())
+
+    @staticmethod
+    def _folder_ids(icons, visited):
+        """需要向下展开的文件夹 (快捷方式只复制图标本身)"""
+        ids = []
+        for icon in icons:
+            if icon.target_type == 'category' and not icon.is_shortcut and icon.object_id not in visited:
+                visited.add(icon.object_id)
+                ids.append(icon.object_id)
+        return ids
+
+    @transaction.atomic
+    def run(self, parent_id, suffix=''):
+        """
+        把子树复制到 parent_id (None 为桌面)，返回新建的顶层图标 (顺序与源图标一致)。
+        suffix 追加在顶层项目的名称之后 (例如 " - 副本")。
+        """
+        new_folders = {}    # 源文件夹 id -> 新文件夹 id
+        new_resources = {}  # 源资源 id -> 新资源
+        clones = []         # (源图标, 新父文件夹 id, 层级)
+
+        def new_parent(icon, depth):
+            return parent_id if depth == 0 else new_folders.get(icon.parent_folder_id)
+
+        for depth, level in enumerate(self.levels):
+            # 1. 本层的文件夹 (下一层图标的 parent_folder 依赖这里生成的 id)
+            sources, folders = [], []
+            for icon in level:
+                category = self.categories.get(icon.object_id) if icon.target_type == 'category' else None
+                if category is None or icon.is_shortcut or icon.object_id in new_folders:
+                    continue
+                name = category.name + suffix if depth == 0 else category.name
+                sources.append(category.id)
+                folders.append(Category(name=name[:50], icon=category.icon, parent_id=new_parent(icon, depth)))
+            Category.objects.bulk_create(folders)
+            new_folders.update(zip(sources, (folder.id for folder in folders)))
+
+        for depth, level in enumerate(self.levels):
+            for icon in level:
+                parent = new_parent(icon, depth)
+                if depth and parent is None:
+                    continue  # 所在文件夹的记录已不存在
+                # 2. 资源：复制整行，文件名保持不变 (共享同一份文件)
+                row = self.resources.get(icon.object_id) if icon.target_type == 'resource' else None
+                if row is not None and not icon.is_shortcut and icon.object_id not in new_resources:
+                    values = {k: v for k, v in row.items() if k not in ('id', 'created_at')}
+                    values.update(author_id=self.user.id, category_id=parent, deleted_at=None)
+                    if depth == 0:
+                        values['title'] = (values['title'] + suffix)[:100]
+                    new_resources[icon.object_id] = Resource(**values)
+                clones.append((icon, parent, depth))
+
+        resources = list(new_resources.values())
+        Resource.objects.bulk_create(resources)
+        # 新文件夹的统计从 0 开始，与目标文件夹一起按副本加上
+        release_resources(
+            [{'author_id': r.author_id, 'category_id': r.category_id, 'file_size': r.file_size} for r in resources],
+            sign=-1,
+        )
+
+        # 3. 图标
+        placement = Placement(self.user.id, parent_id)
+        icons, roots = [], []
+        for icon, parent, depth in clones:
+            object_id = icon.object_id
+            if not icon.is_shortcut:
+                if icon.target_type == 'category':
+                    object_id = new_folders.get(object_id, object_id)
+                elif icon.object_id in new_resources:
+                    object_id = new_resources[icon.object_id].id
+            # 子树内保持原有排列；顶层副本放到目标位置的空闲格子
+            x, y = placement.next() if depth == 0 else (icon.x, icon.y)
+            clone = DesktopIcon(
+                user=self.user, title=(icon.title + suffix)[:100] if depth == 0 else icon.title,
+                x=x, y=y,
+                content_type_id=icon.content_type_id, object_id=object_id,
+                parent_folder_id=parent, is_shortcut=icon.is_shortcut,
+                target_type=icon.target_type, target_kind=icon.target_kind,
+            )
+            if depth == 0:
+                # 源图标来自 select_related('content_type')，序列化时不再查询
+                clone.content_type = icon.content_type
+                roots.append(clone)
+            icons.append(clone)
+        DesktopIcon.objects.bulk_create(icons)
+        log_changes('insert', icons)
+        return roots
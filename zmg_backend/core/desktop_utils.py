@@ -0,0 +1,156 @@
+"""
+桌面数据批量加载工具 - 用固定次数的查询替代序列化器中的逐个查询 (N+1)
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, F, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
+
+from .models import Category, DesktopIcon
+
+PREVIEW_SIZE = 4
+LIBRARY_KINDS = ['image', 'doc', 'video', 'audio']
+
+
+def prefetch_icons(icons):
+    """
+    为一批图标预先加载关联对象和文件夹预览 (九宫格)。
+    调用后 DesktopIconSerializer 不再产生额外查询。
+    icons 需来自 select_related('content_type') 的查询集。
+    """
+    icons = list(icons)
+    if not icons:
+        return icons
+
+    # 1. 关联对象：每种 ContentType 一次查询
+    prefetch_related_objects(icons, 'content_object')
+
+    # 2. 文件夹预览：一次窗口查询取出每个文件夹的前 4 个子图标
+    category_ct = ContentType.objects.get_for_model(Category)
+    folder_ids = [i.object_id for i in icons if i.content_type_id == category_ct.id and i.object_id]
+    children_by_folder = {}
+    if folder_ids:
+        children = list(
+            DesktopIcon.objects.filter(parent_folder_id__in=folder_ids)
+            .select_related('content_type')
+            .annotate(row=Window(
+                RowNumber(),
+                partition_by=[F('parent_folder_id')],
+                order_by=[F('created_at').asc(), F('id').asc()],
+            ))
+            .filter(row__lte=PREVIEW_SIZE)
+            .order_by('parent_folder_id', 'created_at', 'id')
+        )
+        prefetch_related_objects(children, 'content_object')
+        for child in children:
+            children_by_folder.setdefault(child.parent_folder_id, []).append(child)
+
+    for icon in icons:
+        if icon.content_type_id == category_ct.id:
+            icon._preview = [
+                preview_item(child) for child in children_by_folder.get(icon.object_id, [])
+            ]
+    return icons
+
+
+def preview_item(child):
+    """单个预览格的数据：类型 + 封面"""
+    item = {'type': 'unknown', 'cover': None}
+    if child.content_type:
+        item['type'] = child.content_type.model
+        # 如果是资源且有封面，返回封面
+        if child.content_type.model == 'resource':
+            res = child.content_object
+            if res and res.cover:
+                item['cover'] = res.cover.url
+    return item
+
+
+def folder_tree(user):
+    """
+    用户的文件夹树：一次查询取出所有文件夹，一次聚合统计每个文件夹内的子文件夹 / 文件数量，
+    在内存中组装成嵌套结构。用户的文件夹 = 该用户指向 Category 的桌面图标。
+    """
+    category_ct = ContentType.objects.get_for_model(Category)
+    rows = list(
+        DesktopIcon.objects.filter(user=user, content_type=category_ct)
+        .order_by('created_at', 'id')
+        .values('id', 'title', 'object_id', 'parent_folder_id')
+    )
+    counts = (
+        DesktopIcon.objects.filter(user=user, parent_folder__isnull=False)
+        .values('parent_folder_id', 'target_type')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    folder_counts, file_counts = {}, {}
+    for row in counts:
+        target = folder_counts if row['target_type'] == 'category' else file_counts
+        target[row['parent_folder_id']] = target.get(row['parent_folder_id'], 0) + row['n']
+
+    nodes = {}
+    for row in rows:
+        nodes.setdefault(row['object_id'], {
+            'id': row['object_id'],
+            'icon_id': row['id'],
+            'name': row['title'],
+            'parent_id': row['parent_folder_id'],
+            'folder_count': folder_counts.get(row['object_id'], 0),
+            'file_count': file_counts.get(row['object_id'], 0),
+            'children': [],
+        })
+
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node['parent_id'])
+        if parent is not None and parent is not node:
+            parent['children'].append(node)
+        else:
+            roots.append(node)
+    return roots
+
+
+def find_subtree(tree, folder_id):
+    """在嵌套的文件夹树中查找某个文件夹节点"""
+    stack = list(tree)
+    while stack:
+        node = stack.pop()
+        if node['id'] == folder_id:
+            return node
+        stack.extend(node['children'])
+    return None
+
+
+def prune_tree(nodes, depth):
+    """
+    复制树的前 depth 层 (depth=1 只保留这些节点本身)，更深的 children 置空；
+    folder_count / file_count 保持不变，客户端据此判断是否还有下级可展开。
+    """
+    if depth <= 1:
+        return [{**node, 'children': []} for node in nodes]
+    return [{**node, 'children': prune_tree(node['children'], depth - 1)} for node in nodes]
+
+
+def walk_folder(user, folder_id):
+    """
+    遍历用户的文件夹子树 (沿该用户图标的 parent_folder)，每层一次查询。
+    同名文件夹可能被多个用户共用同一个 Category，因此必须按用户过滤。
+    返回 [(相对目录, icon)]，相对目录由文件夹图标的名称拼成，例如 'A/B'。
+    """
+    category_ct = ContentType.objects.get_for_model(Category)
+    result = []
+    frontier = {folder_id: ''}
+    seen = {folder_id}
+    while frontier:
+        icons = (
+            DesktopIcon.objects.filter(user=user, parent_folder_id__in=list(frontier))
+            .select_related('content_type').order_by('created_at', 'id')
+        )
+        next_frontier = {}
+        for icon in icons:
+            path = frontier[icon.parent_folder_id]
+            result.append((path, icon))
+            if icon.content_type_id == category_ct.id and icon.object_id not in seen:
+                seen.add(icon.object_id)
+                next_frontier[icon.object_id] = f'{path}/{icon.title}' if path else icon.title
+        frontier = next_frontier
+    return result
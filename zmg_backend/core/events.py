@@ -0,0 +1,142 @@
+"""
+桌面变更推送 - 进程内事件分发 (broker) + 可插拔的跨进程后端
+
+视图 (同步代码) 调用 publish() 发布事件；SSE 连接 (见 core/sse.py) 在 asyncio
+事件循环中订阅。每个连接只是一个协程 + 一个有界队列，不占用线程。
+多进程部署时把 EVENTS_BACKEND 设为 RedisBackend，事件经 Redis 广播到所有进程。
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class LocalBackend:
+    """单进程后端：直接分发给本进程内的订阅者"""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, user_id, event):
+        self.broker.dispatch(user_id, event)
+
+    async def run(self):
+        pass
+
+
+class RedisBackend:
+    """多进程后端：通过 Redis PUB/SUB 广播，每个进程各自分发给本地订阅者"""
+    channel = 'zmg:desktop-events'
+
+    def __init__(self, broker):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBackend 需要安装 redis 包 (pip install redis)')
+        self.broker = broker
+        self.url = getattr(settings, 'EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+        self.client = redis.Redis.from_url(self.url)
+
+    def publish(self, user_id, event):
+        self.client.publish(self.channel, json.dumps({'user_id': user_id, 'event': event}))
+
+    async def run(self):
+        import redis.asyncio as aioredis
+        pubsub = aioredis.Redis.from_url(self.url).pubsub()
+        await pubsub.subscribe(self.channel)
+        async for message in pubsub.listen():
+            if message.get('type') != 'message':
+                continue
+            payload = json.loads(message['data'])
+            self.broker.dispatch(payload['user_id'], payload['event'])
+
+
+class Subscription:
+    """一个 SSE 连接的订阅：事件写入所属事件循环中的有界队列"""
+
+    def __init__(self, user_id, loop, maxsize):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def push(self, event):
+        # 可能从任意线程调用 (同步视图运行在线程池中)
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # 事件循环已关闭，连接随之失效
+            pass
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 客户端消费太慢：丢弃积压，通知它改为增量同步
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({'type': 'resync'})
+
+
+class Broker:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._backend = None
+        self._runner = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            path = getattr(settings, 'EVENTS_BACKEND', 'core.events.LocalBackend')
+            self._backend = import_string(path)(self)
+        return self._backend
+
+    def publish(self, user_id, event):
+        self.backend.publish(user_id, event)
+
+    def dispatch(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for sub in subscribers:
+            sub.push(event)
+
+    def subscribe(self, user_id):
+        """在事件循环中调用，返回 Subscription；首次订阅时启动跨进程后端的监听任务"""
+        loop = asyncio.get_running_loop()
+        self._ensure_runner(loop)
+        sub = Subscription(user_id, loop, getattr(settings, 'EVENTS_QUEUE_SIZE', 100))
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def _ensure_runner(self, loop):
+        runner = self._runner
+        if runner is not None and runner.get_loop() is loop:
+            # 仍在运行，或已正常结束 (LocalBackend 无需监听)
+            if not runner.done() or (not runner.cancelled() and runner.exception() is None):
+                return
+        self._runner = loop.create_task(self.backend.run())
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.user_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.user_id]
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+
+broker = Broker()
+
+
+def publish(user_id, event):
+    """发布事件给某个用户的所有连接；在事务提交后才真正发送"""
+    transaction.on_commit(lambda: broker.publish(user_id, event))
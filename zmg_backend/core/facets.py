@@ -0,0 +1,74 @@
+"""
+库统计 (facets) - 每种资源类型的数量、总字节数、最近添加时间
+
+一次 GROUP BY 计算后按用户缓存；新增图标时在缓存上增量调整，
+删除 (可能级联整棵文件夹子树) 时直接让缓存失效，下次读取重新聚合。
+"""
+from django.core.cache import cache
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+
+from .desktop_utils import LIBRARY_KINDS
+from .models import DesktopIcon, Resource
+
+FACETS_TIMEOUT = 60 * 60
+
+
+def _key(user_id):
+    return f'facets:{user_id}'
+
+
+def _empty():
+    return {'count': 0, 'bytes': 0, 'latest': None}
+
+
+def compute_facets(user_id):
+    size = Subquery(Resource.objects.filter(id=OuterRef('object_id')).values('file_size')[:1])
+    rows = (
+        DesktopIcon.objects.filter(user_id=user_id, target_type='resource')
+        .annotate(size=size)
+        .values('target_kind')
+        .annotate(count=Count('id'), bytes=Sum('size'), latest=Max('created_at'))
+        .order_by()
+    )
+    facets = {kind: _empty() for kind in LIBRARY_KINDS}
+    for row in rows:
+        facets[row['target_kind'] or 'other'] = {
+            'count': row['count'],
+            'bytes': row['bytes'] or 0,
+            'latest': row['latest'],
+        }
+    return facets
+
+
+def library_facets(user_id):
+    facets = cache.get(_key(user_id))
+    if facets is None:
+        facets = compute_facets(user_id)
+        cache.set(_key(user_id), facets, FACETS_TIMEOUT)
+    return facets
+
+
+def on_icons_created(icons):
+    """新增图标：在已缓存的统计上增量累加 (未缓存时无需处理)"""
+    for icon in icons:
+        if icon.target_type != 'resource':
+            continue
+        key = _key(icon.user_id)
+        facets = cache.get(key)
+        if facets is None:
+            continue
+        if not DesktopIcon.content_object.is_cached(icon):
+            # 拿不到文件大小时不猜测，交给下次重新聚合
+            cache.delete(key)
+            continue
+        res = icon.content_object
+        entry = facets.setdefault(icon.target_kind or 'other', _empty())
+        entry['count'] += 1
+        entry['bytes'] += (res.file_size or 0) if res else 0
+        if icon.created_at and (entry['latest'] is None or icon.created_at > entry['latest']):
+            entry['latest'] = icon.created_at
+        cache.set(key, facets, FACETS_TIMEOUT)
+
+
+def invalidate(user_ids):
+    cache.delete_many([_key(user_id) for user_id in set(user_ids)])
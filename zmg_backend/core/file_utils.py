@@ -0,0 +1,123 @@
+"""
+文件信息工具 - 大小 / 内容哈希 / 基于文件头 (magic bytes) 的 MIME 识别
+"""
+import hashlib
+import mimetypes
+
+# 识别 MIME 需要的文件头长度 (tar 的 'ustar' 标记位于 257 字节处)
+HEAD_SIZE = 512
+
+# (偏移, 特征字节, MIME)
+SIGNATURES = [
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'PK\x05\x06', 'application/zip'),
+    (0, b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'\x1a\x45\xdf\xa3', 'video/x-matroska'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),  # 旧版 doc/xls/ppt
+    (257, b'ustar', 'application/x-tar'),
+]
+
+# RIFF 容器：第 8 字节起区分具体格式
+RIFF_TYPES = {b'WEBP': 'image/webp', b'WAVE': 'audio/wav', b'AVI ': 'video/x-msvideo'}
+
+# 以 zip / OLE 为容器的格式，需结合扩展名细分
+CONTAINER_MIMES = {'application/zip', 'application/x-ole-storage'}
+
+
+def detect_mime(head, filename=''):
+    """根据文件头判断 MIME，无法判断时退回到扩展名，再退回到文本 / 二进制"""
+    guessed = mimetypes.guess_type(filename)[0] if filename else None
+
+    mime = None
+    if head[:4] == b'RIFF':
+        mime = RIFF_TYPES.get(head[8:12])
+    elif head[4:8] == b'ftyp':
+        # MP4 / MOV / M4A 等 ISO 媒体文件
+        brand = head[8:12]
+        if brand.startswith(b'M4A'):
+            mime = 'audio/mp4'
+        elif brand == b'qt  ':
+            mime = 'video/quicktime'
+        else:
+            mime = 'video/mp4'
+    elif head[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2'):
+        mime = 'audio/mpeg'
+    else:
+        for offset, magic, candidate in SIGNATURES:
+            if head[offset:offset + len(magic)] == magic:
+                mime = candidate
+                break
+
+    if mime in CONTAINER_MIMES:
+        # docx/xlsx/pptx 本质是 zip，doc/xls/ppt 本质是 OLE
+        return guessed or ('application/zip' if mime == 'application/zip' else 'application/octet-stream')
+    if mime:
+        return mime
+    if guessed:
+        return guessed
+    if head and b'\x00' not in head:
+        return 'text/plain'
+    return 'application/octet-stream'
+
+
+def kind_for_mime(mime):
+    """由 MIME 推断 Resource.kind，无法判断时返回 None (交给扩展名逻辑)"""
+    if not mime:
+        return None
+    major = mime.split('/')[0]
+    if major in ('image', 'video', 'audio'):
+        return major
+    if mime in ('application/zip', 'application/x-7z-compressed', 'application/vnd.rar',
+                'application/gzip', 'application/x-tar'):
+        return 'archive'
+    if mime in ('application/pdf', 'text/plain', 'text/markdown', 'text/html'):
+        return 'doc'
+    return None
+
+
+class ContentInfo:
+    """单次遍历数据块，同时累计大小、哈希与文件头"""
+
+    def __init__(self):
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        self.head = b''
+
+    def update(self, chunk):
+        self.size += len(chunk)
+        self.hasher.update(chunk)
+        if len(self.head) < HEAD_SIZE:
+            self.head += chunk[:HEAD_SIZE - len(self.head)]
+
+    def result(self, filename=''):
+        return {
+            'file_size': self.size,
+            'mime_type': detect_mime(self.head, filename),
+            'content_hash': self.hasher.hexdigest(),
+        }
+
+
+def file_info(fileobj, filename=''):
+    """流式读取一个已有文件对象，返回 {file_size, mime_type, content_hash}"""
+    info = ContentInfo()
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    if hasattr(fileobj, 'chunks'):
+        chunks = fileobj.chunks()
+    else:
+        chunks = iter(lambda: fileobj.read(64 * 1024), b'')
+    for chunk in chunks:
+        info.update(chunk)
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    return info.result(filename)
@@ -0,0 +1,113 @@
+"""
+健康探测 - 数据库往返延迟、媒体目录剩余空间、后台队列积压、缓存可达性
+
+探测结果在进程内缓存 HEALTH_CACHE_SECONDS 秒 (不走 Django 缓存，因为缓存本身也是探测对象)，
+频繁的健康检查 / 指标抓取不会反复打到数据库和磁盘。
+"""
+import shutil
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .events import broker
+from .recent import pending_count
+
+_lock = threading.Lock()
+_cached = {'at': 0.0, 'result': None}
+
+
+def probe_database():
+    start = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+    return {'ok': True, 'latency_ms': round((time.perf_counter() - start) * 1000, 2)}
+
+
+def probe_disk():
+    min_free = getattr(settings, 'HEALTH_MIN_FREE_BYTES', 1024 ** 3)
+    try:
+        usage = shutil.disk_usage(settings.MEDIA_ROOT)
+    except OSError as e:
+        return {'ok': False, 'error': str(e)}
+    return {
+        'ok': usage.free >= min_free,
+        'free_bytes': usage.free,
+        'total_bytes': usage.total,
+    }
+
+
+def probe_cache():
+    key = f'health:{uuid.uuid4().hex}'
+    start = time.perf_counter()
+    try:
+        cache.set(key, 1, 10)
+        ok = cache.get(key) == 1
+        cache.delete(key)
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+    return {'ok': ok, 'latency_ms': round((time.perf_counter() - start) * 1000, 2)}
+
+
+def probe_queues():
+    """后台队列：待刷写的最近访问缓冲、在线 SSE 连接数"""
+    try:
+        recent_pending = pending_count()
+    except Exception:
+        recent_pending = None
+    return {
+        'ok': True,
+        'recent_flush_pending': recent_pending,
+        'event_connections': broker.connection_count(),
+    }
+
+
+def run_probes():
+    checks = {
+        'database': probe_database(),
+        'disk': probe_disk(),
+        'cache': probe_cache(),
+        'queues': probe_queues(),
+    }
+    if not checks['database']['ok']:
+        status = 'unhealthy'
+    elif all(check['ok'] for check in checks.values()):
+        status = 'healthy'
+    else:
+        status = 'degraded'
+    return {'status': status, 'checked_at': time.time(), 'checks': checks}
+
+
+def health_status():
+    """返回最近一次探测结果，过期时重新探测 (同一时刻只有一个线程执行探测)"""
+    ttl = getattr(settings, 'HEALTH_CACHE_SECONDS', 5)
+    if time.monotonic() - _cached['at'] < ttl and _cached['result'] is not None:
+        return _cached['result']
+    with _lock:
+        if time.monotonic() - _cached['at'] >= ttl or _cached['result'] is None:
+            _cached['result'] = run_probes()
+            _cached['at'] = time.monotonic()
+        return _cached['result']
+
+
+def health_gauges(result):
+    """把探测结果转成 metrics.render 的额外指标"""
+    checks = result['checks']
+    return [
+        ('zmg_health_up', '整体健康 (1 健康 / 0.5 降级 / 0 不可用)',
+         {'healthy': 1, 'degraded': 0.5}.get(result['status'], 0)),
+        ('zmg_db_up', '数据库可用', int(checks['database']['ok'])),
+        ('zmg_db_latency_seconds', '数据库往返延迟',
+         checks['database'].get('latency_ms', 0) / 1000 if checks['database']['ok'] else None),
+        ('zmg_cache_up', '缓存可用', int(checks['cache']['ok'])),
+        ('zmg_media_disk_free_bytes', '媒体目录所在磁盘剩余空间', checks['disk'].get('free_bytes')),
+        ('zmg_recent_flush_pending', '待刷写的最近访问缓冲数', checks['queues'].get('recent_flush_pending')),
+        ('zmg_event_connections', '在线 SSE 连接数', checks['queues'].get('event_connections')),
+    ]
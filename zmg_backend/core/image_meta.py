@@ -0,0 +1,87 @@
+"""
+图片元数据 - 上传时一次性计算宽高、EXIF 方向、主色调与占位色块，图库接口直接返回，
+前端无需先下载原图即可完成排版，再按需懒加载缩略图。
+
+占位色块 (placeholder) 为 PLACEHOLDER_COLS x PLACEHOLDER_ROWS 个颜色，按行拼接的十六进制串
+(每个颜色 6 位，不带 #)，前端可放大后模糊显示。
+"""
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+PLACEHOLDER_COLS = 4
+PLACEHOLDER_ROWS = 3
+# 解码时的缩小目标：只需要颜色信息，JPEG 可借助 draft 模式直接按 1/8 解码
+SAMPLE_SIZE = 64
+EXIF_ORIENTATION = 0x0112
+
+# 计算结果对应的 Resource 字段
+IMAGE_FIELDS = ('image_width', 'image_height', 'image_orientation', 'dominant_color', 'placeholder')
+
+
+def _hex(rgb):
+    return '%02x%02x%02x' % tuple(rgb[:3])
+
+
+def image_metadata(fileobj):
+    """
+    读取图片，返回 {image_width, image_height, image_orientation, dominant_color, placeholder}；
+    无法识别为图片时返回 None。宽高为按 EXIF 方向旋转后的显示尺寸。
+    """
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    try:
+        with Image.open(fileobj) as img:
+            orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+            width, height = img.size
+            if orientation in (5, 6, 7, 8):  # 旋转 90° / 270°
+                width, height = height, width
+
+            img.draft('RGB', (SAMPLE_SIZE, SAMPLE_SIZE))
+            img.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+            sample = ImageOps.exif_transpose(img.convert('RGB'))
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        if hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+
+    dominant = sample.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+    grid = sample.resize((PLACEHOLDER_COLS, PLACEHOLDER_ROWS), Image.Resampling.BOX)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_orientation': orientation if orientation in range(1, 9) else 1,
+        'dominant_color': '#' + _hex(dominant),
+        'placeholder': ''.join(_hex(grid.getpixel((x, y)))
+                               for y in range(PLACEHOLDER_ROWS) for x in range(PLACEHOLDER_COLS)),
+    }
+
+
+def justify(items, container_width, row_height, gap=4):
+    """
+    等高行排版 (justified layout)：依次把图片放入一行，直到按 row_height 缩放后的总宽度
+    超出 container_width，再把这一行整体缩放到恰好填满。最后一行不拉伸。
+    items 需含 width / height，结果写入每项的 layout = {x, y, width, height}，返回总高度。
+    """
+    y = 0
+    row, row_width = [], 0.0
+    for item in items:
+        aspect = (item['width'] / item['height']) if item.get('width') and item.get('height') else 1.0
+        row.append((item, aspect))
+        row_width += aspect * row_height
+        if row_width + gap * (len(row) - 1) >= container_width:
+            available = container_width - gap * (len(row) - 1)
+            height = row_height * available / row_width
+            y = _place_row(row, y, height, gap) + gap
+            row, row_width = [], 0.0
+    if row:
+        y = _place_row(row, y, row_height, gap) + gap
+    return round(max(y - gap, 0))
+
+
+def _place_row(row, y, height, gap):
+    x = 0.0
+    for item, aspect in row:
+        width = aspect * height
+        item['layout'] = {'x': round(x), 'y': round(y), 'width': round(width), 'height': round(height)}
+        x += width + gap
+    return y + height
@@ -0,0 +1,177 @@
+"""
+请求级性能埋点 - 每个请求记录视图名、总耗时、SQL 次数与耗时、缓存命中/未命中，
+以结构化日志 (logger 'core.perf') 输出，并对慢请求 / 慢 SQL 抽样记录。
+Server-Timing 响应头会把数据库耗时暴露给客户端，由 PERF_SERVER_TIMING 控制：
+False (默认) 不输出，'staff' 只对管理员输出，True 对所有请求输出 (仅限开发环境)。
+
+开销：每条 SQL 多两次 perf_counter，只有超过阈值的 SQL 才保留语句文本；
+缓存统计只是两个计数器。可以在生产环境常开。
+"""
+import contextvars
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger('core.perf')
+
+# 单个请求最多保留的慢 SQL 条数
+MAX_SLOW_QUERIES = 10
+
+_current = contextvars.ContextVar('zmg_request_stats', default=None)
+_MISSING = object()
+
+
+class RequestStats:
+    __slots__ = ('db_count', 'db_time', 'cache_hits', 'cache_misses', 'slow_queries')
+
+    def __init__(self):
+        self.db_count = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.slow_queries = []
+
+
+def current_stats():
+    """当前请求的统计对象，不在请求中时返回 None"""
+    return _current.get()
+
+
+class QueryTimer:
+    """connection.execute_wrapper 回调：累计 SQL 次数与耗时，记录慢 SQL"""
+
+    def __init__(self, stats, slow_seconds):
+        self.stats = stats
+        self.slow_seconds = slow_seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = self.stats
+            stats.db_count += 1
+            stats.db_time += elapsed
+            if elapsed >= self.slow_seconds and len(stats.slow_queries) < MAX_SLOW_QUERIES:
+                stats.slow_queries.append({
+                    'alias': context['connection'].alias,
+                    'ms': round(elapsed * 1000, 2),
+                    'sql': sql,
+                })
+
+
+class CacheStatsMixin:
+    """
+    统计缓存命中 / 未命中，与任意缓存后端组合使用，例如：
+    class InstrumentedRedisCache(CacheStatsMixin, RedisCache): ...
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        stats = _current.get()
+        if value is _MISSING:
+            if stats is not None:
+                stats.cache_misses += 1
+            return default
+        if stats is not None:
+            stats.cache_hits += 1
+        return value
+
+    def get_many(self, keys, version=None):
+        result = super().get_many(keys, version)
+        stats = _current.get()
+        if stats is not None:
+            keys = list(keys)
+            stats.cache_hits += len(result)
+            stats.cache_misses += len(keys) - len(result)
+        return result
+
+
+class InstrumentedLocMemCache(CacheStatsMixin, LocMemCache):
+    pass
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return match.view_name or match._func_path
+
+
+class InstrumentationMiddleware:
+    """
+    放在 MIDDLEWARE 最前面，使统计覆盖其余中间件。
+    配置项：PERF_SERVER_TIMING、PERF_SLOW_REQUEST_MS、PERF_SLOW_QUERY_MS、PERF_SLOW_LOG_SAMPLE_RATE
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'PERF_SERVER_TIMING', False)
+        self.slow_request = getattr(settings, 'PERF_SLOW_REQUEST_MS', 500) / 1000
+        self.slow_query = getattr(settings, 'PERF_SLOW_QUERY_MS', 100) / 1000
+        self.sample_rate = getattr(settings, 'PERF_SLOW_LOG_SAMPLE_RATE', 1.0)
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                timer = QueryTimer(stats, self.slow_query)
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        metrics.observe_request(_view_name(request), request.method, response.status_code, total)
+        if self.show_server_timing(request):
+            response['Server-Timing'] = ', '.join([
+                f'db;desc="{stats.db_count} queries";dur={stats.db_time * 1000:.1f}',
+                f'cache;desc="{stats.cache_hits} hit {stats.cache_misses} miss"',
+                f'total;dur={total * 1000:.1f}',
+            ])
+        self.log(request, response, stats, total)
+        return response
+
+    def show_server_timing(self, request):
+        if self.server_timing == 'staff':
+            # DRF 认证后的用户会回写到 request.user
+            user = getattr(request, 'user', None)
+            return bool(user is not None and user.is_staff)
+        return bool(self.server_timing)
+
+    def log(self, request, response, stats, total):
+        slow = total >= self.slow_request or bool(stats.slow_queries)
+        level = logging.WARNING if slow else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        if slow and random.random() >= self.sample_rate:
+            return
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': _view_name(request),
+            'status': response.status_code,
+            'ms': round(total * 1000, 2),
+            'db_count': stats.db_count,
+            'db_ms': round(stats.db_time * 1000, 2),
+            'cache_hits': stats.cache_hits,
+            'cache_misses': stats.cache_misses,
+        }
+        if slow:
+            record['slow_queries'] = stats.slow_queries
+            logger.warning('slow_request %s', json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info('request %s', json.dumps(record, ensure_ascii=False))
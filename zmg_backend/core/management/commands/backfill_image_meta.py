@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core.image_meta import IMAGE_FIELDS, image_metadata
+from core.models import Resource
+
+
+def read_meta(resource):
+    """在工作线程中解码一张图片；文件丢失时返回 None，无法识别时返回 {}"""
+    try:
+        with resource.file.open('rb') as f:
+            return resource.id, image_metadata(f) or {}
+    except (OSError, ValueError):
+        return resource.id, None
+
+
+class Command(BaseCommand):
+    help = '为已有图片补齐宽高 / 方向 / 主色调 / 占位色块 (多线程并行解码)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='并行解码的线程数')
+        parser.add_argument('--batch', type=int, default=200, help='每批处理的资源数')
+
+    def handle(self, *args, **options):
+        pending = Resource.all_objects.filter(kind='image', image_width__isnull=True) \
+            .exclude(file='').exclude(file__isnull=True)
+        total = pending.count()
+        if total == 0:
+            self.stdout.write(self.style.SUCCESS("所有图片都已有元数据，无需补齐。"))
+            return
+
+        self.stdout.write(f"共有 {total} 张图片需要补齐元数据...")
+        started = time.time()
+        done = missing = invalid = 0
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                # 按主键分批，避免 offset 翻页越来越慢
+                batch = list(pending.filter(id__gt=last_id).order_by('id').only('id', 'file')[:options['batch']])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                updated = []
+                by_id = {res.id: res for res in batch}
+                for res_id, meta in pool.map(read_meta, batch):
+                    if meta is None:
+                        missing += 1
+                        continue
+                    res = by_id[res_id]
+                    if not meta:
+                        # 无法解码：宽高记为 0，下次不再重复处理
+                        invalid += 1
+                        meta = {'image_width': 0, 'image_height': 0}
+                    for field, value in meta.items():
+                        setattr(res, field, value)
+                    updated.append(res)
+                Resource.all_objects.bulk_update(updated, IMAGE_FIELDS)
+                done += len(updated)
+                self.stdout.write(f"已处理 {done + missing}/{total}")
+
+        elapsed = time.time() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"补齐完成！更新 {done} 张图片 (其中 {invalid} 张无法解码)，{missing} 个文件缺失，耗时 {elapsed:.1f} 秒。"
+        ))
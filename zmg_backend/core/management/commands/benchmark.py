@@ -0,0 +1,198 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.models import Category, DesktopIcon, User
+
+from .loadtest_login import percentile
+
+SCENARIOS = ['list', 'search', 'upload', 'move', 'uninstall']
+# SQL 次数取自 InstrumentationMiddleware 输出的 Server-Timing 头
+QUERIES_RE = re.compile(r'db;desc="(\d+) queries"')
+
+
+class Command(BaseCommand):
+    help = '接口基准测试：按设定并发驱动关键接口，输出 p50/p95/p99 与每请求 SQL 次数，并与基线对比'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='synth', help='使用 generate_data 生成的哪批用户')
+        parser.add_argument('--concurrency', type=int, default=4, help='并发线程数')
+        parser.add_argument('--requests', type=int, default=200, help='每个场景的请求总数')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f'逗号分隔，可选 {",".join(SCENARIOS)} (uninstall 删除 upload 场景上传的文件)')
+        parser.add_argument('--baseline', help='与该基线文件 (JSON) 对比')
+        parser.add_argument('--save-baseline', help='把本次结果保存为基线文件')
+        parser.add_argument('--threshold', type=float, default=0.2, help='p95 或 SQL 次数增长超过该比例视为退化')
+        parser.add_argument('--fail-on-regression', action='store_true', help='出现退化时以非零状态退出')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        scenarios = [s.strip() for s in options['scenarios'].split(',') if s.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"未知场景: {', '.join(sorted(unknown))}")
+
+        self.rng = random.Random(options['seed'])
+        self.sessions = self.prepare_sessions(options['prefix'], options['concurrency'])
+        self.uploaded = []
+        self.uploaded_lock = threading.Lock()
+
+        results = {}
+        # 基准用户不是管理员，强制输出 Server-Timing 以读取 SQL 次数 (仅在本进程的测试客户端中)
+        with override_settings(PERF_SERVER_TIMING=True):
+            for name in scenarios:
+                self.stdout.write(f"场景 {name}: {options['requests']} 个请求, 并发 {options['concurrency']}...")
+                results[name] = self.run_scenario(name, options['requests'], options['concurrency'])
+                self.report(name, results[name])
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"基线已保存到 {options['save_baseline']}"))
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = self.compare(results, baseline, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{regressions} 项指标退化超过 {options['threshold']:.0%}")
+
+    def prepare_sessions(self, prefix, count):
+        """每个线程一个用户会话：JWT 令牌 + 该用户的图标 / 文件夹 id (在计时开始前取好)"""
+        users = list(User.objects.filter(username__startswith=f'{prefix}_').order_by('id')[:count])
+        if not users:
+            raise CommandError(f"没有前缀为 {prefix}_ 的用户，请先运行 generate_data --prefix {prefix}")
+        category_ct = ContentType.objects.get_for_model(Category)
+        sessions = []
+        for user in users:
+            icons = DesktopIcon.objects.filter(user=user).values_list('id', 'content_type_id', 'object_id')
+            sessions.append({
+                'token': str(RefreshToken.for_user(user).access_token),
+                'icon_ids': [i for i, _, _ in icons],
+                'folder_ids': [o for _, ct, o in icons if ct == category_ct.id],
+            })
+        return sessions
+
+    def request(self, client, session, name, seq):
+        if name == 'list':
+            return client.get('/api/desktop/')
+        if name == 'search':
+            return client.get('/api/search/', {'q': f'doc_{seq % 50}'})
+        if name == 'upload':
+            upload = SimpleUploadedFile(f'bench_{seq}.txt', b'benchmark upload\n' * 64)
+            data = {'file': upload}
+            if session['folder_ids'] and seq % 2:
+                data['parent_id'] = self.rng.choice(session['folder_ids'])
+            resp = client.post('/api/desktop/upload_file/', data)
+            if resp.status_code == 200:
+                with self.uploaded_lock:
+                    self.uploaded.append((session['token'], resp.json()['id']))
+            return resp
+        if name == 'move':
+            icon_id = self.rng.choice(session['icon_ids'])
+            return client.patch(f'/api/desktop/{icon_id}/move/', {
+                'x': self.rng.randint(0, 800), 'y': self.rng.randint(0, 600),
+            }, content_type='application/json')
+        if name == 'uninstall':
+            with self.uploaded_lock:
+                if not self.uploaded:
+                    return None
+                token, icon_id = self.uploaded.pop()
+            # 只能删除自己上传的文件，换成上传者的令牌
+            return client.delete(f'/api/desktop/{icon_id}/uninstall/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def run_scenario(self, name, total, concurrency):
+        lock = threading.Lock()
+        counter = iter(range(total))
+        samples = {'latency': [], 'queries': [], 'errors': 0, 'skipped': 0}
+
+        def worker(session):
+            client = Client(HTTP_AUTHORIZATION=f"Bearer {session['token']}")
+            try:
+                while True:
+                    with lock:
+                        seq = next(counter, None)
+                    if seq is None:
+                        return
+                    start = time.perf_counter()
+                    resp = self.request(client, session, name, seq)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        if resp is None:
+                            samples['skipped'] += 1
+                            continue
+                        if resp.status_code >= 400:
+                            samples['errors'] += 1
+                            continue
+                        samples['latency'].append(elapsed)
+                        match = QUERIES_RE.search(resp.get('Server-Timing', ''))
+                        if match:
+                            samples['queries'].append(int(match.group(1)))
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=worker, args=(self.sessions[i % len(self.sessions)],))
+            for i in range(concurrency)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+
+        latency = sorted(samples['latency'])
+        queries = samples['queries']
+        return {
+            'requests': len(latency),
+            'errors': samples['errors'],
+            'skipped': samples['skipped'],
+            'rps': round(len(latency) / wall, 1) if wall else 0,
+            'p50_ms': round(percentile(latency, 50) * 1000, 2),
+            'p95_ms': round(percentile(latency, 95) * 1000, 2),
+            'p99_ms': round(percentile(latency, 99) * 1000, 2),
+            'queries_avg': round(sum(queries) / len(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+
+    def report(self, name, r):
+        queries = '-' if r['queries_avg'] is None else f"{r['queries_avg']} (max {r['queries_max']})"
+        line = (
+            f"[{name}] 成功 {r['requests']} 失败 {r['errors']} 跳过 {r['skipped']}, {r['rps']}/s, "
+            f"p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms, 每请求 SQL {queries}"
+        )
+        self.stdout.write(self.style.WARNING(line) if r['errors'] else line)
+
+    def compare(self, results, baseline, threshold):
+        """对比 p95 与平均 SQL 次数，返回退化项数量"""
+        regressions = 0
+        self.stdout.write("与基线对比:")
+        for name, current in results.items():
+            base = baseline.get(name)
+            if not base:
+                self.stdout.write(f"  [{name}] 基线中没有该场景")
+                continue
+            for metric in ('p95_ms', 'queries_avg'):
+                old, new = base.get(metric), current.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                text = f"  [{name}] {metric}: {old} -> {new} ({change:+.0%})"
+                if change > threshold:
+                    regressions += 1
+                    self.stdout.write(self.style.ERROR(text + ' 退化'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(text))
+        return regressions
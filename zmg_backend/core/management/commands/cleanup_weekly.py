@@ -1,11 +1,11 @@
-import os
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from core.models import Resource, DesktopIcon
+from core.trash import trash_icons
 
 class Command(BaseCommand):
-    help = '每周清理规则：删除7天前的资源文件及其图标'
+    help = '每周清理规则：把7天前的资源文件及其图标移入回收站 (物理删除由 purge_trash 完成)'
 
     def add_arguments(self, parser):
         # 允许通过命令行参数指定天数，默认7天
@@ -29,39 +29,17 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS("没有发现过期文件，无需清理。"))
             return
 
-        # 获取 Resource 对应的 ContentType ID，用于查找关联的桌面图标
+        # 2. 关联的桌面图标连同资源一起移入回收站 (GenericForeignKey 不会级联，需按 object_id 查找)
         resource_ctype = ContentType.objects.get_for_model(Resource)
-
-        success_count = 0
-        for res in expired_resources:
-            try:
-                title = res.title
-                
-                # 2. 删除物理文件
-                if res.file and os.path.isfile(res.file.path):
-                    os.remove(res.file.path)
-                    # 同时尝试清理空文件夹（可选）
-                    try:
-                        folder = os.path.dirname(res.file.path)
-                        if not os.listdir(folder): # 如果文件夹空了
-                            os.rmdir(folder)
-                    except OSError:
-                        pass
-                
-                # 3. 删除关联的桌面图标 (DesktopIcon)
-                # 因为是 GenericForeignKey，Django 默认不会级联删除，需手动处理
-                DesktopIcon.objects.filter(
-                    content_type=resource_ctype,
-                    object_id=res.id
-                ).delete()
-
-                # 4. 删除数据库记录
-                res.delete()
-                
-                success_count += 1
-                self.stdout.write(f"已删除: {title}")
-
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"删除失败 {res.id}: {str(e)}"))
-
-        self.stdout.write(self.style.SUCCESS(f"清理完成！共清理了 {success_count} 个过期资源。"))
\ No newline at end of file
+        icons = DesktopIcon.objects.filter(
+            content_type=resource_ctype,
+            object_id__in=expired_resources.values('id')
+        )
+        trashed = trash_icons(icons)
+
+        # 3. 没有图标的资源直接标记删除，超过回收站保留期后由 purge_trash 清除
+        orphans = expired_resources.update(deleted_at=timezone.now())
+
+        self.stdout.write(self.style.SUCCESS(
+            f"清理完成！{trashed} 个图标移入回收站，另有 {orphans} 个无图标资源标记删除。"
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.changelog import compact
+
+
+class Command(BaseCommand):
+    help = '压缩桌面变更日志：合并同一图标的旧记录，清理过期的删除记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='删除记录保留多少天')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timezone.timedelta(days=options['days'])
+        superseded, purged = compact(cutoff)
+        self.stdout.write(self.style.SUCCESS(
+            f"压缩完成！合并了 {superseded} 条旧记录，清理了 {purged} 条过期删除记录。"
+        ))
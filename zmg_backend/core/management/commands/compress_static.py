@@ -0,0 +1,57 @@
+import gzip
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.static_delivery import brotli
+
+COMPRESSIBLE = {'.js', '.mjs', '.css', '.html', '.svg', '.json', '.map', '.txt', '.xml', '.wasm', '.ico'}
+MIN_SIZE = 1024
+
+
+class Command(BaseCommand):
+    help = '为 STATIC_ROOT 中的文本类静态文件预先生成 .gz / .br 压缩版本 (在 collectstatic 之后执行)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='忽略已有的压缩文件，全部重新生成')
+
+    def handle(self, *args, **options):
+        root = settings.STATIC_ROOT
+        if not root or not os.path.isdir(root):
+            raise CommandError(f'STATIC_ROOT 不存在：{root}，请先执行 collectstatic')
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('未安装 brotli，只生成 gzip 版本 (pip install brotli)'))
+
+        written = skipped = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.splitext(filename)[1].lower() not in COMPRESSIBLE:
+                    continue
+                if os.path.getsize(path) < MIN_SIZE:
+                    continue
+                raw = None
+                for suffix, compress in self.compressors():
+                    target = path + suffix
+                    if not options['force'] and os.path.exists(target) \
+                            and os.path.getmtime(target) >= os.path.getmtime(path):
+                        skipped += 1
+                        continue
+                    if raw is None:
+                        with open(path, 'rb') as f:
+                            raw = f.read()
+                    data = compress(raw)
+                    # 压缩后没有变小就不保留，直接返回原文件
+                    if len(data) >= len(raw):
+                        continue
+                    with open(target, 'wb') as f:
+                        f.write(data)
+                    written += 1
+
+        self.stdout.write(self.style.SUCCESS(f'已生成 {written} 个压缩文件，{skipped} 个已是最新'))
+
+    def compressors(self):
+        yield '.gz', lambda raw: gzip.compress(raw, 9, mtime=0)
+        if brotli is not None:
+            yield '.br', lambda raw: brotli.compress(raw, quality=11)
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from core.portability import export_filename, stream_export
+
+
+class Command(BaseCommand):
+    help = '导出一个用户的桌面 (文件夹、资源、图标、评论) 为 NDJSON 清单，或连同文件打包为 tar'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--files', action='store_true', help='连同文件打包为 tar')
+        parser.add_argument('-o', '--output', help='输出路径，"-" 为标准输出 (默认按用户名和时间生成)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"用户不存在：{options['username']}")
+
+        output = options['output'] or export_filename(user, options['files'])
+        written = 0
+        out = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for chunk in stream_export(user, options['files']):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        if output != '-':
+            self.stdout.write(self.style.SUCCESS(f'已导出到 {output} ({written / 1e6:.1f} MB)'))
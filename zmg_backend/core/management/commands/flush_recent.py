@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.recent import flush, flush_in_process, pending_count
+
+
+class Command(BaseCommand):
+    help = '把缓存中的最近访问记录批量写入数据库 (请定期运行，例如每 30 秒一次)'
+
+    def handle(self, *args, **options):
+        if flush_in_process():
+            # 进程内缓存中的队列只有 Web 进程自己能看到，本命令读到的总是空队列
+            self.stdout.write(self.style.WARNING(
+                "当前缓存为进程内缓存 (或 RECENT_FLUSH_IN_PROCESS=True)，最近访问由 Web 进程自行刷写；"
+                "多进程部署请配置共享缓存 (如 Redis) 后再定期运行本命令。"
+            ))
+            return
+        count = 0
+        while True:
+            count += flush()
+            if not pending_count():
+                break
+        self.stdout.write(self.style.SUCCESS(f"已刷写 {count} 个用户的最近访问记录。"))
@@ -0,0 +1,175 @@
+import hashlib
+import io
+import os
+import random
+import shutil
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Category, DesktopIcon, Resource, User
+from core.placement import grid_position
+
+# kind -> (扩展名, MIME, 图标类名)
+KIND_FILES = {
+    'image': ('png', 'image/png', 'fa-solid fa-file-image'),
+    'doc': ('pdf', 'application/pdf', 'fa-solid fa-file-pdf'),
+    'video': ('mp4', 'video/mp4', 'fa-solid fa-file-video'),
+    'audio': ('mp3', 'audio/mpeg', 'fa-solid fa-file-audio'),
+    'archive': ('zip', 'application/zip', 'fa-solid fa-file-zipper'),
+    'other': ('bin', 'application/octet-stream', 'fa-solid fa-file'),
+}
+KIND_WEIGHTS = {'image': 30, 'doc': 30, 'video': 10, 'audio': 10, 'archive': 5, 'other': 15}
+
+
+class Command(BaseCommand):
+    help = '批量生成压测数据：用户、多层文件夹、资源与桌面图标 (全部使用 bulk_create)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='用户数量')
+        parser.add_argument('--depth', type=int, default=3, help='每个用户文件夹树的深度')
+        parser.add_argument('--branching', type=int, default=3, help='每个文件夹的子文件夹数量')
+        parser.add_argument('--files-per-user', type=int, default=100, help='每个用户的资源数量')
+        parser.add_argument('--file-bytes', type=int, default=0,
+                            help='占位文件大小；为 0 时不写磁盘文件，只生成数据库记录')
+        parser.add_argument('--prefix', default='synth', help='生成的用户名前缀')
+        parser.add_argument('--password', default='synth-Pass-123', help='所有生成用户的密码')
+        parser.add_argument('--chunk', type=int, default=100, help='每个事务处理的用户数')
+        parser.add_argument('--batch-size', type=int, default=1000, help='bulk_create 每批行数')
+        parser.add_argument('--seed', type=int, default=42, help='随机种子 (相同参数生成相同数据)')
+        parser.add_argument('--clear', action='store_true', help='先删除该前缀之前生成的数据')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['clear']:
+            self.clear(prefix, options['chunk'])
+
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.category_ct = ContentType.objects.get_for_model(Category)
+        self.resource_ct = ContentType.objects.get_for_model(Resource)
+        self.password = make_password(options['password'])  # 只哈希一次，所有用户共用
+        self.kinds = list(KIND_WEIGHTS)
+        self.weights = list(KIND_WEIGHTS.values())
+
+        start = User.objects.filter(username__startswith=f'{prefix}_').count()
+        total = options['users']
+        totals = {'users': 0, 'folders': 0, 'resources': 0, 'icons': 0}
+        for offset in range(0, total, options['chunk']):
+            count = min(options['chunk'], total - offset)
+            with transaction.atomic():
+                created = self.generate_chunk(prefix, start + offset, count)
+            for key, value in created.items():
+                totals[key] += value
+            self.stdout.write(f"  已生成 {offset + count}/{total} 个用户")
+
+        # 用量计数按实际数据重新统计一遍
+        call_command('reconcile_storage', stdout=io.StringIO())
+        self.stdout.write(self.style.SUCCESS(
+            f"生成完成：用户 {totals['users']}，文件夹 {totals['folders']}，"
+            f"资源 {totals['resources']}，桌面图标 {totals['icons']}"
+        ))
+
+    def generate_chunk(self, prefix, first, count):
+        batch = self.options['batch_size']
+        users = User.objects.bulk_create([
+            User(username=f'{prefix}_{first + i}', password=self.password, email=f'{prefix}_{first + i}@example.com')
+            for i in range(count)
+        ], batch_size=batch)
+
+        # 1. 文件夹：逐层批量创建，每层一次 bulk_create
+        folders = {user.id: [] for user in users}
+        icons = []
+        level = [(user, None) for user in users]
+        for depth in range(self.options['depth']):
+            pending = []
+            for user, parent in level:
+                for b in range(self.options['branching']):
+                    pending.append((user, parent, b, Category(name=f'文件夹 {depth + 1}-{b + 1}', parent=parent)))
+            Category.objects.bulk_create([item[3] for item in pending], batch_size=batch)
+            for user, parent, index, cat in pending:
+                folders[user.id].append(cat)
+                x, y = grid_position(index)
+                icons.append(DesktopIcon(
+                    user=user, title=cat.name, content_type=self.category_ct, object_id=cat.id,
+                    parent_folder=parent, x=x, y=y, target_type='category',
+                ))
+            level = [(user, cat) for user, _, _, cat in pending]
+
+        # 2. 资源：随机放在某个文件夹或桌面根目录
+        resources = []
+        for user in users:
+            parents = folders[user.id] + [None]
+            for n in range(self.options['files_per_user']):
+                parent = self.rng.choice(parents)
+                kind = self.rng.choices(self.kinds, self.weights)[0]
+                resources.append((user, parent, self.make_resource(user, parent, kind, n)))
+        Resource.objects.bulk_create([item[2] for item in resources], batch_size=batch)
+
+        # 3. 资源图标：同一父目录下按网格依次排列 (文件夹图标占据前面的格子)
+        used = {}
+        for icon in icons:
+            key = (icon.user_id, icon.parent_folder_id)
+            used[key] = used.get(key, 0) + 1
+        for user, parent, res in resources:
+            key = (user.id, parent.id if parent else None)
+            index = used.get(key, 0)
+            used[key] = index + 1
+            x, y = grid_position(index)
+            icons.append(DesktopIcon(
+                user=user, title=res.title, content_type=self.resource_ct, object_id=res.id,
+                parent_folder=parent, x=x, y=y, target_type='resource', target_kind=res.kind,
+            ))
+        DesktopIcon.objects.bulk_create(icons, batch_size=batch)
+
+        return {
+            'users': len(users),
+            'folders': sum(len(f) for f in folders.values()),
+            'resources': len(resources),
+            'icons': len(icons),
+        }
+
+    def make_resource(self, user, parent, kind, n):
+        ext, mime, icon_class = KIND_FILES[kind]
+        title = f'{kind}_{n}.{ext}'
+        res = Resource(
+            title=title, author=user, category=parent, kind=kind, status='approved',
+            icon_class=icon_class, mime_type=mime,
+        )
+        size = self.options['file_bytes']
+        if size > 0:
+            content = (f'{user.username}/{n}\n'.encode() * (size // 8 + 1))[:size]
+            rel = f'synthetic/{self.options["prefix"]}/{user.id}/{title}'
+            path = os.path.join(settings.MEDIA_ROOT, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+            res.file.name = rel
+            res.file_size = size
+            res.content_hash = hashlib.sha256(content).hexdigest()
+        return res
+
+    def clear(self, prefix, chunk):
+        """
+        按用户分批删除 (每批 chunk 个用户一个事务)：文件夹 id 用子查询取得，
+        不会在百万级数据上拼出超过 SQLite 变量上限的 IN 列表。
+        """
+        users = User.objects.filter(username__startswith=f'{prefix}_').order_by('id')
+        # Category 没有 owner 字段，通过这些用户的文件夹图标找到对应的文件夹
+        category_ct = ContentType.objects.get_for_model(Category)
+        deleted, last = 0, 0
+        while True:
+            ids = list(users.filter(id__gt=last).values_list('id', flat=True)[:chunk])
+            if not ids:
+                break
+            last = ids[-1]
+            with transaction.atomic():
+                folders = DesktopIcon.all_objects.filter(user_id__in=ids, content_type=category_ct)
+                Category.all_objects.filter(id__in=folders.values('object_id')).delete()
+                deleted += User.objects.filter(id__in=ids).delete()[0]
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, 'synthetic', prefix), ignore_errors=True)
+        self.stdout.write(f"已清除前缀为 {prefix}_ 的旧数据 ({deleted} 行)")
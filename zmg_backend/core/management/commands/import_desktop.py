@@ -0,0 +1,32 @@
+import tarfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from core.portability import ManifestError, import_stream
+
+
+class Command(BaseCommand):
+    help = '把 export_desktop 导出的 NDJSON 清单或 tar 包导入到指定用户的桌面 (追加，不覆盖已有内容)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path', help='导出文件路径')
+        parser.add_argument('--batch-size', type=int, default=1000, help='bulk_create 每批行数')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"用户不存在：{options['username']}")
+
+        try:
+            with open(options['path'], 'rb') as f:
+                stats = import_stream(user, f, trusted=True, batch_size=options['batch_size'])
+        except OSError as e:
+            raise CommandError(f'无法读取 {options["path"]}：{e}')
+        except (ManifestError, tarfile.TarError) as e:
+            raise CommandError(str(e))
+
+        summary = '，'.join(f'{key} {value}' for key, value in stats.items())
+        self.stdout.write(self.style.SUCCESS(f'导入完成：{summary}'))
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.changelog import log_changes
+from core.file_utils import ContentInfo
+from core.image_meta import image_metadata
+from core.models import Category, DesktopIcon, Resource, User, resource_directory_path
+from core.placement import Placements
+from core.quota import exceeds_quota, release_resources
+
+CHUNK = 1024 * 1024
+
+
+def copy_file(src, dest, link):
+    """
+    把一个文件放入 MEDIA_ROOT 并计算大小 / MIME / 哈希 (图片另外计算宽高等元数据)。
+    link=True 时优先建立硬链接 (跨文件系统等失败时退回复制)；复制时边写边计算哈希，只读一遍。
+    """
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    info = ContentInfo()
+    if link:
+        try:
+            os.link(src, dest)
+        except OSError:
+            link = False
+    if link:
+        with open(dest, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK), b''):
+                info.update(chunk)
+    else:
+        with open(src, 'rb') as fin, open(dest, 'wb') as fout:
+            for chunk in iter(lambda: fin.read(CHUNK), b''):
+                info.update(chunk)
+                fout.write(chunk)
+    result = info.result(os.path.basename(src))
+    if result['mime_type'].startswith('image/'):
+        with open(dest, 'rb') as f:
+            result.update(image_metadata(f) or {})
+    return result
+
+
+class Journal:
+    """
+    进度日志 (JSON Lines)：已创建的文件夹与已导入的文件，每批提交后追加写入。
+    中断后以相同参数重新运行即可跳过已完成的部分。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.folders = {}  # 相对目录 -> Category id
+        self.files = set()
+        torn = False
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    torn = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 上次中断时写了一半的行
+                    if 'dir' in entry:
+                        self.folders[entry['dir']] = entry['category']
+                    elif 'file' in entry:
+                        self.files.add(entry['file'])
+        self.fp = open(path, 'a', encoding='utf-8')
+        if torn:
+            # 另起一行，新记录不能接在写了一半的行后面
+            self.fp.write('\n')
+
+    def write(self, entries):
+        for entry in entries:
+            self.fp.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+
+    def close(self):
+        self.fp.close()
+
+
+class Command(BaseCommand):
+    help = '把本地目录树批量导入到用户桌面：镜像文件夹结构，多线程复制 / 硬链接文件，可断点续传'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='要导入的本地目录')
+        parser.add_argument('--user', required=True, help='导入到该用户 (用户名)')
+        parser.add_argument('--parent', type=int, help='导入到该文件夹 (Category id)，缺省为桌面')
+        parser.add_argument('--no-root-folder', action='store_true',
+                            help='不为源目录本身创建文件夹，直接把其中内容导入目标位置')
+        parser.add_argument('--link', action='store_true',
+                            help='使用硬链接代替复制 (源目录与 MEDIA_ROOT 须在同一文件系统，且之后不再修改源文件)')
+        parser.add_argument('--workers', type=int, default=8, help='复制文件的线程数')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批 (一个事务) 导入的文件数')
+        parser.add_argument('--journal', help='进度日志路径 (默认在当前目录按用户与源目录生成)')
+        parser.add_argument('--include-hidden', action='store_true', help='同时导入以 . 开头的文件和目录')
+        parser.add_argument('--ignore-quota', action='store_true', help='不检查用户存储配额')
+
+    def handle(self, *args, **options):
+        source = os.path.abspath(options['source'])
+        if not os.path.isdir(source):
+            raise CommandError(f'目录不存在：{source}')
+        try:
+            self.user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"用户不存在：{options['user']}")
+        parent_id = options['parent']
+        if parent_id is not None and not DesktopIcon.objects.filter(
+                user=self.user, target_type='category', object_id=parent_id).exists():
+            raise CommandError(f'用户没有 id 为 {parent_id} 的文件夹')
+
+        self.options = options
+        self.category_ct = ContentType.objects.get_for_model(Category)
+        self.resource_ct = ContentType.objects.get_for_model(Resource)
+        self.placements = Placements(self.user.id)
+
+        dirs, files = self.scan(source)
+        journal_path = options['journal'] or os.path.abspath(
+            f".import_{self.user.username}_{hashlib.md5(source.encode()).hexdigest()[:8]}.jsonl"
+        )
+        journal = Journal(journal_path)
+        try:
+            if journal.folders or journal.files:
+                self.stdout.write(f'从进度日志续传：已完成 {len(journal.files)} 个文件 ({journal_path})')
+            pending = [(rel, size) for rel, size in files if rel not in journal.files]
+            total_bytes = sum(size for _, size in pending)
+            if not options['ignore_quota'] and exceeds_quota(self.user, total_bytes):
+                raise CommandError(f'超出用户存储配额：需要 {total_bytes / 1e6:.1f} MB (可加 --ignore-quota)')
+
+            root = '' if options['no_root_folder'] else os.path.basename(source.rstrip(os.sep)) or 'import'
+            folders = self.mirror_folders(dirs, root, parent_id, journal)
+            self.stdout.write(f'文件夹 {len(folders)} 个，待导入文件 {len(pending)} 个 ({total_bytes / 1e6:.1f} MB)')
+            self.import_files(source, pending, folders, parent_id, journal, total_bytes)
+        finally:
+            journal.close()
+
+    def scan(self, source):
+        """返回 (相对目录列表 (父目录在前), [(相对文件路径, 大小)])"""
+        hidden = self.options['include_hidden']
+        dirs, files = [], []
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames[:] = sorted(d for d in dirnames if hidden or not d.startswith('.'))
+            rel_dir = os.path.relpath(dirpath, source)
+            rel_dir = '' if rel_dir == '.' else rel_dir.replace(os.sep, '/')
+            if rel_dir:
+                dirs.append(rel_dir)
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                if (not hidden and name.startswith('.')) or not os.path.isfile(path):
+                    continue
+                files.append((f'{rel_dir}/{name}' if rel_dir else name, os.path.getsize(path)))
+        return dirs, files
+
+    def mirror_folders(self, dirs, root, parent_id, journal):
+        """
+        为每个目录创建 Category + DesktopIcon，同一深度一次 bulk_create。
+        返回 {相对目录: Category id}，源目录本身为 ''。
+        """
+        folders = dict(journal.folders)
+        if not root:
+            folders[''] = parent_id
+        all_dirs = ([''] if root else []) + dirs
+        by_depth = {}
+        for rel in all_dirs:
+            if rel not in folders:
+                by_depth.setdefault(rel.count('/') + 1 if rel else 0, []).append(rel)
+
+        for depth in sorted(by_depth):
+            with transaction.atomic():
+                pending = []
+                for rel in by_depth[depth]:
+                    if rel:
+                        parent_rel, _, name = rel.rpartition('/')
+                        parent = folders[parent_rel]
+                    else:
+                        parent, name = parent_id, root
+                    pending.append((rel, parent, Category(name=name[:50], parent_id=parent, icon='folder')))
+                Category.objects.bulk_create([item[2] for item in pending])
+                icons = []
+                for rel, parent, cat in pending:
+                    x, y = self.placements.next(parent)
+                    icons.append(DesktopIcon(
+                        user=self.user, title=cat.name, content_type=self.category_ct, object_id=cat.id,
+                        parent_folder_id=parent, x=x, y=y, target_type='category',
+                    ))
+                DesktopIcon.objects.bulk_create(icons)
+                log_changes('insert', icons)
+            for rel, _, cat in pending:
+                folders[rel] = cat.id
+            journal.write([{'dir': rel, 'category': cat.id} for rel, _, cat in pending])
+        return folders
+
+    def import_files(self, source, pending, folders, parent_id, journal, total_bytes):
+        batch_size = self.options['batch_size']
+        started = time.perf_counter()
+        done_files = done_bytes = 0
+        with ThreadPoolExecutor(max_workers=self.options['workers']) as pool:
+            for offset in range(0, len(pending), batch_size):
+                batch = pending[offset:offset + batch_size]
+                names = [
+                    resource_directory_path(None, os.path.basename(rel))
+                    for rel, _ in batch
+                ]
+                infos = list(pool.map(
+                    lambda item: copy_file(
+                        os.path.join(source, item[0]), os.path.join(settings.MEDIA_ROOT, item[1]),
+                        self.options['link'],
+                    ),
+                    zip((rel for rel, _ in batch), names),
+                ))
+                self.save_batch(batch, names, infos, folders, journal)
+
+                done_files += len(batch)
+                done_bytes += sum(info['file_size'] for info in infos)
+                elapsed = max(time.perf_counter() - started, 1e-6)
+                self.stdout.write(
+                    f'  {done_files}/{len(pending)} 个文件, {done_bytes / 1e6:.1f}/{total_bytes / 1e6:.1f} MB, '
+                    f'{done_files / elapsed:.1f} 文件/s, {done_bytes / 1e6 / elapsed:.1f} MB/s'
+                )
+
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'导入完成：{done_files} 个文件, {done_bytes / 1e6:.1f} MB, 用时 {elapsed:.1f}s '
+            f'({done_files / elapsed:.1f} 文件/s, {done_bytes / 1e6 / elapsed:.1f} MB/s)'
+        ))
+
+    def save_batch(self, batch, names, infos, folders, journal):
+        """一批文件的资源与图标在同一事务中写入，提交后记入进度日志"""
+        with transaction.atomic():
+            resources = []
+            for (rel, _), name, info in zip(batch, names, infos):
+                res = Resource(
+                    title=os.path.basename(rel)[:100], author=self.user, status='approved',
+                    category_id=folders[rel.rpartition('/')[0]], **info,
+                )
+                res.file.name = name
+                res.fill_kind()
+                resources.append(res)
+            Resource.objects.bulk_create(resources)
+            release_resources(
+                [{'author_id': r.author_id, 'category_id': r.category_id, 'file_size': r.file_size}
+                 for r in resources],
+                sign=-1,
+            )
+
+            icons = []
+            for res in resources:
+                x, y = self.placements.next(res.category_id)
+                icons.append(DesktopIcon(
+                    user=self.user, title=res.title, content_type=self.resource_ct, object_id=res.id,
+                    parent_folder_id=res.category_id, x=x, y=y, target_type='resource', target_kind=res.kind,
+                ))
+            DesktopIcon.objects.bulk_create(icons)
+            log_changes('insert', icons)
+        journal.write([{'file': rel, 'resource': res.id} for (rel, _), res in zip(batch, resources)])
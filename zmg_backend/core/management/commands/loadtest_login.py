@@ -0,0 +1,138 @@
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+User = get_user_model()
+
+
+def percentile(values, pct):
+    """简单百分位数 (values 需已排序)"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = '登录压测：对比撞库攻击前后正常用户的登录吞吐量与延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=10, help='每个阶段持续秒数')
+        parser.add_argument('--legit-workers', type=int, default=4, help='正常用户并发数')
+        parser.add_argument('--legit-users', type=int, default=50, help='正常用户账号数量')
+        parser.add_argument('--attackers', type=int, default=32, help='攻击者并发数')
+        parser.add_argument('--attacker-ips', type=int, default=4, help='攻击者使用的 IP 数量')
+        parser.add_argument('--password', default='loadtest-Pass-123', help='正常用户密码')
+
+    def handle(self, *args, **options):
+        # 压测会清空整个缓存 (限流计数、版本号、最近访问等) 并在数据库中创建账号，
+        # 只允许在开发环境 (DEBUG) 或显式声明的一次性环境 (LOADTEST_ALLOWED=True) 中运行
+        if not settings.DEBUG and not getattr(settings, 'LOADTEST_ALLOWED', False):
+            raise CommandError('loadtest_login 会清空缓存并创建测试账号，仅可在 DEBUG 或 LOADTEST_ALLOWED=True 的环境中运行')
+        # 被限流的请求会被 django.request 记为 warning，压测时不需要逐条输出
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        password = options['password']
+        usernames, created = self.prepare_users(options['legit_users'], password)
+        try:
+            self.run_phases(options, usernames, password)
+        finally:
+            # 删除本次创建的账号，保留之前已存在的
+            User.objects.filter(username__in=created).delete()
+
+    def run_phases(self, options, usernames, password):
+        self.stdout.write("阶段 1：仅正常登录流量...")
+        cache.clear()
+        baseline = self.run_phase(options, usernames, password, attackers=0)
+        self.report('无攻击', baseline, options['duration'])
+
+        self.stdout.write(f"阶段 2：正常登录 + {options['attackers']} 个攻击线程...")
+        cache.clear()
+        attacked = self.run_phase(options, usernames, password, attackers=options['attackers'])
+        self.report('撞库攻击中', attacked, options['duration'])
+
+        base_rate = len(baseline['ok']) / options['duration']
+        attack_rate = len(attacked['ok']) / options['duration']
+        ratio = attack_rate / base_rate if base_rate else 0
+        style = self.style.SUCCESS if ratio >= 0.8 else self.style.WARNING
+        self.stdout.write(style(f"攻击期间正常登录吞吐量保持在基线的 {ratio:.0%}"))
+
+    def prepare_users(self, count, password):
+        usernames = [f'loadtest_user_{i}' for i in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        created = [name for name in usernames if name not in existing]
+        for name in created:
+            user = User(username=name)
+            user.set_password(password)
+            user.save()
+        return usernames, created
+
+    def run_phase(self, options, usernames, password, attackers):
+        stop = threading.Event()
+        lock = threading.Lock()
+        result = {'ok': [], 'legit_rejected': 0, 'attack_status': {}}
+
+        def legit_worker(worker_id):
+            client = Client()
+            seq = 0
+            try:
+                while not stop.is_set():
+                    seq += 1
+                    # 每个请求模拟一个不同的真实用户 IP
+                    ip = f'10.{worker_id % 250}.{seq // 250 % 250}.{seq % 250 + 1}'
+                    start = time.perf_counter()
+                    resp = client.post('/api/token/', {
+                        'username': random.choice(usernames),
+                        'password': password,
+                    }, content_type='application/json', REMOTE_ADDR=ip)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        if resp.status_code == 200:
+                            result['ok'].append(elapsed)
+                        else:
+                            result['legit_rejected'] += 1
+            finally:
+                connection.close()
+
+        def attack_worker(worker_id):
+            client = Client()
+            ip = f'192.168.0.{worker_id % options["attacker_ips"] + 1}'
+            try:
+                while not stop.is_set():
+                    resp = client.post('/api/token/', {
+                        'username': f'victim_{random.randint(0, 10 ** 6)}',
+                        'password': 'wrong-password',
+                    }, content_type='application/json', REMOTE_ADDR=ip)
+                    with lock:
+                        counts = result['attack_status']
+                        counts[resp.status_code] = counts.get(resp.status_code, 0) + 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=legit_worker, args=(i,)) for i in range(options['legit_workers'])]
+        threads += [threading.Thread(target=attack_worker, args=(i,)) for i in range(attackers)]
+        for t in threads:
+            t.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for t in threads:
+            t.join()
+        return result
+
+    def report(self, label, result, duration):
+        latencies = sorted(result['ok'])
+        self.stdout.write(
+            f"[{label}] 正常登录成功 {len(latencies)} 次 ({len(latencies) / duration:.1f}/s), "
+            f"被拒绝 {result['legit_rejected']} 次, "
+            f"p50={percentile(latencies, 50) * 1000:.0f}ms p95={percentile(latencies, 95) * 1000:.0f}ms"
+        )
+        if result['attack_status']:
+            summary = ', '.join(f'{code}: {n}' for code, n in sorted(result['attack_status'].items()))
+            self.stdout.write(f"[{label}] 攻击请求状态码分布 - {summary}")
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.trash import purge_due
+
+
+class Command(BaseCommand):
+    help = '物理清除回收站中到期 (或已清空) 的条目：分批删除记录，按限速删除文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100, help='每批清除的回收站条目数')
+        parser.add_argument('--files-per-second', type=float, default=None,
+                            help='每秒最多删除的文件数 (默认 settings.TRASH_PURGE_FILES_PER_SECOND，0 为不限速)')
+        parser.add_argument('--loop', type=float, default=0,
+                            help='常驻运行：清空到期条目后等待该秒数再检查 (0 为执行一轮后退出)')
+
+    def handle(self, *args, **options):
+        while True:
+            items = files = 0
+            while True:
+                n_items, n_files = purge_due(options['batch'], options['files_per_second'])
+                if not n_items:
+                    break
+                items += n_items
+                files += n_files
+            if items or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"清除了 {items} 个回收站条目，删除 {files} 个文件"))
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
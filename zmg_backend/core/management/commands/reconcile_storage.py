@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from core.models import Category, Resource, User
+
+
+class Command(BaseCommand):
+    help = '重新统计每个用户 / 文件夹的存储用量，修正增量计数的偏差'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=1000, help='每批写回的行数')
+
+    def handle(self, *args, **options):
+        batch = options['batch']
+
+        # 1. 用户总量：一次 GROUP BY
+        # 回收站中的文件在物理清除前仍占用配额
+        used = dict(
+            Resource.all_objects.values_list('author_id').annotate(total=Sum('file_size')).order_by()
+        )
+        users = []
+        for user in User.objects.only('id', 'storage_used').iterator(chunk_size=batch):
+            actual = used.get(user.id) or 0
+            if user.storage_used != actual:
+                user.storage_used = actual
+                users.append(user)
+        User.objects.bulk_update(users, ['storage_used'], batch_size=batch)
+
+        # 2. 文件夹用量：一次 GROUP BY (只统计有文件的资源)
+        folder_stats = {
+            row['category_id']: (row['total'] or 0, row['n'])
+            for row in Resource.objects.exclude(file='').filter(category__isnull=False)
+            .values('category_id').annotate(total=Sum('file_size'), n=Count('id')).order_by()
+        }
+        folders = []
+        for cat in Category.objects.only('id', 'size_bytes', 'file_count').iterator(chunk_size=batch):
+            size, count = folder_stats.get(cat.id, (0, 0))
+            if (cat.size_bytes, cat.file_count) != (size, count):
+                cat.size_bytes, cat.file_count = size, count
+                folders.append(cat)
+        Category.objects.bulk_update(folders, ['size_bytes', 'file_count'], batch_size=batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"统计完成！修正了 {len(users)} 个用户和 {len(folders)} 个文件夹的用量。"
+        ))
@@ -0,0 +1,170 @@
+"""
+进程内指标 - 计数器 / 直方图，按 Prometheus 文本格式 (0.0.4) 输出
+
+指标保存在各进程内存中，多进程部署时由 Prometheus 分别抓取每个进程再汇总。
+"""
+import os
+import threading
+import time
+
+import psutil
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+UPLOAD_BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1KB ~ 1GB
+UPLOAD_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label_values -> [各桶计数..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield self._bucket(label_values, bound, cumulative)
+            yield self._bucket(label_values, float('inf'), series[-1])
+            yield f'{self.name}_sum', _format_labels(self.labels, label_values), series[-2]
+            yield f'{self.name}_count', _format_labels(self.labels, label_values), series[-1]
+
+    def _bucket(self, label_values, bound, count):
+        labels = _format_labels(self.labels + ('le',), label_values + (_format_value(float(bound)),))
+        return f'{self.name}_bucket', labels, count
+
+
+class Gauge:
+    """瞬时值：抓取时由回调计算"""
+    type = 'gauge'
+
+    def __init__(self, name, help, func):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def samples(self):
+        value = self.func()
+        if value is not None:
+            yield self.name, '', value
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+request_latency = register(Histogram(
+    'zmg_request_duration_seconds', '请求耗时 (按路由)', LATENCY_BUCKETS, labels=('route', 'method'),
+))
+request_total = register(Counter(
+    'zmg_requests_total', '请求数 (按路由与状态码分类)', labels=('route', 'method', 'status'),
+))
+upload_bytes = register(Histogram('zmg_upload_bytes', '单个上传文件的大小', UPLOAD_BYTES_BUCKETS))
+upload_seconds = register(Histogram('zmg_upload_duration_seconds', '接收单个上传文件的耗时', UPLOAD_SECONDS_BUCKETS))
+
+_process = psutil.Process(os.getpid())
+_started = time.time()
+
+
+def _cpu_seconds():
+    times = _process.cpu_times()
+    return times.user + times.system
+
+
+register(Gauge('process_cpu_seconds_total', '进程累计 CPU 时间 (秒)', _cpu_seconds))
+register(Gauge('process_resident_memory_bytes', '进程常驻内存 (RSS)', lambda: _process.memory_info().rss))
+register(Gauge('process_num_threads', '进程线程数', _process.num_threads))
+register(Gauge('process_start_time_seconds', '进程启动时间 (Unix 时间戳)', lambda: _started))
+
+
+def observe_request(route, method, status, seconds):
+    route = route or 'unmatched'  # 未匹配的路径合并为一个标签，避免标签数量失控
+    request_latency.observe(seconds, route, method)
+    request_total.inc(1, route, method, str(status))
+
+
+def observe_upload(size, seconds):
+    upload_bytes.observe(size)
+    upload_seconds.observe(seconds)
+
+
+def render(extra=()):
+    """
+    输出 Prometheus 文本格式。extra 为额外的 (名称, 说明, 值) 瞬时指标，例如健康探测结果。
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {_format_value(value)}')
+    for name, help, value in extra:
+        if value is None:
+            continue
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
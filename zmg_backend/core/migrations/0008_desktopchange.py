@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alter_resource_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DesktopChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('icon_id', models.PositiveIntegerField(verbose_name='图标ID')),
+                ('action', models.CharField(choices=[('insert', '新增'), ('update', '修改'), ('delete', '删除'), ('reset', '需全量同步')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='desktop_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['user', 'id'], name='core_deskto_user_id_124b8b_idx')],
+            },
+        ),
+    ]
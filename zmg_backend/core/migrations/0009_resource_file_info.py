@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_desktopchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resource',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='SHA-256'),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True, verbose_name='文件大小'),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='mime_type',
+            field=models.CharField(blank=True, db_index=True, max_length=100, verbose_name='MIME类型'),
+        ),
+    ]
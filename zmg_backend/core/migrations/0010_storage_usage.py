@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_resource_file_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='file_count',
+            field=models.IntegerField(default=0, verbose_name='文件数量'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0, verbose_name='文件总大小'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='storage_quota',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='空间配额'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='storage_used',
+            field=models.BigIntegerField(default=0, verbose_name='已用空间'),
+        ),
+    ]
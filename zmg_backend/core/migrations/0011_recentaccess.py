@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_storage_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecentAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accessed_at', models.DateTimeField(verbose_name='访问时间')),
+                ('icon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.desktopicon')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recent_accesses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-accessed_at'], name='core_recent_user_id_c46eec_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recentaccess',
+            constraint=models.UniqueConstraint(fields=('user', 'icon'), name='unique_recent_access'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:01
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_target_kind(apps, schema_editor):
+    """为已有图标填充 target_type / target_kind"""
+    DesktopIcon = apps.get_model('core', 'DesktopIcon')
+    Resource = apps.get_model('core', 'Resource')
+
+    DesktopIcon.objects.filter(
+        content_type__app_label='core', content_type__model='category'
+    ).update(target_type='category')
+    DesktopIcon.objects.filter(
+        content_type__app_label='core', content_type__model='resource'
+    ).update(
+        target_type='resource',
+        # 指向已不存在的资源时子查询结果为 NULL，而 target_kind 不允许为空
+        target_kind=Coalesce(
+            Subquery(Resource.objects.filter(id=OuterRef('object_id')).values('kind')[:1]), Value(''),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recentaccess'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='desktopicon',
+            name='target_kind',
+            field=models.CharField(blank=True, default='', max_length=10, verbose_name='目标资源类型'),
+        ),
+        migrations.AddField(
+            model_name='desktopicon',
+            name='target_type',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='目标类型'),
+        ),
+        migrations.AddIndex(
+            model_name='desktopicon',
+            index=models.Index(fields=['user', 'target_kind', 'created_at'], name='core_deskto_user_id_1cc4ec_idx'),
+        ),
+        migrations.RunPython(backfill_target_kind, migrations.RunPython.noop),
+    ]
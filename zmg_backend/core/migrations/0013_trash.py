@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_desktopicon_target_kind'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='desktopicon',
+            name='core_deskto_user_id_1cc4ec_idx',
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='删除时间'),
+        ),
+        migrations.AddField(
+            model_name='desktopicon',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='删除时间'),
+        ),
+        migrations.AddField(
+            model_name='desktopicon',
+            name='purge_after',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='清除时间'),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='删除时间'),
+        ),
+        migrations.AddIndex(
+            model_name='desktopicon',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', 'target_kind', 'created_at'], name='desktopicon_live_kind'),
+        ),
+        migrations.AddIndex(
+            model_name='desktopicon',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', 'parent_folder'], name='desktopicon_live_parent'),
+        ),
+        migrations.AddIndex(
+            model_name='desktopicon',
+            index=models.Index(fields=['user', 'deleted_at'], name='desktopicon_trash'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_trash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resource',
+            name='dominant_color',
+            field=models.CharField(blank=True, max_length=7, verbose_name='主色调'),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='图片高度'),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='image_orientation',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='EXIF方向'),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='图片宽度'),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='placeholder',
+            field=models.CharField(blank=True, max_length=96, verbose_name='占位色块'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_image_meta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentPreview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=80, unique=True, verbose_name='内容标识')),
+                ('snippet', models.TextField(verbose_name='预览文本')),
+                ('encoding', models.CharField(max_length=20, verbose_name='编码')),
+                ('line_count', models.IntegerField(verbose_name='行数')),
+                ('truncated', models.BooleanField(default=False, verbose_name='已截断')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': '文档预览',
+            },
+        ),
+    ]
@@ -5,6 +5,9 @@ from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 import uuid
 
+from .file_utils import file_info, kind_for_mime
+from .image_meta import image_metadata
+
 # 1. 定义动态路径生成函数
 def resource_directory_path(instance, filename):
     # 获取当前日期
@@ -15,6 +18,11 @@ def resource_directory_path(instance, filename):
     new_filename = f"{uuid.uuid4().hex[:10]}_{filename}"
     return f'resources/{today.year}/{today.month}/{today.day}/{new_filename}'
 
+class LiveManager(models.Manager):
+    """默认管理器：排除已移入回收站的记录 (回收站 / 清理相关代码使用 all_objects)"""
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 # 1. 用户模型
 class User(AbstractUser):
     ROLE_CHOICES = (('student', '学生'), ('teacher', '教师'), ('admin', '管理员'))
@@ -22,6 +30,9 @@ class User(AbstractUser):
     avatar = models.ImageField("头像", upload_to='avatars/', null=True, blank=True)
     score = models.IntegerField("积分", default=0)
     bio = models.TextField("个人简介", blank=True)
+    # 存储用量 (字节)，上传 / 删除时增量维护；配额为空时使用 settings.STORAGE_QUOTA_DEFAULT
+    storage_used = models.BigIntegerField("已用空间", default=0)
+    storage_quota = models.BigIntegerField("空间配额", null=True, blank=True)
     class Meta: verbose_name = "用户"
 
 # 2. 分类模型
@@ -29,6 +40,15 @@ class Category(models.Model):
     name = models.CharField("分类名称", max_length=50)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     icon = models.CharField("图标", max_length=50, default="folder")
+    # 直接位于该文件夹内的文件总大小 / 数量 (不含子文件夹)
+    size_bytes = models.BigIntegerField("文件总大小", default=0)
+    file_count = models.IntegerField("文件数量", default=0)
+    # 移入回收站的时间，为空表示正常
+    deleted_at = models.DateTimeField("删除时间", null=True, blank=True, db_index=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
     def __str__(self): return self.name
     class Meta: verbose_name = "资源分类"
 
@@ -60,35 +80,95 @@ class Resource(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     ai_tags = models.CharField("AI标签", max_length=200, blank=True)
     embedding_text = models.TextField("向量文本", null=True, blank=True)
+    # 上传时一次性计算的文件信息，列表 / 配额统计无需访问磁盘
+    file_size = models.BigIntegerField("文件大小", null=True, blank=True, db_index=True)
+    mime_type = models.CharField("MIME类型", max_length=100, blank=True, db_index=True)
+    content_hash = models.CharField("SHA-256", max_length=64, blank=True, db_index=True)
+    deleted_at = models.DateTimeField("删除时间", null=True, blank=True, db_index=True)
+    # 图片元数据 (见 core/image_meta.py)：显示宽高、EXIF 方向、主色调与占位色块
+    image_width = models.PositiveIntegerField("图片宽度", null=True, blank=True)
+    image_height = models.PositiveIntegerField("图片高度", null=True, blank=True)
+    image_orientation = models.PositiveSmallIntegerField("EXIF方向", null=True, blank=True)
+    dominant_color = models.CharField("主色调", max_length=7, blank=True)
+    placeholder = models.CharField("占位色块", max_length=96, blank=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    def fill_image_info(self, upload=None):
+        """计算图片元数据；不是可识别的图片时不做修改"""
+        meta = image_metadata(upload if upload is not None else self.file.file)
+        if meta:
+            for field, value in meta.items():
+                setattr(self, field, value)
+
+    def fill_file_info(self, upload=None, name=None):
+        """填充文件大小 / MIME / 哈希：优先使用上传处理器已算好的结果，否则流式读取一遍"""
+        if upload is None:
+            upload = self.file.file
+        info = getattr(upload, 'content_info', None) or file_info(upload, name or self.file.name)
+        self.file_size = info['file_size']
+        self.mime_type = info['mime_type']
+        self.content_hash = info['content_hash']
+
+    def fill_kind(self):
+        """根据 MIME / 扩展名自动分类并赋予默认图标 (bulk_create 不经过 save，需要时直接调用)"""
+        name = self.file.name if self.file else self.link
+        ext = name.split('.')[-1].lower() if '.' in name else ''
+
+        # 优先按文件头识别出的 MIME 分类，再按扩展名判断
+        mime_kind = kind_for_mime(self.mime_type)
+        if mime_kind: self.kind = mime_kind
+        elif ext in ['mp4','mov','avi','mkv']: self.kind = 'video'
+        elif ext in ['jpg','jpeg','png','gif','webp','bmp']: self.kind = 'image'
+        elif ext in ['mp3','wav','flac','m4a']: self.kind = 'audio'
+        elif ext in ['zip','rar','7z','tar','gz']: self.kind = 'archive'
+        elif ext in ['pdf','doc','docx','xls','xlsx','ppt','pptx','txt','md']: self.kind = 'doc'
+
+        # 自动图标 (增加图片/音频支持)
+        if not self.icon_class:
+            if self.kind == 'image': self.icon_class = 'fa-solid fa-file-image'
+            elif self.kind == 'audio': self.icon_class = 'fa-solid fa-file-audio'
+            elif self.kind == 'video': self.icon_class = 'fa-solid fa-file-video'
+            elif self.kind == 'archive': self.icon_class = 'fa-solid fa-file-zipper'
+            elif ext == 'pdf': self.icon_class = 'fa-solid fa-file-pdf'
+            elif ext in ['doc', 'docx']: self.icon_class = 'fa-solid fa-file-word'
+            elif ext in ['xls', 'xlsx']: self.icon_class = 'fa-solid fa-file-excel'
+            elif ext in ['ppt', 'pptx']: self.icon_class = 'fa-solid fa-file-powerpoint'
+            elif ext in ['py', 'js', 'html', 'css']: self.icon_class = 'fa-solid fa-file-code'
+            elif self.kind == 'link': self.icon_class = 'fa-solid fa-link'
+            else: self.icon_class = 'fa-solid fa-file'
 
     # 修改 save 方法，自动根据后缀赋予默认图标
     def save(self, *args, **kwargs):
-        if(self.file or self.link) and self.kind == 'other': # 简单的自动分类逻辑
-            name = self.file.name if self.file else self.link
-            ext = name.split('.')[-1].lower() if '.' in name else ''
-            
-            # 增强的类型判断
-            if ext in ['mp4','mov','avi','mkv']: self.kind = 'video'
-            elif ext in ['jpg','jpeg','png','gif','webp','bmp']: self.kind = 'image'
-            elif ext in ['mp3','wav','flac','m4a']: self.kind = 'audio'
-            elif ext in ['zip','rar','7z','tar','gz']: self.kind = 'archive'
-            elif ext in ['pdf','doc','docx','xls','xlsx','ppt','pptx','txt','md']: self.kind = 'doc'
-            
-            # 自动图标 (增加图片/音频支持)
-            if not self.icon_class:
-                if self.kind == 'image': self.icon_class = 'fa-solid fa-file-image'
-                elif self.kind == 'audio': self.icon_class = 'fa-solid fa-file-audio'
-                elif self.kind == 'video': self.icon_class = 'fa-solid fa-file-video'
-                elif self.kind == 'archive': self.icon_class = 'fa-solid fa-file-zipper'
-                elif ext == 'pdf': self.icon_class = 'fa-solid fa-file-pdf'
-                elif ext in ['doc', 'docx']: self.icon_class = 'fa-solid fa-file-word'
-                elif ext in ['xls', 'xlsx']: self.icon_class = 'fa-solid fa-file-excel'
-                elif ext in ['ppt', 'pptx']: self.icon_class = 'fa-solid fa-file-powerpoint'
-                elif ext in ['py', 'js', 'html', 'css']: self.icon_class = 'fa-solid fa-file-code'
-                elif self.kind == 'link': self.icon_class = 'fa-solid fa-link'
-                else: self.icon_class = 'fa-solid fa-file'
-                
+        # 新上传或替换 (尚未写入存储) 的文件：重新记录大小 / MIME / 哈希与图片元数据
+        if self.file and not self.file._committed:
+            self.fill_file_info()
+            self.image_width = self.image_height = self.image_orientation = None
+            self.dominant_color = self.placeholder = ''
+            if self.mime_type.startswith('image/'):
+                self.fill_image_info()
+
+        if (self.file or self.link) and self.kind == 'other': # 简单的自动分类逻辑
+            self.fill_kind()
+
+        kind_changed = self.pk is not None and getattr(self, '_loaded_kind', self.kind) != self.kind
         super().save(*args, **kwargs)
+        self._loaded_kind = self.kind
+
+        # 同步桌面图标上冗余存储的 kind (库视图依赖它)
+        if kind_changed:
+            DesktopIcon.objects.filter(
+                content_type=ContentType.objects.get_for_model(Resource), object_id=self.pk
+            ).update(target_kind=self.kind)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的 kind，保存时据此判断是否需要同步图标
+        if 'kind' in field_names:
+            instance._loaded_kind = instance.kind
+        return instance
 
 # 4. [新增] 桌面图标模型 (核心)
 class DesktopIcon(models.Model):
@@ -106,11 +186,84 @@ class DesktopIcon(models.Model):
     is_shortcut = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
-    class Meta: ordering = ['created_at']
+    # 冗余字段：指向对象的类型 ('resource' / 'category') 和资源的 kind，
+    # 使库视图 (图片/文档/视频/音频) 只需扫描 (user, target_kind, created_at) 索引
+    target_type = models.CharField("目标类型", max_length=20, blank=True, default='')
+    target_kind = models.CharField("目标资源类型", max_length=10, blank=True, default='')
+
+    # 回收站：deleted_at 非空表示已删除 (文件夹内的图标随文件夹一起标记)；
+    # purge_after 只在用户直接删除的那一项 (回收站中显示的条目) 上设置，到期后由 purge_trash 物理清除
+    deleted_at = models.DateTimeField("删除时间", null=True, blank=True)
+    purge_after = models.DateTimeField("清除时间", null=True, blank=True, db_index=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # 正常列表只扫描未删除的行 (部分索引)
+            models.Index(fields=['user', 'target_kind', 'created_at'],
+                         condition=models.Q(deleted_at__isnull=True), name='desktopicon_live_kind'),
+            models.Index(fields=['user', 'parent_folder'],
+                         condition=models.Q(deleted_at__isnull=True), name='desktopicon_live_parent'),
+            models.Index(fields=['user', 'deleted_at'], name='desktopicon_trash'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # 新图标：由关联对象填充冗余字段 (通过 content_object= 创建时对象已在缓存中，无额外查询)
+        if self.content_type_id and not self.target_type:
+            self.target_type = ContentType.objects.get_for_id(self.content_type_id).model
+            if self.target_type == 'resource':
+                obj = self.content_object
+                self.target_kind = obj.kind if obj else ''
+        super().save(*args, **kwargs)
 
 # 5. 评论模型
 class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField("评论内容")
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+# 6. 桌面变更日志 (增量同步)
+class DesktopChange(models.Model):
+    """
+    按用户追加写入的桌面变更记录，自增 id 即单调递增的版本号。
+    客户端用 /api/desktop/changes/?since=<version> 拉取增量。
+    action='reset' 是压缩旧日志时写入的标记，其 icon_id 记录被清理的最后一条墓碑的版本号：
+    早于该版本的客户端可能错过了删除，必须全量重新同步。
+    """
+    ACTION_CHOICES = (('insert', '新增'), ('update', '修改'), ('delete', '删除'), ('reset', '需全量同步'))
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='desktop_changes')
+    icon_id = models.PositiveIntegerField("图标ID")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['user', 'id'])]
+
+# 7. 最近访问 (每个用户只保留最近的若干条，由缓存中的环形缓冲批量写入)
+class RecentAccess(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recent_accesses')
+    icon = models.ForeignKey(DesktopIcon, on_delete=models.CASCADE, related_name='+')
+    accessed_at = models.DateTimeField("访问时间")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'icon'], name='unique_recent_access')]
+        indexes = [models.Index(fields=['user', '-accessed_at'])]
+
+# 8. 文档预览缓存 (见 core/previews.py)：按存储文件名存储，共享同一文件的资源共用一条
+class DocumentPreview(models.Model):
+    key = models.CharField("内容标识", max_length=80, unique=True)
+    snippet = models.TextField("预览文本")
+    encoding = models.CharField("编码", max_length=20)
+    # 已读取部分的行数
+    line_count = models.IntegerField("行数")
+    # 文件或文本超出了预览上限，只返回了开头一部分
+    truncated = models.BooleanField("已截断", default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta: verbose_name = "文档预览"
@@ -0,0 +1,92 @@
+"""
+图标摆放 - 按网格为新图标分配不重叠的位置
+
+网格按行排列：每行 DESKTOP_GRID_COLUMNS 格，格距 DESKTOP_GRID_STEP 像素，第 n 格的坐标见 grid_position。
+Placement 用一次查询读出某个文件夹 (或桌面) 中已有图标的坐标，得到被占用的格子集合；
+之后的分配只在内存中向前移动游标，一批上百个图标也只需这一次查询 (均摊 O(1))。
+"""
+from django.conf import settings
+
+from .models import DesktopIcon
+
+
+def grid_columns():
+    return getattr(settings, 'DESKTOP_GRID_COLUMNS', 8)
+
+
+def grid_step():
+    return getattr(settings, 'DESKTOP_GRID_STEP', 100)
+
+
+def grid_position(index):
+    """第 index 格 (从 0 开始) 的坐标"""
+    columns, step = grid_columns(), grid_step()
+    return (index % columns) * step, (index // columns) * step
+
+
+def grid_index(x, y):
+    """坐标所在的格子 (就近取整)，不在网格内时返回 None"""
+    columns, step = grid_columns(), grid_step()
+    col, row = round(x / step), round(y / step)
+    if 0 <= col < columns and row >= 0:
+        return row * columns + col
+    return None
+
+
+class Placement:
+    """某个用户在某个文件夹 (parent_id=None 为桌面) 中的占用网格"""
+
+    def __init__(self, user_id, parent_id, exclude=()):
+        self.occupied = set()
+        self.cursor = 0
+        coords = DesktopIcon.objects.filter(user_id=user_id, parent_folder_id=parent_id) \
+            .exclude(id__in=exclude).values_list('x', 'y')
+        for x, y in coords:
+            self.take(x, y)
+
+    def take(self, x, y):
+        """标记一个已占用的位置 (例如客户端指定了坐标的新图标)"""
+        index = grid_index(x, y)
+        if index is not None:
+            self.occupied.add(index)
+
+    def next(self):
+        """下一个空闲格子的坐标"""
+        while self.cursor in self.occupied:
+            self.cursor += 1
+        self.occupied.add(self.cursor)
+        return grid_position(self.cursor)
+
+
+class Placements:
+    """多个文件夹的占用网格，首次用到某个文件夹时才查询"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.grids = {}
+
+    def next(self, parent_id):
+        if parent_id not in self.grids:
+            self.grids[parent_id] = Placement(self.user_id, parent_id)
+        return self.grids[parent_id].next()
+
+
+def requested_position(request, user_id, parent_id):
+    """请求中带了 x / y 时使用客户端坐标，否则分配空闲格子"""
+    if 'x' in request.data and 'y' in request.data:
+        return request.data['x'], request.data['y']
+    return Placement(user_id, parent_id).next()
+
+
+def arrange(icons, key):
+    """
+    按 key 排序后依次放入网格 (文件夹在前)，返回坐标发生变化的图标。
+    """
+    icons = sorted(icons, key=lambda icon: (icon.target_type != 'category', key(icon)))
+    changed = []
+    for index, icon in enumerate(icons):
+        x, y = grid_position(index)
+        if (icon.x, icon.y) != (x, y):
+            icon.x, icon.y = x, y
+            changed.append(icon)
+    return changed
@@ -0,0 +1,477 @@
+"""
+桌面导出 / 导入 - 单个用户的文件夹树、资源、桌面图标 (含坐标) 与评论
+
+导出为 NDJSON 清单，每行一条记录，依次为：
+    header -> folder -> resource -> icon -> comment
+各类记录用 iterator() 分块读取并逐行输出，内存占用与数据量无关。
+带文件导出时打包为 tar：第一个成员是 manifest.ndjson (先写入 SpooledTemporaryFile 以得到大小)，
+其后是 files/<资源id>/<文件名> 形式的文件，边读边输出。
+
+导入按记录类型分批 bulk_create，并把清单中的旧 id 映射为新 id；
+只保存 id 映射表，不把整份清单读入内存。
+tar 中文件的大小 / 哈希 / MIME 在写入存储时重新计算，配额按实际写入的字节数检查，不信任清单中的声明。
+"""
+import json
+import os
+import tarfile
+import tempfile
+from datetime import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .changelog import log_changes
+from .file_utils import ContentInfo
+from .image_meta import IMAGE_FIELDS
+from .models import Category, Comment, DesktopIcon, Resource, User, resource_directory_path
+from .quota import add_usage, exceeds_quota, release_resources, remaining_for
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.ndjson'
+CHUNK_SIZE = 2000
+FILE_CHUNK = 64 * 1024
+BLOCK = 512
+
+RESOURCE_FIELDS = (
+    'id', 'title', 'description', 'cover', 'file', 'link', 'icon_class', 'status', 'kind',
+    'ai_tags', 'file_size', 'mime_type', 'content_hash', 'category_id', *IMAGE_FIELDS,
+)
+FILE_FIELDS = ('file', 'cover')
+
+
+class ManifestError(Exception):
+    """清单格式错误"""
+
+
+class QuotaExceeded(Exception):
+    """导入内容超出用户配额"""
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.size = size
+
+
+# === 导出 ===
+
+def _member_name(resource_id, field, name):
+    prefix = 'files' if field == 'file' else 'covers'
+    return f'{prefix}/{resource_id}/{os.path.basename(name)}'
+
+
+def export_records(user, with_files=False):
+    """按顺序生成清单中的记录 (dict)"""
+    yield {
+        'type': 'header', 'version': FORMAT_VERSION, 'user': user.username,
+        'exported_at': timezone.now().isoformat(), 'files': with_files,
+    }
+
+    folder_ids = DesktopIcon.objects.filter(user=user, target_type='category', is_shortcut=False) \
+        .values('object_id')
+    for row in Category.objects.filter(id__in=folder_ids).order_by('id') \
+            .values('id', 'name', 'icon', 'parent_id').iterator(chunk_size=CHUNK_SIZE):
+        yield {'type': 'folder', 'id': row['id'], 'name': row['name'], 'icon': row['icon'],
+               'parent': row['parent_id']}
+
+    for row in Resource.objects.filter(author=user).order_by('id') \
+            .values(*RESOURCE_FIELDS).iterator(chunk_size=CHUNK_SIZE):
+        row['category'] = row.pop('category_id')
+        if with_files:
+            # 带文件导出时引用 tar 中的成员名，否则保留存储中的文件名
+            for field in FILE_FIELDS:
+                if row[field]:
+                    row[field] = _member_name(row['id'], field, row[field])
+        yield {'type': 'resource', **row}
+
+    for row in DesktopIcon.objects.filter(user=user).order_by('id').values(
+            'id', 'title', 'x', 'y', 'target_type', 'target_kind', 'object_id', 'parent_folder_id', 'is_shortcut',
+    ).iterator(chunk_size=CHUNK_SIZE):
+        row['target'] = row.pop('object_id')
+        row['parent'] = row.pop('parent_folder_id')
+        yield {'type': 'icon', **row}
+
+    for row in Comment.objects.filter(resource__author=user, resource__deleted_at__isnull=True).order_by('id') \
+            .values('resource_id', 'content', 'user__username').iterator(chunk_size=CHUNK_SIZE):
+        yield {'type': 'comment', 'resource': row['resource_id'], 'user': row['user__username'],
+               'content': row['content']}
+
+
+def _ndjson(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def _tar_member(name, size, fileobj, mtime):
+    """输出一个 tar 成员：头部 + 内容 (按 size 截断或补零) + 块对齐填充"""
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = mtime
+    yield info.tobuf(tarfile.PAX_FORMAT)
+    remaining = size
+    while remaining > 0:
+        chunk = fileobj.read(min(FILE_CHUNK, remaining))
+        if not chunk:
+            yield b'\0' * remaining  # 文件在导出过程中变短
+            break
+        remaining -= len(chunk)
+        yield chunk
+    if size % BLOCK:
+        yield b'\0' * (BLOCK - size % BLOCK)
+
+
+def stream_export(user, with_files=False):
+    """导出数据的字节流：NDJSON，或 manifest.ndjson + 文件组成的 tar"""
+    if not with_files:
+        yield from _ndjson(export_records(user))
+        return
+
+    mtime = int(timezone.now().timestamp())
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as manifest:
+        for line in _ndjson(export_records(user, with_files=True)):
+            manifest.write(line)
+        size = manifest.tell()
+        manifest.seek(0)
+        yield from _tar_member(MANIFEST_NAME, size, manifest, mtime)
+
+    rows = Resource.objects.filter(author=user).filter(~Q(file='') | ~Q(cover='')).order_by('id') \
+        .values('id', *FILE_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+    for row in rows:
+        for field in FILE_FIELDS:
+            name = row[field]
+            if not name:
+                continue
+            try:
+                size = default_storage.size(name)
+                source = default_storage.open(name, 'rb')
+            except OSError:
+                continue  # 物理文件丢失时跳过
+            with source:
+                yield from _tar_member(_member_name(row['id'], field, name), size, source, mtime)
+    yield b'\0' * (BLOCK * 2)
+
+
+# === 导入 ===
+
+class _MeasuredReader:
+    """写入存储时顺带计算大小 / 哈希 / 文件头；超出 limit 字节时中止"""
+
+    def __init__(self, fileobj, limit=None):
+        self.fileobj = fileobj
+        self.limit = limit
+        self.info = ContentInfo()
+
+    def read(self, size=-1):
+        chunk = self.fileobj.read(size)
+        self.info.update(chunk)
+        if self.limit is not None and self.info.size > self.limit:
+            raise QuotaExceeded(self.info.size)
+        return chunk
+
+
+def _safe_link(link):
+    """不可信清单中的链接：必须是合法的 http(s) 地址，且不能指向 H5 应用目录"""
+    if not link or '/h5apps/' in link:
+        return None
+    try:
+        URLValidator(schemes=['http', 'https'])(link)
+    except ValidationError:
+        return None
+    return link
+
+
+class DesktopImporter:
+    """
+    逐条接收清单记录，按类型攒批写入。所有写入应在调用方的事务中进行。
+    trusted=False (接口导入) 时，不带文件的清单只能引用该用户自己已有的存储文件，
+    链接须通过 URL 校验，配额按实际写入的字节数检查。
+    """
+
+    def __init__(self, user, trusted=False, batch_size=1000):
+        self.user = user
+        self.trusted = trusted
+        self.batch_size = batch_size
+        self.with_files = False
+        self.kind = None
+        self.batch = []
+        self.folders = {}          # 旧文件夹 id -> 新 id
+        self.folder_parents = []   # (新文件夹 id, 旧父文件夹 id)，全部文件夹创建后统一关联
+        self.resources = {}        # 旧资源 id -> 新 id
+        self.members = {}          # tar 成员名 -> (资源新 id, 所在文件夹 id, 字段, 存储文件名)
+        self.written = []          # 已写入存储的文件 (失败时清理)
+        self.size = 0
+        self.stats = {'folders': 0, 'resources': 0, 'icons': 0, 'comments': 0, 'files': 0, 'skipped': 0}
+        self.ct = {
+            'category': ContentType.objects.get_for_model(Category),
+            'resource': ContentType.objects.get_for_model(Resource),
+        }
+
+    def feed(self, record):
+        kind = record.get('type') if isinstance(record, dict) else None
+        if kind == 'header':
+            if record.get('version') != FORMAT_VERSION:
+                raise ManifestError(f"不支持的清单版本：{record.get('version')}")
+            self.with_files = bool(record.get('files'))
+            return
+        if kind not in ('folder', 'resource', 'icon', 'comment'):
+            raise ManifestError(f'未知的记录类型：{kind}')
+        if kind != self.kind:
+            self.flush()
+            if self.kind == 'folder':
+                self._link_folders()
+            self.kind = kind
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            batch, self.batch = self.batch, []
+            try:
+                getattr(self, f'_save_{self.kind}s')(batch)
+            except (KeyError, TypeError, ValueError) as e:
+                raise ManifestError(f'{self.kind} 记录格式错误：{e}')
+
+    def end_manifest(self):
+        """清单读取完毕：写入剩余批次并检查配额"""
+        self.flush()
+        if self.kind == 'folder':
+            self._link_folders()
+        self.kind = None
+        if not self.trusted and exceeds_quota(self.user, self.size):
+            raise QuotaExceeded(self.size)
+
+    def add_file(self, member, fileobj):
+        """
+        保存 tar 中的一个文件成员 (清单中没有引用的成员忽略)。
+        大小 / 哈希 / MIME 按写入的内容计算；不可信导入超出剩余配额时中止。
+        """
+        target = self.members.pop(member, None)
+        if target is None:
+            return
+        resource_id, category_id, field, name = target
+        limit = None
+        if not self.trusted:
+            remaining = remaining_for(self.user)
+            limit = None if remaining is None else remaining - self.size
+        reader = _MeasuredReader(fileobj, limit)
+        name = default_storage.get_available_name(name)
+        try:
+            saved = default_storage.save(name, File(reader, name=os.path.basename(name)))
+        except Exception:
+            default_storage.delete(name)  # 中途失败时删除写了一半的文件
+            raise
+        self.written.append(saved)
+        self.size += reader.info.size
+
+        updates = {field: saved} if saved != name else {}
+        if field == 'file':
+            info = reader.info.result(saved)
+            updates.update(info)
+            add_usage(self.user.id, category_id, info['file_size'], files=0)
+        if updates:
+            Resource.all_objects.filter(id=resource_id).update(**updates)
+        self.stats['files'] += 1
+
+    def finish(self):
+        """清单引用但 tar 中缺失的文件：清空对应字段，返回统计信息"""
+        for resource_id, _, field, _ in self.members.values():
+            Resource.all_objects.filter(id=resource_id).update(**{field: ''})
+        if self.members:
+            self.stats['missing_files'] = len(self.members)
+        return self.stats
+
+    def cleanup(self):
+        """导入失败时删除已写入的文件"""
+        for name in self.written:
+            default_storage.delete(name)
+
+    def _link_folders(self):
+        changed = [
+            Category(id=new_id, parent_id=self.folders.get(old_parent))
+            for new_id, old_parent in self.folder_parents if old_parent in self.folders
+        ]
+        Category.objects.bulk_update(changed, ['parent'], batch_size=self.batch_size)
+        self.folder_parents = []
+
+    def _save_folders(self, batch):
+        folders = [Category(name=str(r['name'])[:50], icon=r.get('icon') or 'folder') for r in batch]
+        Category.objects.bulk_create(folders)
+        for record, folder in zip(batch, folders):
+            self.folders[record['id']] = folder.id
+            if record.get('parent') is not None:
+                self.folder_parents.append((folder.id, record['parent']))
+        self.stats['folders'] += len(folders)
+
+    def _allowed_names(self, batch):
+        """
+        不带文件的清单中可以直接引用的存储文件名。
+        不可信导入只能引用自己已有的文件，返回 {文件名: 该文件已记录的大小 / MIME / 哈希 (封面为 None)}。
+        """
+        names = {r.get(field) for r in batch for field in FILE_FIELDS if r.get(field)}
+        if self.trusted or not names:
+            return dict.fromkeys(names)
+        own = Resource.all_objects.filter(author=self.user)
+        allowed = dict.fromkeys(own.filter(cover__in=names).values_list('cover', flat=True))
+        for row in own.filter(file__in=names).values('file', 'file_size', 'mime_type', 'content_hash'):
+            allowed[row.pop('file')] = row
+        return allowed
+
+    def _save_resources(self, batch):
+        allowed = {} if self.with_files else self._allowed_names(batch)
+        resources, pending = [], []
+        for r in batch:
+            link = r.get('link') if self.trusted else _safe_link(r.get('link'))
+            if link != r.get('link'):
+                self.stats['skipped'] += 1
+            res = Resource(
+                title=str(r['title'])[:100], description=r.get('description') or '', author=self.user,
+                category_id=self.folders.get(r.get('category')), link=link,
+                icon_class=r.get('icon_class'), status=r.get('status') or 'approved', kind=r.get('kind') or 'other',
+                ai_tags=r.get('ai_tags') or '', file_size=r.get('file_size'), mime_type=r.get('mime_type') or '',
+                content_hash=r.get('content_hash') or '',
+                image_width=r.get('image_width'), image_height=r.get('image_height'),
+                image_orientation=r.get('image_orientation'), dominant_color=r.get('dominant_color') or '',
+                placeholder=r.get('placeholder') or '',
+            )
+            for field in FILE_FIELDS:
+                name = r.get(field)
+                if not name:
+                    continue
+                if self.with_files:
+                    # 先分配存储文件名，tar 中的文件随后写入 (文件信息在写入时计算)
+                    stored = resource_directory_path(res, os.path.basename(name)) if field == 'file' \
+                        else f'covers/{os.path.basename(name)}'
+                    setattr(res, field, stored)
+                    if field == 'file':
+                        res.file_size, res.mime_type, res.content_hash = None, '', ''
+                    pending.append((len(resources), field, name, stored))
+                elif name in allowed:
+                    setattr(res, field, name)
+                    if allowed[name]:
+                        # 引用已有文件时使用服务器记录的文件信息
+                        for key, value in allowed[name].items():
+                            setattr(res, key, value)
+                else:
+                    self.stats['skipped'] += 1
+                    if field == 'file':
+                        res.file_size = None
+            resources.append(res)
+        Resource.objects.bulk_create(resources)
+
+        for index, field, member, stored in pending:
+            self.members[member] = (resources[index].id, resources[index].category_id, field, stored)
+        for record, res in zip(batch, resources):
+            self.resources[record['id']] = res.id
+            self.size += res.file_size or 0
+        release_resources(
+            [{'author_id': r.author_id, 'category_id': r.category_id, 'file_size': r.file_size} for r in resources],
+            sign=-1,
+        )
+        self.stats['resources'] += len(resources)
+
+    def _save_icons(self, batch):
+        # 快捷方式指向清单之外的对象时，保留原 id (同一服务器上迁移)；对象不存在则跳过
+        external = {'category': set(), 'resource': set()}
+        for r in batch:
+            if r.get('target_type') in external and r['target'] not in self._id_map(r['target_type']):
+                external[r['target_type']].add(r['target'])
+        existing = {
+            'category': set(Category.objects.filter(id__in=external['category']).values_list('id', flat=True)),
+            'resource': set(Resource.objects.filter(id__in=external['resource']).values_list('id', flat=True)),
+        }
+
+        icons = []
+        for r in batch:
+            target_type = r.get('target_type')
+            if target_type not in external:
+                self.stats['skipped'] += 1
+                continue
+            object_id = self._id_map(target_type).get(r['target'])
+            if object_id is None and r.get('is_shortcut') and r['target'] in existing[target_type]:
+                object_id = r['target']
+            if object_id is None:
+                self.stats['skipped'] += 1
+                continue
+            icons.append(DesktopIcon(
+                user=self.user, title=str(r['title'])[:100], x=int(r.get('x') or 0), y=int(r.get('y') or 0),
+                content_type=self.ct[target_type], object_id=object_id,
+                parent_folder_id=self.folders.get(r.get('parent')), is_shortcut=bool(r.get('is_shortcut')),
+                target_type=target_type, target_kind=r.get('target_kind') or '',
+            ))
+        DesktopIcon.objects.bulk_create(icons)
+        log_changes('insert', icons)
+        self.stats['icons'] += len(icons)
+
+    def _save_comments(self, batch):
+        users = dict(User.objects.filter(username__in={r.get('user') for r in batch}).values_list('username', 'id'))
+        comments = []
+        for r in batch:
+            resource_id = self.resources.get(r['resource'])
+            user_id = users.get(r.get('user'))
+            if resource_id is None or user_id is None:
+                self.stats['skipped'] += 1
+                continue
+            comments.append(Comment(user_id=user_id, resource_id=resource_id, content=str(r['content'])))
+        Comment.objects.bulk_create(comments)
+        self.stats['comments'] += len(comments)
+
+    def _id_map(self, target_type):
+        return self.folders if target_type == 'category' else self.resources
+
+
+def _read_manifest(importer, lines):
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ManifestError(f'第 {number} 行不是有效的 JSON')
+        importer.feed(record)
+    importer.end_manifest()
+
+
+def is_tar(fileobj):
+    head = fileobj.read(BLOCK)
+    fileobj.seek(0)
+    return len(head) == BLOCK and head[257:262] == b'ustar'
+
+
+def import_stream(user, fileobj, trusted=False, batch_size=1000):
+    """
+    导入 NDJSON 清单或导出的 tar 包 (fileobj 需可 seek 以识别格式)，返回统计信息。
+    全部写入在一个事务中完成，失败时回滚并删除已写入的文件。
+    """
+    importer = DesktopImporter(user, trusted=trusted, batch_size=batch_size)
+    try:
+        with transaction.atomic():
+            if is_tar(fileobj):
+                seen_manifest = False
+                with tarfile.open(fileobj=fileobj, mode='r|') as archive:
+                    for member in archive:
+                        if not member.isfile():
+                            continue
+                        if member.name == MANIFEST_NAME:
+                            _read_manifest(importer, archive.extractfile(member))
+                            seen_manifest = True
+                        elif seen_manifest:
+                            importer.add_file(member.name, archive.extractfile(member))
+                if not seen_manifest:
+                    raise ManifestError(f'tar 包中没有 {MANIFEST_NAME}')
+            else:
+                _read_manifest(importer, fileobj)
+            return importer.finish()
+    except Exception:
+        importer.cleanup()
+        raise
+
+
+def export_filename(user, with_files):
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return f"desktop-{user.username}-{stamp}.{'tar' if with_files else 'ndjson'}"
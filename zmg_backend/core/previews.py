@@ -0,0 +1,170 @@
+"""
+文档预览 - 为文本类文档 (txt / md / html / csv 等) 提取一段有限长度的预览文本与基本信息
+
+每个存储文件只提取一次：结果按存储文件名存入 DocumentPreview 表，并在缓存中保留一份，
+之后的请求直接命中缓存。存储文件名由服务器分配，写入后内容不再改变 (替换文件总是保存为新文件名)，
+复制出的资源共享同一个文件名，因此也共用同一份预览。提取时只流式读取文件开头的 DOC_PREVIEW_BYTES 字节，
+大文件不会被完整读取。
+"""
+import codecs
+import hashlib
+from html.parser import HTMLParser
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import DocumentPreview
+
+CHUNK_SIZE = 16 * 1024
+CACHE_TIMEOUT = 24 * 3600
+
+TEXT_EXTENSIONS = {'txt', 'md', 'markdown', 'csv', 'tsv', 'json', 'xml', 'log', 'ini', 'yaml', 'yml',
+                   'py', 'js', 'css', 'html', 'htm'}
+HTML_EXTENSIONS = {'html', 'htm'}
+# 依次尝试的编码 (gb18030 兼容 GBK / GB2312)
+FALLBACK_ENCODINGS = ('utf-8', 'gb18030')
+BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+
+def max_bytes():
+    return getattr(settings, 'DOC_PREVIEW_BYTES', 64 * 1024)
+
+
+def max_chars():
+    return getattr(settings, 'DOC_PREVIEW_CHARS', 4000)
+
+
+def _extension(name):
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+
+
+def previewable(resource):
+    """能否生成文本预览：有文件，且 MIME 为 text/* 或扩展名属于文本类"""
+    if not resource.file:
+        return False
+    return (resource.mime_type or '').startswith('text/') or _extension(resource.file.name) in TEXT_EXTENSIONS
+
+
+def preview_key(resource):
+    """
+    预览标识：存储文件名的摘要。不使用 content_hash —— 它是冗余记录的字段，不能证明文件当前的内容。
+    HTML 会去掉标签后再预览，加上 :html 后缀。
+    """
+    key = 'n' + hashlib.sha256(resource.file.name.encode('utf-8')).hexdigest()
+    if _extension(resource.file.name) in HTML_EXTENSIONS:
+        key += ':html'
+    return key
+
+
+class _TextExtractor(HTMLParser):
+    """把 HTML 转成纯文本：丢弃 script / style，块级元素换行"""
+
+    SKIP = {'script', 'style', 'head', 'title'}
+    BLOCKS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote', 'section'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.skipping += 1
+        elif tag in self.BLOCKS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self.skipping:
+            self.skipping -= 1
+        elif tag in self.BLOCKS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+    def text(self):
+        lines = (' '.join(line.split()) for line in ''.join(self.parts).splitlines())
+        return '\n'.join(line for line in lines if line)
+
+
+def _read_head(fileobj, limit):
+    """读取至多 limit 字节，返回 (数据, 是否还有剩余内容)"""
+    chunks, size = [], 0
+    while size < limit:
+        chunk = fileobj.read(min(CHUNK_SIZE, limit - size))
+        if not chunk:
+            return b''.join(chunks), False
+        chunks.append(chunk)
+        size += len(chunk)
+    return b''.join(chunks), bool(fileobj.read(1))
+
+
+def _decode(data, truncated):
+    """识别编码并解码；截断处可能切开多字节字符，末尾不完整的字节直接丢弃"""
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            candidates = (encoding,)
+            break
+    else:
+        candidates = FALLBACK_ENCODINGS
+    for encoding in candidates:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            return decoder.decode(data, final=not truncated), encoding
+        except UnicodeDecodeError:
+            continue
+    return data.decode('latin-1'), 'latin-1'
+
+
+def extract_preview(fileobj, name):
+    """
+    流式读取文件开头，返回 {snippet, encoding, line_count, truncated}。
+    line_count 为已读取部分的行数；truncated 表示文件或文本超出了预览上限。
+    """
+    data, more = _read_head(fileobj, max_bytes())
+    text, encoding = _decode(data, more)
+    if _extension(name) in HTML_EXTENSIONS:
+        parser = _TextExtractor()
+        parser.feed(text)
+        parser.close()
+        text = parser.text()
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    limit = max_chars()
+    return {
+        'snippet': text[:limit],
+        'encoding': encoding.replace('-sig', ''),
+        'line_count': text.count('\n') + (1 if text and not text.endswith('\n') else 0),
+        'truncated': more or len(text) > limit,
+    }
+
+
+def _payload(preview):
+    return {
+        'snippet': preview.snippet,
+        'encoding': preview.encoding,
+        'line_count': preview.line_count,
+        'truncated': preview.truncated,
+    }
+
+
+def get_preview(resource):
+    """取得资源的预览 (缓存 -> 数据库 -> 提取)；文件不存在时返回 None"""
+    key = preview_key(resource)
+    cache_key = f'doc_preview:{key}'
+    data = cache.get(cache_key)
+    if data is not None:
+        return data
+
+    preview = DocumentPreview.objects.filter(key=key).first()
+    if preview is None:
+        try:
+            with resource.file.open('rb') as f:
+                fields = extract_preview(f, resource.file.name)
+        except (OSError, ValueError):
+            return None
+        # 并发请求可能已写入同一内容的预览
+        preview, _ = DocumentPreview.objects.get_or_create(key=key, defaults=fields)
+    data = _payload(preview)
+    cache.set(cache_key, data, CACHE_TIMEOUT)
+    return data
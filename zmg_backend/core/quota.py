@@ -0,0 +1,91 @@
+"""
+存储配额与用量统计 - 用户总量记在 User.storage_used，文件夹用量记在 Category.size_bytes / file_count
+(按 Resource.category 统计，移动图标时由 move_resources 同步)
+
+所有增减都用 F() 表达式在数据库中原子完成；偏差由 reconcile_storage 命令批量修正。
+"""
+from django.conf import settings
+from django.db.models import F
+
+from .models import Category, Resource, User
+
+# release_resources 需要的资源字段
+USAGE_FIELDS = ('author_id', 'category_id', 'file_size')
+
+
+def quota_for(user):
+    """用户的配额 (字节)，None 表示不限"""
+    if user.storage_quota is not None:
+        return user.storage_quota
+    return getattr(settings, 'STORAGE_QUOTA_DEFAULT', None)
+
+
+def remaining_for(user):
+    quota = quota_for(user)
+    if quota is None:
+        return None
+    return max(quota - user.storage_used, 0)
+
+
+def exceeds_quota(user, incoming):
+    """incoming 字节是否会超出配额"""
+    remaining = remaining_for(user)
+    return remaining is not None and incoming > remaining
+
+
+def usage_payload(user):
+    return {'used': user.storage_used, 'quota': quota_for(user), 'remaining': remaining_for(user)}
+
+
+def add_usage(user_id, folder_id, size, files=1):
+    """记录新增 (size > 0) 或删除 (传负数) 的文件"""
+    size = size or 0
+    if size:
+        User.objects.filter(id=user_id).update(storage_used=F('storage_used') + size)
+    if folder_id:
+        Category.objects.filter(id=folder_id).update(
+            size_bytes=F('size_bytes') + size, file_count=F('file_count') + files
+        )
+
+
+def release_resources(rows, users=True, folders=True, sign=1):
+    """
+    批量扣减一组即将删除的资源占用的空间。
+    rows 为 Resource.objects.values('author_id', 'category_id', 'file_size') 形式的字典。
+    移入回收站时只扣减文件夹统计 (users=False)，用户配额到物理清除时才释放；
+    从回收站恢复时传 sign=-1 加回。
+    """
+    by_user, by_folder = {}, {}
+    for row in rows:
+        size = row['file_size'] or 0
+        by_user[row['author_id']] = by_user.get(row['author_id'], 0) + size
+        if row['category_id']:
+            total, count = by_folder.get(row['category_id'], (0, 0))
+            by_folder[row['category_id']] = (total + size, count + 1)
+    if users:
+        for user_id, size in by_user.items():
+            if size:
+                User.objects.filter(id=user_id).update(storage_used=F('storage_used') - sign * size)
+    if folders:
+        for folder_id, (size, count) in by_folder.items():
+            Category.all_objects.filter(id=folder_id).update(
+                size_bytes=F('size_bytes') - sign * size, file_count=F('file_count') - sign * count
+            )
+
+
+def move_resources(resource_ids, folder_id):
+    """
+    图标移动到另一个文件夹 (folder_id=None 为桌面) 时，让资源的 category 跟随，
+    并把其大小 / 数量从原文件夹的统计转到新文件夹。
+    """
+    resources = Resource.objects.filter(id__in=resource_ids).exclude(category_id=folder_id)
+    rows = list(resources.values(*USAGE_FIELDS))
+    if not rows:
+        return
+    release_resources(rows, users=False)
+    if folder_id:
+        Category.objects.filter(id=folder_id).update(
+            size_bytes=F('size_bytes') + sum(row['file_size'] or 0 for row in rows),
+            file_count=F('file_count') + len(rows),
+        )
+    resources.update(category_id=folder_id)
@@ -0,0 +1,162 @@
+"""
+最近访问 - 每个用户一个有界、去重的环形缓冲 (存放在缓存中)，批量刷写到 RecentAccess 表
+
+记录一次访问只读写一次缓存；"最近" 列表直接按缓冲中的 id 取图标，与用户图标总数无关。
+有变化的用户进入待刷写队列，由 flush_recent 命令定期 (例如每 30 秒) 写入数据库，不占用请求线程。
+缓存是进程内的 LocMemCache 时，其他进程看不到这个队列，改由本进程的请求每 RECENT_FLUSH_INTERVAL 秒
+顺带刷写一次 (RECENT_FLUSH_IN_PROCESS 可显式开关)。
+
+待刷写队列只使用缓存的原子操作：每个用户用 cache.add 的标记去重，槽位号由 cache.incr 分配；
+缓冲的读-改-写在按用户的锁 (cache.add) 内完成，并发的请求不会互相覆盖。
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from .models import DesktopIcon, RecentAccess
+
+RECENT_SIZE = 20
+RING_TIMEOUT = 60 * 60 * 24 * 7
+# 用户在队列中的标记的有效期：标记过期后该用户的下一次访问会重新入队
+DIRTY_TIMEOUT = 60 * 10
+DIRTY_SEQ_KEY = 'recent:dirty-seq'        # 已分配的最后一个槽位
+DIRTY_CURSOR_KEY = 'recent:dirty-cursor'  # 已刷写到的槽位
+FLUSH_BATCH = 1000
+FLUSH_LOCK_KEY = 'recent:flush-lock'
+# 缓冲锁：持有者异常退出时 LOCK_TIMEOUT 秒后自动释放；等待超过 LOCK_WAIT 秒仍照常写入
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 1.0
+
+
+def _ring_key(user_id):
+    return f'recent:{user_id}'
+
+
+@contextmanager
+def _ring_lock(user_id):
+    """按用户的互斥锁，保护缓冲的读-改-写 (cache.add 只有一个请求能成功)"""
+    key = f'recent:lock:{user_id}'
+    deadline = time.monotonic() + LOCK_WAIT
+    acquired = cache.add(key, 1, LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.005)
+        acquired = cache.add(key, 1, LOCK_TIMEOUT)
+    try:
+        yield
+    finally:
+        if acquired:
+            cache.delete(key)
+
+
+def record_access(user_id, icon_id):
+    """记录一次打开：放到缓冲最前面，去重并截断到 RECENT_SIZE"""
+    key = _ring_key(user_id)
+    with _ring_lock(user_id):
+        ring = cache.get(key)
+        if ring is None:
+            ring = _load_ring(user_id)
+        ring = [[icon_id, time.time()]] + [entry for entry in ring if entry[0] != icon_id]
+        cache.set(key, ring[:RECENT_SIZE], RING_TIMEOUT)
+    _mark_dirty(user_id)
+    if flush_in_process():
+        interval = getattr(settings, 'RECENT_FLUSH_INTERVAL', 30)
+        # 每个周期只有拿到标记的一个请求刷写
+        if cache.add(FLUSH_LOCK_KEY, 1, interval):
+            flush()
+
+
+def flush_in_process():
+    """是否由 Web 进程自行刷写：默认在缓存为进程内缓存 (其他进程看不到队列) 时开启"""
+    setting = getattr(settings, 'RECENT_FLUSH_IN_PROCESS', None)
+    if setting is None:
+        return isinstance(caches['default'], LocMemCache)
+    return setting
+
+
+def _dirty_user_key(user_id):
+    return f'recent:dirty-user:{user_id}'
+
+
+def _dirty_slot_key(slot):
+    return f'recent:dirty:{slot}'
+
+
+def _mark_dirty(user_id):
+    """把用户加入待刷写队列 (已在队列中时不重复加入)"""
+    if not cache.add(_dirty_user_key(user_id), 1, DIRTY_TIMEOUT):
+        return
+    cache.add(DIRTY_SEQ_KEY, 0, None)
+    slot = cache.incr(DIRTY_SEQ_KEY)
+    cache.set(_dirty_slot_key(slot), user_id, RING_TIMEOUT)
+
+
+def _dirty_range():
+    """(已刷写到的槽位, 已分配的最后一个槽位)"""
+    seq = cache.get(DIRTY_SEQ_KEY) or 0
+    cursor = cache.get(DIRTY_CURSOR_KEY) or 0
+    if cursor > seq:  # 计数器被缓存淘汰后从头开始
+        cursor = 0
+    return cursor, seq
+
+
+def pending_count():
+    """待刷写的队列长度"""
+    cursor, seq = _dirty_range()
+    return seq - cursor
+
+
+def recent_icon_ids(user_id):
+    """按访问时间倒序的图标 id 列表"""
+    ring = cache.get(_ring_key(user_id))
+    if ring is None:
+        ring = _load_ring(user_id)
+        cache.set(_ring_key(user_id), ring, RING_TIMEOUT)
+    return [entry[0] for entry in ring]
+
+
+def _load_ring(user_id):
+    rows = RecentAccess.objects.filter(user_id=user_id).order_by('-accessed_at') \
+        .values_list('icon_id', 'accessed_at')[:RECENT_SIZE]
+    return [[icon_id, accessed_at.timestamp()] for icon_id, accessed_at in rows]
+
+
+def flush(batch=FLUSH_BATCH):
+    """
+    把队列中至多 batch 个槽位的用户缓冲批量写入数据库：一次 upsert + 每个用户一次裁剪。
+    返回刷写的用户数；写入成功后才推进游标，失败时下次重试。
+    """
+    cursor, seq = _dirty_range()
+    if seq <= cursor:
+        return 0
+    end = min(seq, cursor + batch)
+    slots = [_dirty_slot_key(n) for n in range(cursor + 1, end + 1)]
+    dirty = list(dict.fromkeys(cache.get_many(slots).values()))
+    # 先清除标记再读取缓冲：此后的访问会让用户重新入队，不会丢失
+    cache.delete_many([_dirty_user_key(user_id) for user_id in dirty])
+
+    rows = []
+    kept = {}
+    for user_id in dirty:
+        ring = cache.get(_ring_key(user_id)) or []
+        kept[user_id] = [entry[0] for entry in ring]
+        rows += [
+            RecentAccess(user_id=user_id, icon_id=icon_id,
+                         accessed_at=datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+            for icon_id, ts in ring
+        ]
+    # 图标可能已被删除，先过滤掉
+    existing = set(DesktopIcon.objects.filter(id__in=[r.icon_id for r in rows]).values_list('id', flat=True))
+    rows = [r for r in rows if r.icon_id in existing]
+
+    RecentAccess.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['user', 'icon'], update_fields=['accessed_at'],
+    )
+    for user_id, icon_ids in kept.items():
+        RecentAccess.objects.filter(user_id=user_id).exclude(icon_id__in=icon_ids).delete()
+    cache.set(DIRTY_CURSOR_KEY, end, None)
+    cache.delete_many(slots)
+    return len(dirty)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import User, Resource, Category, Comment, DesktopIcon
+from .desktop_utils import PREVIEW_SIZE, preview_item
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta: 
@@ -17,6 +18,9 @@ class ResourceSerializer(serializers.ModelSerializer):
     class Meta: 
         model = Resource
         fields = '__all__'
+        # 由服务器根据文件内容计算，客户端不能修改
+        read_only_fields = ('file_size', 'mime_type', 'content_hash', 'deleted_at',
+                            'image_width', 'image_height', 'image_orientation', 'dominant_color', 'placeholder')
 
 class CommentSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
@@ -59,7 +63,12 @@ class DesktopIconSerializer(serializers.ModelSerializer):
                 'cover': res.cover.url if res.cover else None,
                 'kind': res.kind,
                 'file': res.file.url if res.file else None,
-                'link': res.link
+                'link': res.link,
+                'size': res.file_size,
+                'mime_type': res.mime_type,
+                'width': res.image_width,
+                'height': res.image_height,
+                'color': res.dominant_color
             }
         # 如果是文件夹
         elif obj.content_type.model == 'category':
@@ -78,6 +87,10 @@ class DesktopIconSerializer(serializers.ModelSerializer):
         # 只有文件夹需要预览
         if not obj.content_type or obj.content_type.model != 'category':
             return []
+
+        # 已通过 prefetch_icons 批量加载
+        if hasattr(obj, '_preview'):
+            return obj._preview
             
         cat = obj.content_object
         if not cat: 
@@ -85,19 +98,5 @@ class DesktopIconSerializer(serializers.ModelSerializer):
 
         # 查询属于这个文件夹的图标
         # 注意：这里我们查询 DesktopIcon 表，parent_folder 指向当前 category
-        from .models import DesktopIcon # 局部引用防止循环导入
-        children = DesktopIcon.objects.filter(parent_folder=cat).order_by('created_at')[:4]
-        
-        preview_list = []
-        for child in children:
-            item = {'type': 'unknown', 'cover': None}
-            if child.content_type:
-                item['type'] = child.content_type.model
-                # 如果是资源且有封面，返回封面
-                if child.content_type.model == 'resource':
-                    res = child.content_object
-                    if res and res.cover:
-                        item['cover'] = res.cover.url
-            preview_list.append(item)
-            
-        return preview_list
\ No newline at end of file
+        children = DesktopIcon.objects.filter(parent_folder=cat).order_by('created_at')[:PREVIEW_SIZE]
+        return [preview_item(child) for child in children]
@@ -0,0 +1,97 @@
+"""
+SSE 推送通道 - 纯 ASGI 实现，挂在 Django ASGI 应用前面
+
+GET /api/events/?token=<access token>
+浏览器的 EventSource 无法设置请求头，所以 JWT 通过查询参数传递。
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .events import broker
+
+
+def authenticate_token(raw_token):
+    """校验 access token，返回 user_id；不查数据库"""
+    if not raw_token:
+        return None
+    try:
+        return int(AccessToken(raw_token)[jwt_settings.USER_ID_CLAIM])
+    except (TokenError, KeyError, TypeError, ValueError):
+        return None
+
+
+class EventStreamRouter:
+    """匹配推送路径的请求由本类处理，其余请求交给内层的 Django 应用"""
+
+    def __init__(self, app, path='/api/events/'):
+        self.app = app
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == self.path:
+            return await self.stream(scope, receive, send)
+        return await self.app(scope, receive, send)
+
+    async def stream(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        user_id = authenticate_token(query.get('token', [None])[0])
+        if user_id is None:
+            body = json.dumps({'success': False, 'detail': '身份认证失败'}).encode('utf-8')
+            await send({'type': 'http.response.start', 'status': 401,
+                        'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        sub = broker.subscribe(user_id)
+        heartbeat = getattr(settings, 'SSE_HEARTBEAT_SECONDS', 15)
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        getter = None
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),  # 禁止 nginx 缓冲
+            ]})
+            await self.send_chunk(send, 'retry: 3000\n\n')
+
+            while True:
+                # 心跳超时不取消 getter，留到下一轮继续等待，避免恰好到达的事件丢失
+                if getter is None:
+                    getter = asyncio.ensure_future(sub.queue.get())
+                done, _ = await asyncio.wait({getter, disconnected}, timeout=heartbeat,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    event = getter.result()
+                    getter = None
+                    data = json.dumps(event, ensure_ascii=False)
+                    await self.send_chunk(send, f"event: {event.get('type', 'message')}\ndata: {data}\n\n")
+                elif disconnected in done:
+                    break
+                else:
+                    # 心跳，防止代理断开空闲连接
+                    await self.send_chunk(send, ': ping\n\n')
+        except OSError:
+            pass
+        finally:
+            # 任务被取消 (服务器关闭等) 时清理后继续抛出 CancelledError
+            broker.unsubscribe(sub)
+            disconnected.cancel()
+            if getter is not None:
+                getter.cancel()
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    @staticmethod
+    async def send_chunk(send, text):
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
@@ -0,0 +1,170 @@
+"""
+静态内容分发 - 预渲染、预压缩的前端外壳 (index.html) 与静态资源
+
+- 外壳：每个进程只渲染一次模板，同时生成 gzip / brotli 版本，按 Accept-Encoding 返回；
+  带 ETag，Cache-Control: no-cache (每次向服务器确认，未变化时 304)。
+- 静态资源：从 STATIC_ROOT 读取，优先返回 compress_static 命令预先生成的 .br / .gz 文件；
+  带内容哈希的文件名 (ManifestStaticFilesStorage 生成) 设置一年的 immutable 缓存。
+
+brotli 为可选依赖 (pip install brotli)，未安装时只提供 gzip。
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.template.loader import get_template, render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils._os import safe_join
+from django.views.decorators.http import require_http_methods
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SHELL_TEMPLATE = 'index.html'
+# ManifestStaticFilesStorage 生成的文件名：name.<12 位 md5>.ext
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^.]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+STATIC_REVALIDATE = 'public, max-age=300, must-revalidate'
+# 预压缩文件的扩展名，按优先级排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def accepted_encodings(request):
+    """解析 Accept-Encoding，返回客户端可接受的编码集合 (忽略 q=0)"""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        token, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if token:
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+def compress(raw):
+    """返回 {编码: 压缩后的内容}，未安装 brotli 时不含 br"""
+    variants = {'gzip': gzip.compress(raw, 9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(raw, quality=11)
+    return variants
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match', '')
+    if header.strip() == '*':
+        return True
+    # 弱比较：忽略 W/ 前缀
+    tags = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return etag.removeprefix('W/') in tags
+
+
+class Shell:
+    """渲染一次的外壳页面及其压缩版本"""
+
+    def __init__(self, raw, mtime):
+        self.raw = raw
+        self.mtime = mtime
+        self.variants = compress(raw)
+        # 同一内容的各编码版本共用一个弱 ETag
+        self.etag = f'W/"{hashlib.sha256(raw).hexdigest()[:16]}"'
+
+
+_shell = None
+_shell_lock = threading.Lock()
+
+
+def _template_mtime():
+    origin = get_template(SHELL_TEMPLATE).origin.name
+    try:
+        return os.path.getmtime(origin)
+    except (OSError, TypeError):
+        return None
+
+
+def get_shell():
+    """取得外壳；DEBUG 下模板文件修改后自动重建，方便开发"""
+    global _shell
+    shell = _shell
+    if shell is not None and not settings.DEBUG:
+        return shell
+    mtime = _template_mtime() if settings.DEBUG else None
+    if shell is not None and shell.mtime == mtime:
+        return shell
+    with _shell_lock:
+        if _shell is None or _shell.mtime != mtime:
+            _shell = Shell(render_to_string(SHELL_TEMPLATE).encode('utf-8'), mtime)
+        return _shell
+
+
+def _cache_headers(response, etag, cache_control):
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+@require_http_methods(['GET', 'HEAD'])
+def shell_view(request):
+    """前端外壳 (首页)"""
+    shell = get_shell()
+    if etag_matches(request, shell.etag):
+        return _cache_headers(HttpResponseNotModified(), shell.etag, REVALIDATE)
+
+    body, encoding = shell.raw, None
+    accepted = accepted_encodings(request)
+    for name, _ in ENCODINGS:
+        if name in accepted and name in shell.variants:
+            body, encoding = shell.variants[name], name
+            break
+
+    response = HttpResponse(b'' if request.method == 'HEAD' else body, content_type='text/html; charset=utf-8')
+    response['Content-Length'] = len(body)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return _cache_headers(response, shell.etag, REVALIDATE)
+
+
+@require_http_methods(['GET', 'HEAD'])
+def static_view(request, path):
+    """从 STATIC_ROOT 提供静态文件 (需先执行 collectstatic 与 compress_static)"""
+    if not settings.STATIC_ROOT:
+        raise Http404
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    stat = os.stat(full_path)
+    etag = f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    hashed = bool(HASHED_NAME_RE.search(os.path.basename(full_path)))
+    cache_control = IMMUTABLE if hashed else STATIC_REVALIDATE
+    if etag_matches(request, etag):
+        return _cache_headers(HttpResponseNotModified(), etag, cache_control)
+
+    serve_path, encoding = full_path, None
+    accepted = accepted_encodings(request)
+    for name, suffix in ENCODINGS:
+        if name in accepted and os.path.isfile(full_path + suffix):
+            serve_path, encoding = full_path + suffix, name
+            break
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = os.path.getsize(serve_path)
+    else:
+        response = FileResponse(open(serve_path, 'rb'), content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return _cache_headers(response, etag, cache_control)
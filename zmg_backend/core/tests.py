@@ -1 +1,1786 @@
-from django.test import TestCase
+"""
+查询次数回归测试：在 10 / 100 / 1000 条数据规模下分别请求每个接口，
+断言 SQL 次数不随数据量增长 (出现 N+1 时测试失败)。
+
+同时记录各规模下的耗时；设置环境变量 QUERY_TIMING_REPORT=<路径> 时写出 JSON 报告，
+CI 可据此标记耗时随数据量超线性增长的接口。
+
+其后的各个测试类检查会删除或改写数据的功能 (回收站、复制、导入导出等) 的实际行为。
+"""
+import asyncio
+import codecs
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import types
+import zipfile
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import health
+from .archives import list_entries
+from .changelog import changes_since, compact, current_version, log_changes
+from .copying import SubtreeCopy
+from .image_meta import justify
+from .events import RedisBackend, broker
+from .models import Category, Comment, DesktopChange, DesktopIcon, RecentAccess, Resource, User
+from .portability import QuotaExceeded, import_stream
+from .previews import extract_preview, get_preview
+from .recent import flush as flush_recent, pending_count as recent_pending, recent_icon_ids, record_access
+from .sse import EventStreamRouter
+from .trash import empty_trash, purge_due, restore_icons, trash_icons
+from .zip_stream import stream_zip
+
+SIZES = (10, 100, 1000)
+KINDS = ('image', 'doc', 'video', 'audio')
+PASSWORD = 'query-Pass-123'
+MEDIA_ROOT = tempfile.mkdtemp(prefix='zmg-test-media-')
+
+TIMINGS = {}
+
+
+def seed(size):
+    """
+    生成一个用户及 size 条资源：一半在桌面，一半在文件夹 "数据" 中；
+    另有 5 个各含两个文件的小文件夹 (用于九宫格预览，保证桌面第一页同时有文件夹和文件)、
+    size // 10 条评论。
+    """
+    user = User.objects.create_user(f'qc_{size}', password=PASSWORD)
+    category_ct = ContentType.objects.get_for_model(Category)
+    resource_ct = ContentType.objects.get_for_model(Resource)
+
+    main = Category.objects.create(name='数据')
+    target = Category.objects.create(name='目标', parent=main)
+    small = Category.objects.bulk_create([Category(name=f'小文件夹{i}') for i in range(5)])
+    folders = [(main, None), (target, main)] + [(cat, None) for cat in small]
+    folder_icons = DesktopIcon.objects.bulk_create([
+        DesktopIcon(user=user, title=cat.name, content_type=category_ct, object_id=cat.id,
+                    parent_folder=parent, target_type='category')
+        for cat, parent in folders
+    ])
+
+    placements = [None if i % 2 else main for i in range(size)]
+    placements += [cat for cat in small for _ in range(2)]
+    resources = Resource.objects.bulk_create([
+        Resource(title=f'文件{i}.txt', author=user, category=parent, kind=KINDS[i % len(KINDS)],
+                 status='approved', file_size=100, mime_type='text/plain')
+        for i, parent in enumerate(placements)
+    ])
+    file_icons = DesktopIcon.objects.bulk_create([
+        DesktopIcon(user=user, title=res.title, content_type=resource_ct, object_id=res.id,
+                    parent_folder=res.category, target_type='resource', target_kind=res.kind)
+        for res in resources
+    ])
+
+    now = timezone.now()
+    RecentAccess.objects.bulk_create([
+        RecentAccess(user=user, icon=icon, accessed_at=now) for icon in file_icons[:20]
+    ])
+    Comment.objects.bulk_create([
+        Comment(user=user, resource=resources[0], content=f'评论{i}') for i in range(max(1, size // 10))
+    ])
+    return {
+        'user': user,
+        'folder': main,
+        'folder_icon': folder_icons[0],
+        'small_folder_icon': folder_icons[2],
+        'target': target,
+        'resource': resources[0],
+        'icon_ids': [icon.id for icon in file_icons],
+    }
+
+
+def h5_zip():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr('index.html', '<h1>app</h1>')
+    return SimpleUploadedFile('app.zip', buf.getvalue(), content_type='application/zip')
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    HEALTH_CACHE_SECONDS=0,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class QueryCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = {size: seed(size) for size in SIZES}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        path = os.environ.get('QUERY_TIMING_REPORT')
+        if path:
+            report = {
+                name: {
+                    'ms': {str(size): round(t * 1000, 2) for size, t in timings.items()},
+                    # 数据量放大 100 倍时的耗时倍数，明显超过常数说明存在超线性行为
+                    'growth': round(timings[SIZES[-1]] / timings[SIZES[0]], 2) if timings[SIZES[0]] else None,
+                }
+                for name, timings in sorted(TIMINGS.items())
+            }
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    def assertConstantQueries(self, name, call, authenticated=True):
+        """在各个数据规模下调用 call(client, ctx)，断言 SQL 次数一致"""
+        counts, timings = {}, {}
+        for size in SIZES:
+            ctx = self.data[size]
+            cache.clear()
+            client = APIClient()
+            if authenticated:
+                client.force_authenticate(ctx['user'])
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = call(client, ctx)
+                if getattr(response, 'streaming', False):
+                    b''.join(response.streaming_content)
+                timings[size] = time.perf_counter() - start
+            self.assertLess(response.status_code, 400, f'{name} ({size}): {response.status_code}')
+            counts[size] = len(queries)
+        TIMINGS[name] = timings
+        self.assertEqual(len(set(counts.values())), 1, f'{name} 的查询次数随数据量增长: {counts}')
+
+    # --- 桌面图标 ---
+
+    def test_desktop_list(self):
+        for parent in ('root', 'recent', 'image'):
+            self.assertConstantQueries(
+                f'desktop-list-{parent}', lambda c, ctx: c.get('/api/desktop/', {'parent_id': parent}),
+            )
+        self.assertConstantQueries(
+            'desktop-list-folder', lambda c, ctx: c.get('/api/desktop/', {'parent_id': ctx['folder'].id}),
+        )
+
+    def test_desktop_detail(self):
+        self.assertConstantQueries('desktop-retrieve', lambda c, ctx: c.get(f"/api/desktop/{ctx['icon_ids'][0]}/"))
+        self.assertConstantQueries('desktop-partial-update', lambda c, ctx: c.patch(
+            f"/api/desktop/{ctx['icon_ids'][0]}/", {'x': 10}, format='json'))
+        self.assertConstantQueries('desktop-destroy', lambda c, ctx: c.delete(f"/api/desktop/{ctx['icon_ids'].pop()}/"))
+
+    def test_desktop_read_actions(self):
+        self.assertConstantQueries('desktop-changes', lambda c, ctx: c.get('/api/desktop/changes/', {'since': 0}))
+        self.assertConstantQueries('desktop-facets', lambda c, ctx: c.get('/api/desktop/facets/'))
+        self.assertConstantQueries('desktop-open', lambda c, ctx: c.post(f"/api/desktop/{ctx['icon_ids'][0]}/open/"))
+        self.assertConstantQueries('desktop-download-zip', lambda c, ctx: c.get(
+            f"/api/desktop/{ctx['folder_icon'].id}/download_zip/"))
+        self.assertConstantQueries('category-tree', lambda c, ctx: c.get('/api/categories/tree/'))
+
+    def test_desktop_write_actions(self):
+        self.assertConstantQueries('desktop-move', lambda c, ctx: c.patch(
+            f"/api/desktop/{ctx['icon_ids'][0]}/move/", {'x': 1, 'y': 2}, format='json'))
+        self.assertConstantQueries('desktop-rename', lambda c, ctx: c.post(
+            f"/api/desktop/{ctx['icon_ids'][0]}/rename/", {'name': '新名字.txt'}, format='json'))
+        self.assertConstantQueries('desktop-rename-folder', lambda c, ctx: c.post(
+            f"/api/desktop/{ctx['folder_icon'].id}/rename/", {'name': '新文件夹名'}, format='json'))
+        self.assertConstantQueries('desktop-change-icon', lambda c, ctx: c.post(
+            f"/api/desktop/{ctx['icon_ids'][0]}/change_icon/", {'icon_class': 'fa-solid fa-star'}, format='json'))
+        self.assertConstantQueries('desktop-create-folder', lambda c, ctx: c.post(
+            '/api/desktop/create_folder/', {'name': '新建'}, format='json'))
+        self.assertConstantQueries('desktop-create-link', lambda c, ctx: c.post(
+            '/api/desktop/create_link/', {'title': '链接', 'link': 'https://example.com'}, format='json'))
+        self.assertConstantQueries('desktop-create-html', lambda c, ctx: c.post(
+            '/api/desktop/create_html_file/', {'title': '文档'}, format='json'))
+        self.assertConstantQueries('desktop-upload-init', lambda c, ctx: c.post(
+            '/api/desktop/upload_init/', {'size': 100}, format='json'))
+        self.assertConstantQueries('desktop-upload-file', lambda c, ctx: c.post(
+            '/api/desktop/upload_file/', {'file': SimpleUploadedFile('a.txt', b'hello'), 'parent_id': ctx['folder'].id}))
+        self.assertConstantQueries('desktop-install-h5', lambda c, ctx: c.post(
+            '/api/desktop/install_h5_app/', {'file': h5_zip(), 'title': '应用'}))
+        self.assertConstantQueries('desktop-uninstall', lambda c, ctx: c.delete(
+            f"/api/desktop/{ctx['icon_ids'].pop()}/uninstall/"))
+
+    def test_desktop_bulk_actions(self):
+        # 批量接口的查询次数只与本次提交的条数有关，这里固定每次 5 条
+        def batch(ctx):
+            ids = ctx['icon_ids'][:5]
+            del ctx['icon_ids'][:5]
+            return ids
+
+        self.assertConstantQueries('desktop-bulk-move', lambda c, ctx: c.post(
+            '/api/desktop/bulk_move/', {'ids': ctx['icon_ids'][:5], 'parent_id': ctx['target'].id}, format='json'))
+        self.assertConstantQueries('desktop-bulk-layout', lambda c, ctx: c.post(
+            '/api/desktop/bulk_layout/', {'items': [{'id': i, 'x': 0, 'y': 0} for i in ctx['icon_ids'][5:10]]},
+            format='json'))
+        self.assertConstantQueries('desktop-bulk-rename', lambda c, ctx: c.post(
+            '/api/desktop/bulk_rename/', {'ids': ctx['icon_ids'][5:10], 'pattern': '照片_{n}'}, format='json'))
+        self.assertConstantQueries('desktop-bulk-delete', lambda c, ctx: c.post(
+            '/api/desktop/bulk_delete/', {'ids': batch(ctx)}, format='json'))
+
+    def test_copy(self):
+        # 复制大文件夹时 SQLite 的 bulk_create 会按变量上限分批，这里用固定大小的文件夹
+        self.assertConstantQueries('desktop-copy', lambda c, ctx: c.post(
+            '/api/desktop/copy/', {'ids': [ctx['small_folder_icon'].id], 'parent_id': 'root'}, format='json'))
+        self.assertConstantQueries('desktop-duplicate', lambda c, ctx: c.post(
+            f"/api/desktop/{ctx['icon_ids'][0]}/duplicate/"))
+
+    def test_export(self):
+        self.assertConstantQueries('desktop-export', lambda c, ctx: c.get('/api/desktop/export/'))
+
+    def test_arrange(self):
+        self.assertConstantQueries('desktop-arrange', lambda c, ctx: c.post(
+            '/api/desktop/arrange/', {'parent_id': ctx['small_folder_icon'].object_id, 'order_by': 'name'},
+            format='json'))
+
+    def test_gallery(self):
+        self.assertConstantQueries('desktop-gallery', lambda c, ctx: c.get(
+            '/api/desktop/gallery/', {'width': 1200, 'row_height': 200}))
+
+    def test_trash(self):
+        for size in SIZES:
+            ctx = self.data[size]
+            trash_icons([DesktopIcon.objects.get(id=ctx['icon_ids'][0]), ctx['folder_icon']])
+        self.assertConstantQueries('desktop-trash', lambda c, ctx: c.get('/api/desktop/trash/'))
+        self.assertConstantQueries('desktop-restore', lambda c, ctx: c.post(
+            '/api/desktop/restore/', {'ids': [ctx['icon_ids'][0]]}, format='json'))
+        self.assertConstantQueries('desktop-empty-trash', lambda c, ctx: c.post(
+            '/api/desktop/empty_trash/', {}, format='json'))
+
+    # --- 资源 / 评论 / 分类 ---
+
+    def test_resources(self):
+        self.assertConstantQueries('resource-list', lambda c, ctx: c.get('/api/resources/'))
+        self.assertConstantQueries('resource-retrieve', lambda c, ctx: c.get(f"/api/resources/{ctx['resource'].id}/"))
+        self.assertConstantQueries('resource-view', lambda c, ctx: c.post(f"/api/resources/{ctx['resource'].id}/view/"))
+        self.assertConstantQueries('resource-comment', lambda c, ctx: c.post(
+            f"/api/resources/{ctx['resource'].id}/comment/", {'content': '好'}, format='json'))
+        self.assertConstantQueries('resource-comments', lambda c, ctx: c.get(
+            f"/api/resources/{ctx['resource'].id}/comments/"))
+
+    def test_categories(self):
+        self.assertConstantQueries('category-list', lambda c, ctx: c.get('/api/categories/'))
+        self.assertConstantQueries('category-retrieve', lambda c, ctx: c.get(f"/api/categories/{ctx['folder'].id}/"))
+
+    # --- api_views ---
+
+    def test_api_views(self):
+        self.assertConstantQueries('api-login', lambda c, ctx: c.post(
+            '/api/token/', {'username': ctx['user'].username, 'password': PASSWORD}, format='json'),
+            authenticated=False)
+        self.assertConstantQueries('api-logout', lambda c, ctx: c.post('/api/logout/'))
+        self.assertConstantQueries('api-user', lambda c, ctx: c.get('/api/user/'))
+        self.assertConstantQueries('api-verify', lambda c, ctx: c.get('/api/verify/'))
+        self.assertConstantQueries('api-bootstrap', lambda c, ctx: c.get('/api/bootstrap/'))
+        self.assertConstantQueries('api-files', lambda c, ctx: c.get('/api/files/'))
+        self.assertConstantQueries('api-search', lambda c, ctx: c.get('/api/search/', {'q': '文件'}))
+        self.assertConstantQueries('api-upload', lambda c, ctx: c.post(
+            '/api/upload/', {'file': SimpleUploadedFile('b.txt', b'data')}))
+        self.assertConstantQueries('api-health', lambda c, ctx: c.get('/api/health/'), authenticated=False)
+        self.assertConstantQueries('metrics', lambda c, ctx: c.get('/metrics'), authenticated=False)
+
+
+class MediaTestCase(TestCase):
+    """每个测试使用独立的临时 MEDIA_ROOT，结束后删除"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp(prefix='zmg-test-media-')
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        cache.clear()
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_forwarded_for_does_not_bypass_ip_limit(self):
+        """伪造 X-Forwarded-For 不能绕过按 IP 的限流"""
+        client = APIClient()
+        statuses = [
+            client.post('/api/token/', {'username': f'nobody{i}', 'password': 'x'}, format='json',
+                        REMOTE_ADDR='203.0.113.9', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}').status_code
+            for i in range(25)
+        ]
+        self.assertIn(429, statuses)
+
+
+class ChangelogCompactTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('changes_user')
+
+    def test_compact_resets_only_clients_behind_purged_tombstones(self):
+        old = timezone.now() - timezone.timedelta(days=60)
+        log_changes('insert', [(1, self.user.id), (2, self.user.id)])
+        log_changes('delete', [(1, self.user.id)])
+        DesktopChange.objects.filter(action='delete').update(created_at=old)
+        tombstone = DesktopChange.objects.get(action='delete').id
+        log_changes('update', [(2, self.user.id)])
+        up_to_date = current_version(self.user)
+
+        compact(timezone.now() - timezone.timedelta(days=30))
+
+        self.assertFalse(DesktopChange.objects.filter(action='delete').exists())
+        # 已同步到最新的客户端、已看到墓碑的客户端都不需要全量同步
+        self.assertFalse(changes_since(self.user, up_to_date)[1])
+        self.assertFalse(changes_since(self.user, tombstone)[1])
+        # 早于被清理墓碑的客户端必须全量同步
+        self.assertTrue(changes_since(self.user, tombstone - 1)[1])
+
+        # 再次压缩时标记前移到新清理的墓碑，仍只保留一个标记
+        log_changes('delete', [(2, self.user.id)])
+        DesktopChange.objects.filter(action='delete').update(created_at=old)
+        second = DesktopChange.objects.get(action='delete').id
+        compact(timezone.now() - timezone.timedelta(days=30))
+        self.assertEqual(DesktopChange.objects.filter(action='reset').count(), 1)
+        self.assertTrue(changes_since(self.user, second - 1)[1])
+        self.assertFalse(changes_since(self.user, second)[1])
+
+
+class BulkInputTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('bulk_user')
+        self.other = User.objects.create_user('bulk_other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category_ct = ContentType.objects.get_for_model(Category)
+        self.own = Category.objects.create(name='自己的')
+        DesktopIcon.objects.create(user=self.user, title='自己的', content_type=category_ct, object_id=self.own.id)
+        self.foreign = Category.objects.create(name='别人的')
+        DesktopIcon.objects.create(user=self.other, title='别人的', content_type=category_ct, object_id=self.foreign.id)
+        self.icon = DesktopIcon.objects.create(user=self.user, title='a.txt')
+
+    def bulk_move(self, **data):
+        return self.client.post('/api/desktop/bulk_move/', {'ids': [self.icon.id], **data}, format='json')
+
+    def test_bulk_move_checks_target_ownership(self):
+        self.assertEqual(self.bulk_move(parent_id=self.foreign.id).status_code, 404)
+        self.icon.refresh_from_db()
+        self.assertIsNone(self.icon.parent_folder_id)
+        self.assertEqual(self.bulk_move(parent_id=self.own.id).status_code, 200)
+        self.icon.refresh_from_db()
+        self.assertEqual(self.icon.parent_folder_id, self.own.id)
+
+    def test_bulk_move_rejects_bad_positions(self):
+        self.assertEqual(self.bulk_move(positions=[1]).status_code, 400)
+        self.assertEqual(self.bulk_move(positions={str(self.icon.id): 1}).status_code, 400)
+        self.assertEqual(self.bulk_move(positions={str(self.icon.id): {'x': 'abc'}}).status_code, 400)
+        response = self.bulk_move(positions={str(self.icon.id): {'x': '30', 'y': 40}})
+        self.assertEqual(response.status_code, 200)
+        self.icon.refresh_from_db()
+        self.assertEqual((self.icon.x, self.icon.y), (30, 40))
+
+    def test_bulk_layout_skips_non_dict_items(self):
+        response = self.client.post('/api/desktop/bulk_layout/', {
+            'items': [1, 'x', {'id': self.icon.id, 'x': 7, 'y': 8}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.icon.refresh_from_db()
+        self.assertEqual((self.icon.x, self.icon.y), (7, 8))
+
+
+class ResourceFileInfoTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('file_info_user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.res = Resource.objects.create(
+            title='a.txt', author=self.user, file=SimpleUploadedFile('a.txt', b'old'), status='approved')
+        User.objects.filter(id=self.user.id).update(storage_used=3)
+
+    def test_files_list_paging(self):
+        Resource.objects.create(title='b.txt', author=self.user, file=SimpleUploadedFile('b.txt', b'bb'))
+        response = self.client.get('/api/files/', {'limit': 1, 'offset': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(f['name'], f['size']) for f in response.data['data']], [('a.txt', 3)])
+        self.assertEqual(response.data['count'], 2)
+        # 非正数按最小值处理，不会产生负数切片
+        self.assertEqual(len(self.client.get('/api/files/', {'limit': -5, 'offset': -3}).data['data']), 1)
+        self.assertEqual(len(self.client.get('/api/files/', {'limit': 0}).data['data']), 1)
+        for params in ({'limit': 'x'}, {'offset': '1.5'}):
+            self.assertEqual(self.client.get('/api/files/', params).status_code, 400)
+
+    def test_replacing_file_recomputes_info_and_usage(self):
+        old_hash = self.res.content_hash
+        response = self.client.patch(f'/api/resources/{self.res.id}/', {
+            'file': SimpleUploadedFile('b.png', b'\x89PNG\r\n\x1a\n' + b'0' * 92),
+            'file_size': 1, 'content_hash': 'f' * 64, 'mime_type': 'text/plain',
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.res.refresh_from_db()
+        self.assertEqual(self.res.file_size, 100)
+        self.assertEqual(self.res.mime_type, 'image/png')
+        self.assertNotIn(self.res.content_hash, (old_hash, 'f' * 64))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 100)
+
+    def test_update_refreshes_library_facets(self):
+        DesktopIcon.objects.create(user=self.user, title='a.txt', content_object=self.res)
+        facets = self.client.get('/api/desktop/facets/').data
+        self.assertEqual((facets['doc']['count'], facets['doc']['bytes']), (1, 3))
+
+        self.client.patch(f'/api/resources/{self.res.id}/', {'file': SimpleUploadedFile('a.txt', b'x' * 50)},
+                          format='multipart')
+        self.assertEqual(self.client.get('/api/desktop/facets/').data['doc']['bytes'], 50)
+
+        response = self.client.patch(f'/api/resources/{self.res.id}/', {'kind': 'video'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        facets = self.client.get('/api/desktop/facets/').data
+        self.assertEqual(facets['doc']['count'], 0)
+        self.assertEqual((facets['video']['count'], facets['video']['bytes']), (1, 50))
+
+    def test_file_info_is_read_only(self):
+        response = self.client.patch(f'/api/resources/{self.res.id}/', {
+            'file_size': 0, 'content_hash': 'f' * 64, 'mime_type': 'text/html',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.res.refresh_from_db()
+        self.assertEqual((self.res.file_size, self.res.mime_type), (3, 'text/plain'))
+        self.assertNotEqual(self.res.content_hash, 'f' * 64)
+
+
+class FolderUsageTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('usage_user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.a = Category.objects.create(name='A', size_bytes=100, file_count=1)
+        self.b = Category.objects.create(name='B')
+        for cat in (self.a, self.b):
+            DesktopIcon.objects.create(user=self.user, title=cat.name, content_object=cat)
+        self.res = Resource.objects.create(title='f.txt', author=self.user, category=self.a, file_size=100)
+        self.icon = DesktopIcon.objects.create(user=self.user, title='f.txt', content_object=self.res,
+                                               parent_folder=self.a)
+
+    def usage(self):
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.res.refresh_from_db()
+        return (self.a.size_bytes, self.a.file_count), (self.b.size_bytes, self.b.file_count), self.res.category_id
+
+    def test_move_transfers_folder_usage(self):
+        self.client.patch(f'/api/desktop/{self.icon.id}/move/', {'parent_id': self.b.id}, format='json')
+        self.assertEqual(self.usage(), ((0, 0), (100, 1), self.b.id))
+        self.client.post('/api/desktop/bulk_move/', {'ids': [self.icon.id], 'parent_id': self.a.id}, format='json')
+        self.assertEqual(self.usage(), ((100, 1), (0, 0), self.a.id))
+        self.client.patch(f'/api/desktop/{self.icon.id}/move/', {'parent_id': 'root'}, format='json')
+        self.assertEqual(self.usage(), ((0, 0), (0, 0), None))
+
+    def test_moving_shortcut_keeps_resource_folder(self):
+        shortcut = DesktopIcon.objects.create(user=self.user, title='快捷方式', content_object=self.res,
+                                              is_shortcut=True)
+        self.client.patch(f'/api/desktop/{shortcut.id}/move/', {'parent_id': self.b.id}, format='json')
+        self.assertEqual(self.usage(), ((100, 1), (0, 0), self.a.id))
+
+
+class ZipStreamTests(MediaTestCase):
+
+    def test_unrecorded_size_uses_zip64_when_needed(self):
+        user = User.objects.create_user('zip_user')
+        res = Resource.objects.create(title='big.txt', author=user, file=SimpleUploadedFile('big.txt', b'x' * 100))
+        Resource.objects.filter(id=res.id).update(file_size=None)
+        res.refresh_from_db()
+        # 把 zip64 阈值调低，模拟没有记录大小的超大文件
+        with mock.patch('zipfile.ZIP64_LIMIT', 10):
+            data = b''.join(stream_zip([('big.txt', res)]))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertEqual(archive.read('big.txt'), b'x' * 100)
+
+    def test_folder_zip_only_contains_own_files(self):
+        owner, other = User.objects.create_user('zip_owner'), User.objects.create_user('zip_other')
+        # 两个用户的同名文件夹共用同一个 Category
+        folder = Category.objects.create(name='资料')
+        icons = {}
+        for user in (owner, other):
+            icons[user.id] = DesktopIcon.objects.create(user=user, title='资料', content_object=folder)
+            res = Resource.objects.create(title=f'{user.username}.txt', author=user, category=folder,
+                                          file=SimpleUploadedFile('a.txt', user.username.encode()))
+            DesktopIcon.objects.create(user=user, title=res.title, content_object=res, parent_folder=folder)
+
+        client = APIClient()
+        client.force_authenticate(owner)
+        response = client.get(f'/api/desktop/{icons[owner.id].id}/download_zip/')
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), ['zip_owner.txt'])
+            self.assertEqual(archive.read('zip_owner.txt'), b'zip_owner')
+
+
+class SlowCache:
+    """读取后稍作停顿的缓存包装，放大读-改-写之间的竞争窗口"""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def get(self, *args, **kwargs):
+        value = self.inner.get(*args, **kwargs)
+        time.sleep(0.002)
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+class RecentAccessTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(f'recent_{i}') for i in range(2)]
+        self.icons = [DesktopIcon.objects.create(user=user, title='a') for user in self.users]
+
+    @override_settings(RECENT_FLUSH_IN_PROCESS=False)
+    def test_open_queues_user_once_and_flush_persists(self):
+        for _ in range(3):
+            record_access(self.users[0].id, self.icons[0].id)
+        record_access(self.users[1].id, self.icons[1].id)
+        # 打开图标本身不刷写数据库
+        self.assertFalse(RecentAccess.objects.exists())
+        self.assertEqual(recent_pending(), 2)
+
+        self.assertEqual(flush_recent(), 2)
+        self.assertEqual(recent_pending(), 0)
+        self.assertEqual(
+            set(RecentAccess.objects.values_list('user_id', 'icon_id')),
+            {(self.users[0].id, self.icons[0].id), (self.users[1].id, self.icons[1].id)},
+        )
+
+        # 刷写后再次访问会重新入队
+        record_access(self.users[0].id, self.icons[0].id)
+        self.assertEqual(recent_pending(), 1)
+        self.assertEqual(flush_recent(), 1)
+
+    def test_local_cache_flushes_in_process(self):
+        # 默认的 LocMemCache 是进程内缓存：flush_recent 命令看不到队列，由请求自行刷写
+        record_access(self.users[0].id, self.icons[0].id)
+        self.assertEqual(recent_pending(), 0)
+        self.assertTrue(RecentAccess.objects.filter(user=self.users[0], icon=self.icons[0]).exists())
+        out = io.StringIO()
+        call_command('flush_recent', stdout=out)
+        self.assertIn('进程内缓存', out.getvalue())
+
+        # 同一周期内的其他访问只入队，等下一个周期
+        record_access(self.users[1].id, self.icons[1].id)
+        self.assertEqual(recent_pending(), 1)
+        cache.delete('recent:flush-lock')
+        record_access(self.users[1].id, self.icons[1].id)
+        self.assertEqual(recent_pending(), 0)
+        self.assertEqual(RecentAccess.objects.count(), 2)
+
+    @override_settings(RECENT_FLUSH_IN_PROCESS=False)
+    def test_flush_from_another_cache_instance(self):
+        record_access(self.users[0].id, self.icons[0].id)
+        record_access(self.users[1].id, self.icons[1].id)
+        # 另一个进程中的 flush_recent：独立的缓存连接，共享同一份存储
+        other = caches.create_connection('default')
+        self.assertIsNot(other, caches['default'])
+        with mock.patch('core.recent.cache', other):
+            self.assertEqual(recent_pending(), 2)
+            call_command('flush_recent', stdout=io.StringIO())
+            self.assertEqual(recent_pending(), 0)
+        self.assertEqual(RecentAccess.objects.count(), 2)
+
+    @override_settings(RECENT_FLUSH_IN_PROCESS=False)
+    def test_concurrent_opens_keep_every_entry(self):
+        user_id = self.users[0].id
+        cache.set(f'recent:{user_id}', [])
+        barrier = threading.Barrier(10)
+
+        def open_icon(icon_id):
+            barrier.wait()
+            record_access(user_id, icon_id)
+
+        with mock.patch('core.recent.cache', SlowCache(caches['default'])):
+            threads = [threading.Thread(target=open_icon, args=(1000 + i,)) for i in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(recent_icon_ids(user_id)), [1000 + i for i in range(10)])
+        self.assertEqual(recent_pending(), 1)
+
+
+class TrashTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('trash_user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def purge(self, icons):
+        trash_icons(icons)
+        empty_trash(self.user)
+        while purge_due(files_per_second=0)[0]:
+            pass
+
+    def make_file(self, name, parent=None, content=b'data'):
+        res = Resource.objects.create(title=name, author=self.user, category=parent,
+                                      file=SimpleUploadedFile(name, content))
+        icon = DesktopIcon.objects.create(user=self.user, title=name, content_object=res, parent_folder=parent)
+        return res, icon
+
+    def make_folder(self, name, parent=None):
+        cat = Category.objects.create(name=name, parent=parent)
+        icon = DesktopIcon.objects.create(user=self.user, title=name, content_object=cat, parent_folder=parent)
+        return cat, icon
+
+    def test_deleting_shortcuts_keeps_targets(self):
+        res, icon = self.make_file('a.txt')
+        folder, folder_icon = self.make_folder('目录')
+        inner, inner_icon = self.make_file('b.txt', folder)
+        shortcuts = [
+            DesktopIcon.objects.create(user=self.user, title='a', content_object=res, is_shortcut=True),
+            DesktopIcon.objects.create(user=self.user, title='目录', content_object=folder, is_shortcut=True),
+        ]
+        # 被删除的文件夹中放着指向其他文件的快捷方式
+        other, other_icon = self.make_file('c.txt')
+        box, box_icon = self.make_folder('盒子')
+        DesktopIcon.objects.create(user=self.user, title='c', content_object=other, is_shortcut=True,
+                                   parent_folder=box)
+
+        self.purge(shortcuts + [box_icon])
+
+        for obj in (res, folder, inner, other, icon, folder_icon, inner_icon, other_icon):
+            self.assertTrue(type(obj).objects.filter(id=obj.id).exists(), obj)
+        for obj in (res, inner, other):
+            self.assertTrue(os.path.exists(obj.file.path))
+        self.assertFalse(Category.all_objects.filter(id=box.id).exists())
+        self.assertEqual(DesktopIcon.all_objects.filter(is_shortcut=True).count(), 0)
+
+    def move(self, icon, folder):
+        response = self.client.post('/api/desktop/bulk_move/',
+                                    {'ids': [icon.id], 'parent_id': folder.id if folder else 'root'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_subfolder_moved_out_survives_parent(self):
+        folder, folder_icon = self.make_folder('目录')
+        sub, sub_icon = self.make_folder('子目录', folder)
+        res, icon = self.make_file('a.txt', sub)
+        # 子目录图标移到桌面后，Category.parent 仍指向原文件夹
+        self.move(sub_icon, None)
+        self.assertEqual(Category.objects.get(id=sub.id).parent_id, folder.id)
+
+        trash_icons([folder_icon])
+        self.assertTrue(Category.objects.filter(id=sub.id).exists())
+        self.assertTrue(DesktopIcon.objects.filter(id__in=[sub_icon.id, icon.id]).count() == 2)
+        self.assertTrue(Resource.objects.filter(id=res.id).exists())
+
+        self.purge([])
+        self.assertFalse(Category.all_objects.filter(id=folder.id).exists())
+        self.assertTrue(Category.objects.filter(id=sub.id).exists())
+        self.assertTrue(Resource.objects.filter(id=res.id).exists())
+        self.assertTrue(os.path.exists(res.file.path))
+
+    def test_subfolder_moved_in_goes_with_parent(self):
+        folder, folder_icon = self.make_folder('目录')
+        sub, sub_icon = self.make_folder('外部目录')
+        res, icon = self.make_file('a.txt', sub)
+        self.move(sub_icon, folder)
+
+        trash_icons([folder_icon])
+        self.assertFalse(Category.objects.filter(id=sub.id).exists())
+        self.assertFalse(DesktopIcon.objects.filter(id__in=[sub_icon.id, icon.id]).exists())
+        self.assertFalse(Resource.objects.filter(id=res.id).exists())
+
+        restore_icons(self.user, [folder_icon.id])
+        self.assertTrue(Category.objects.filter(id=sub.id).exists())
+        self.assertEqual(DesktopIcon.objects.filter(id__in=[sub_icon.id, icon.id]).count(), 2)
+
+        path = res.file.path
+        self.purge([folder_icon])
+        self.assertFalse(Category.all_objects.filter(id=sub.id).exists())
+        self.assertFalse(Resource.all_objects.filter(id=res.id).exists())
+        self.assertFalse(DesktopIcon.all_objects.filter(id__in=[sub_icon.id, icon.id]).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_restore_brings_back_subtree(self):
+        folder, folder_icon = self.make_folder('目录')
+        sub, sub_icon = self.make_folder('子目录', folder)
+        res, icon = self.make_file('a.txt', sub)
+        trash_icons([folder_icon])
+        self.assertFalse(Resource.objects.filter(id=res.id).exists())
+        self.assertFalse(DesktopIcon.objects.filter(id__in=[sub_icon.id, icon.id]).exists())
+
+        response = self.client.post('/api/desktop/restore/', {'ids': [folder_icon.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Resource.objects.filter(id=res.id).exists())
+        self.assertTrue(Category.objects.filter(id__in=[folder.id, sub.id]).count() == 2)
+        self.assertEqual(DesktopIcon.objects.filter(id__in=[folder_icon.id, sub_icon.id, icon.id]).count(), 3)
+        self.assertFalse(DesktopIcon.all_objects.filter(purge_after__isnull=False).exists())
+
+    def test_purge_keeps_files_shared_with_copies(self):
+        res, icon = self.make_file('a.txt')
+        copy = SubtreeCopy(self.user, [icon]).run(None)[0]
+        self.purge([icon])
+        self.assertFalse(Resource.all_objects.filter(id=res.id).exists())
+        copied = Resource.objects.get(id=copy.object_id)
+        self.assertEqual(copied.file.name, res.file.name)
+        self.assertTrue(os.path.exists(copied.file.path))
+
+        self.purge([copy])
+        self.assertFalse(os.path.exists(res.file.path))
+
+    def test_empty_trash_validates_ids(self):
+        res, icon = self.make_file('a.txt')
+        trash_icons([icon])
+        for ids in (['x'], [None], 'x'):
+            response = self.client.post('/api/desktop/empty_trash/', {'ids': ids}, format='json')
+            self.assertEqual(response.status_code, 400, ids)
+        response = self.client.post('/api/desktop/empty_trash/', {'ids': [str(icon.id)]}, format='json')
+        self.assertEqual(response.data['count'], 1)
+
+    def test_purge_ignores_links_outside_h5apps(self):
+        sentinel = os.path.join(self.media_root, 'resources', 'keep.txt')
+        os.makedirs(os.path.dirname(sentinel))
+        with open(sentinel, 'w') as f:
+            f.write('keep')
+        os.makedirs(os.path.join(self.media_root, 'h5apps', 'App_1'))
+        icons = []
+        for link in ('/media/h5apps/../', '/media/h5apps/..', '/media/h5apps/App_1/index.html'):
+            res = Resource.objects.create(title='app', author=self.user, kind='link', link=link)
+            icons.append(DesktopIcon.objects.create(user=self.user, title='app', content_object=res))
+
+        self.purge(icons)
+
+        self.assertTrue(os.path.exists(sentinel))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'h5apps', 'App_1')))
+        self.assertFalse(Resource.all_objects.filter(author=self.user).exists())
+
+
+class CopyTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('copy_user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.folder = Category.objects.create(name='项目')
+        self.folder_icon = DesktopIcon.objects.create(user=self.user, title='项目', content_object=self.folder)
+        self.sub = Category.objects.create(name='子目录', parent=self.folder)
+        DesktopIcon.objects.create(user=self.user, title='子目录', content_object=self.sub, parent_folder=self.folder)
+        self.res = Resource.objects.create(title='a.txt', author=self.user, category=self.sub,
+                                           file=SimpleUploadedFile('a.txt', b'12345'))
+        DesktopIcon.objects.create(user=self.user, title='a.txt', content_object=self.res, parent_folder=self.sub)
+        self.outside = Resource.objects.create(title='b.txt', author=self.user, file_size=7)
+        DesktopIcon.objects.create(user=self.user, title='b', content_object=self.outside, is_shortcut=True,
+                                   parent_folder=self.folder)
+
+    def copied_tree(self, root):
+        """[(层级, 标题, 是否快捷方式, 指向的对象)]"""
+        result, frontier, depth = [], [root], 0
+        while frontier:
+            result += [(depth, icon.title, icon.is_shortcut, icon.object_id) for icon in frontier]
+            folder_ids = [icon.object_id for icon in frontier
+                          if icon.target_type == 'category' and not icon.is_shortcut]
+            frontier = list(DesktopIcon.objects.filter(parent_folder_id__in=folder_ids).order_by('title'))
+            depth += 1
+        return result
+
+    def test_copy_folder_into_itself_duplicates_structure(self):
+        response = self.client.post('/api/desktop/copy/', {
+            'ids': [self.folder_icon.id], 'parent_id': self.folder.id,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        root = DesktopIcon.objects.get(id=response.data['items'][0]['id'])
+        self.assertEqual(root.parent_folder_id, self.folder.id)
+
+        tree = self.copied_tree(root)
+        self.assertEqual([(d, t, s) for d, t, s, _ in tree],
+                         [(0, '项目', False), (1, 'b', True), (1, '子目录', False), (2, 'a.txt', False)])
+        new_folder, shortcut, new_sub, new_file = (obj for _, _, _, obj in tree)
+        self.assertNotIn(new_folder, (self.folder.id, self.sub.id))
+        self.assertEqual(Category.objects.get(id=new_sub).parent_id, new_folder)
+        # 快捷方式仍指向原资源；复制出的资源与原资源共享同一个文件
+        self.assertEqual(shortcut, self.outside.id)
+        copied = Resource.objects.get(id=new_file)
+        self.assertNotEqual(copied.id, self.res.id)
+        self.assertEqual((copied.file.name, copied.category_id), (self.res.file.name, new_sub))
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 5)
+        self.assertEqual(Category.objects.get(id=new_sub).file_count, 1)
+
+    def test_duplicate_in_place_and_foreign_target(self):
+        other = User.objects.create_user('copy_other')
+        foreign = Category.objects.create(name='别人的')
+        DesktopIcon.objects.create(user=other, title='别人的', content_object=foreign)
+        response = self.client.post('/api/desktop/copy/', {
+            'ids': [self.folder_icon.id], 'parent_id': foreign.id,
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.post(f'/api/desktop/{self.folder_icon.id}/duplicate/')
+        self.assertEqual(response.data['title'], '项目 - 副本')
+        self.assertNotEqual((response.data['x'], response.data['y']), (self.folder_icon.x, self.folder_icon.y))
+
+
+class PortabilityTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('export_user')
+        self.target = User.objects.create_user('import_user')
+        self.client = APIClient()
+
+    def import_file(self, user, data, name='desktop.ndjson'):
+        self.client.force_authenticate(user)
+        return self.client.post('/api/desktop/import/', {'file': SimpleUploadedFile(name, data)})
+
+    def manifest(self, *records):
+        header = {'type': 'header', 'version': 1, 'files': False}
+        return b''.join(json.dumps(r).encode() + b'\n' for r in (header, *records))
+
+    def test_round_trip_with_files(self):
+        folder = Category.objects.create(name='资料')
+        DesktopIcon.objects.create(user=self.user, title='资料', content_object=folder, x=100, y=0)
+        res = Resource.objects.create(title='a.txt', author=self.user, category=folder,
+                                      file=SimpleUploadedFile('a.txt', b'hello world'))
+        DesktopIcon.objects.create(user=self.user, title='a.txt', content_object=res, parent_folder=folder, x=0, y=0)
+        Comment.objects.create(user=self.user, resource=res, content='好')
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/desktop/export/', {'files': 1})
+        data = b''.join(response.streaming_content)
+
+        response = self.import_file(self.target, data, 'desktop.tar')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['folders'], response.data['resources'], response.data['icons'],
+                          response.data['files'], response.data['comments']), (1, 1, 2, 1, 1))
+
+        folder_icon = DesktopIcon.objects.get(user=self.target, target_type='category')
+        file_icon = DesktopIcon.objects.get(user=self.target, target_type='resource')
+        self.assertEqual((folder_icon.title, folder_icon.x), ('资料', 100))
+        self.assertEqual(file_icon.parent_folder_id, folder_icon.object_id)
+        copied = Resource.objects.get(id=file_icon.object_id)
+        self.assertEqual(copied.author, self.target)
+        self.assertEqual(copied.category_id, folder_icon.object_id)
+        self.assertNotEqual(copied.file.name, res.file.name)
+        with copied.file.open('rb') as f:
+            self.assertEqual(f.read(), b'hello world')
+        self.assertEqual((copied.file_size, copied.content_hash), (res.file_size, res.content_hash))
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.storage_used, 11)
+
+    def test_tar_sizes_are_measured_not_declared(self):
+        manifest = json.dumps({'type': 'header', 'version': 1, 'files': True}) + '\n' + json.dumps({
+            'type': 'resource', 'id': 1, 'title': 'big.bin', 'file': 'files/1/big.bin',
+            'file_size': 0, 'content_hash': 'f' * 64, 'mime_type': 'text/plain',
+        }) + '\n'
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as archive:
+            for name, content in (('manifest.ndjson', manifest.encode()), ('files/1/big.bin', b'\0' * 1000)):
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+        data = buf.getvalue()
+
+        response = self.import_file(self.target, data, 'desktop.tar')
+        self.assertEqual(response.status_code, 200, response.data)
+        res = Resource.objects.get(author=self.target)
+        self.assertEqual(res.file_size, 1000)
+        self.assertNotEqual(res.content_hash, 'f' * 64)
+        self.assertEqual(res.mime_type, 'application/octet-stream')
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.storage_used, 1000)
+
+        # 实际写入的字节数超出剩余配额时整体回滚，不留下文件
+        User.objects.filter(id=self.target.id).update(storage_quota=1500)
+        self.target.refresh_from_db()
+        with self.assertRaises(QuotaExceeded):
+            import_stream(self.target, io.BytesIO(data))
+        self.assertEqual(Resource.all_objects.filter(author=self.target).count(), 1)
+        files = [name for _, _, names in os.walk(self.media_root) for name in names]
+        self.assertEqual(len(files), 1)
+
+    def test_content_length_precheck(self):
+        User.objects.filter(id=self.target.id).update(storage_quota=10)
+        self.target.refresh_from_db()
+        self.assertEqual(self.import_file(self.target, self.manifest()).status_code, 413)
+
+    def test_untrusted_links_are_validated(self):
+        links = ['/media/h5apps/../', 'https://example.com/h5apps/x/', 'javascript:alert(1)', 'https://example.com/a']
+        data = self.manifest(*[
+            {'type': 'resource', 'id': i, 'title': 'l', 'kind': 'link', 'link': link} for i, link in enumerate(links)
+        ])
+        response = self.import_file(self.target, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['skipped'], 3)
+        kept = Resource.objects.filter(author=self.target, link__isnull=False).values_list('link', flat=True)
+        self.assertEqual(list(kept), ['https://example.com/a'])
+
+    def test_manifest_cannot_reference_other_users_files(self):
+        res = Resource.objects.create(title='a.txt', author=self.user, file=SimpleUploadedFile('a.txt', b'secret'))
+        data = self.manifest({'type': 'resource', 'id': 1, 'title': 'x', 'file': res.file.name, 'file_size': 0})
+        response = self.import_file(self.target, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Resource.objects.get(author=self.target).file)
+
+
+@override_settings(DESKTOP_GRID_COLUMNS=4, DESKTOP_GRID_STEP=100)
+class PlacementTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('placement_user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def positions(self, parent=None):
+        return list(DesktopIcon.objects.filter(user=self.user, parent_folder=parent).values_list('x', 'y'))
+
+    def test_new_icons_fill_free_cells_without_collisions(self):
+        # 已占用第 0、2 格 (第 2 格的坐标不在格点上，按就近的格子计算)
+        DesktopIcon.objects.create(user=self.user, title='a', x=0, y=0)
+        DesktopIcon.objects.create(user=self.user, title='b', x=210, y=-10)
+        for i in range(4):
+            response = self.client.post('/api/desktop/create_folder/', {'name': f'新建{i}'}, format='json')
+            self.assertLess(response.status_code, 400)
+        positions = self.positions()
+        self.assertEqual(len(set(positions)), len(positions))
+        self.assertEqual(positions[2:], [(100, 0), (300, 0), (0, 100), (100, 100)])
+
+        # 客户端指定坐标时按原样使用
+        self.client.post('/api/desktop/create_link/', {'title': 'l', 'link': 'https://example.com', 'x': 5, 'y': 6},
+                         format='json')
+        self.assertEqual(self.positions()[-1], (5, 6))
+
+    def test_placement_is_per_folder(self):
+        folder = Category.objects.create(name='目录')
+        DesktopIcon.objects.create(user=self.user, title='目录', content_object=folder, x=0, y=0)
+        self.client.post('/api/desktop/create_folder/', {'name': '子', 'parent_id': folder.id}, format='json')
+        self.assertEqual(self.positions(folder), [(0, 0)])
+
+    def test_arrange_puts_folders_first_in_name_order(self):
+        folder = Category.objects.create(name='目录')
+        DesktopIcon.objects.create(user=self.user, title='z 目录', content_object=folder, x=300, y=300)
+        for title, x in (('b', 0), ('a', 100), ('c', 200)):
+            DesktopIcon.objects.create(user=self.user, title=title, x=x, y=500)
+
+        response = self.client.post('/api/desktop/arrange/', {'order_by': 'name'}, format='json')
+        self.assertEqual(response.data['moved'], 4)
+        layout = dict(DesktopIcon.objects.filter(user=self.user).values_list('title', 'x'))
+        self.assertEqual(layout, {'z 目录': 0, 'a': 100, 'b': 200, 'c': 300})
+        self.assertEqual(set(self.positions()), {(0, 0), (100, 0), (200, 0), (300, 0)})
+        # 已经排好时不再移动
+        response = self.client.post('/api/desktop/arrange/', {'order_by': 'name'}, format='json')
+        self.assertEqual(response.data['moved'], 0)
+
+
+class PreviewTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('preview_user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make(self, name, content):
+        res = Resource.objects.create(title=name, author=self.user, file=SimpleUploadedFile(name, content))
+        icon = DesktopIcon.objects.create(user=self.user, title=name, content_object=res)
+        return res, icon
+
+    def preview(self, icon, **headers):
+        return self.client.get(f'/api/desktop/{icon.id}/preview/', **headers)
+
+    def test_extract_preview(self):
+        data = extract_preview(io.BytesIO('第一行\r\n第二行'.encode('gb18030')), 'a.txt')
+        self.assertEqual(data, {'snippet': '第一行\n第二行', 'encoding': 'gb18030', 'line_count': 2,
+                                'truncated': False})
+        html = b'<html><head><title>t</title><style>p{}</style></head><body><p>Hello <b>world</b></p>' \
+               b'<script>alert(1)</script><div>&amp; more</div></body></html>'
+        self.assertEqual(extract_preview(io.BytesIO(html), 'a.html')['snippet'], 'Hello world\n& more')
+        self.assertEqual(extract_preview(io.BytesIO(codecs.BOM_UTF8 + 'é'.encode()), 'a.txt')['encoding'], 'utf-8')
+
+        with override_settings(DOC_PREVIEW_BYTES=10, DOC_PREVIEW_CHARS=3):
+            # 截断处切开的多字节字符被丢弃，而不是变成乱码或退回 latin-1
+            data = extract_preview(io.BytesIO('一二三四五'.encode('utf-8')), 'a.txt')
+        self.assertEqual((data['snippet'], data['encoding'], data['truncated']), ('一二三', 'utf-8', True))
+
+    def test_replaced_file_gets_new_preview(self):
+        res, icon = self.make('a.txt', b'old text')
+        response = self.preview(icon)
+        self.assertEqual(response.data['snippet'], 'old text')
+        etag = response['ETag']
+        self.assertEqual(self.preview(icon, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        res.file = SimpleUploadedFile('a.txt', b'new text')
+        res.save()
+        response = self.preview(icon, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['snippet'], 'new text')
+
+    def test_preview_ignores_client_content_hash(self):
+        other = User.objects.create_user('preview_other')
+        victim = Resource.objects.create(title='v.txt', author=other, file=SimpleUploadedFile('v.txt', b'victim'))
+        get_preview(victim)
+        res, icon = self.make('a.txt', b'mine')
+        # 即使记录的哈希与别人的文件相同，也只会读到自己的文件内容
+        Resource.objects.filter(id=res.id).update(content_hash=victim.content_hash)
+        self.assertEqual(self.preview(icon).data['snippet'], 'mine')
+
+    def test_preview_errors(self):
+        folder = Category.objects.create(name='目录')
+        folder_icon = DesktopIcon.objects.create(user=self.user, title='目录', content_object=folder)
+        self.assertEqual(self.preview(folder_icon).status_code, 400)
+        _, icon = self.make('a.png', b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(self.preview(icon).status_code, 415)
+        res, icon = self.make('gone.txt', b'x')
+        os.remove(res.file.path)
+        self.assertEqual(self.preview(icon).status_code, 404)
+
+
+class ArchiveTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('archive_user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make(self, name, content):
+        res = Resource.objects.create(title=name, author=self.user, file=SimpleUploadedFile(name, content))
+        icon = DesktopIcon.objects.create(user=self.user, title=name, content_object=res)
+        return res, icon
+
+    def listing(self, icon, **headers):
+        return self.client.get(f'/api/desktop/{icon.id}/archive/', **headers)
+
+    def entry(self, icon, name):
+        response = self.client.get(f'/api/desktop/{icon.id}/archive/entry/', {'name': name})
+        if response.status_code == 200:
+            return b''.join(response.streaming_content)
+        return response.status_code
+
+    def zip_bytes(self, files):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in files.items():
+                archive.writestr(name, data)
+        return buf.getvalue()
+
+    def tar_bytes(self, files, mode='w'):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode=mode) as archive:
+            for name, data in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        return buf.getvalue()
+
+    def test_zip(self):
+        _, icon = self.make('a.zip', self.zip_bytes({'dir/a.txt': b'x' * 1000, 'b.txt': b'hello'}))
+        data = self.listing(icon).data
+        self.assertEqual(data['format'], 'zip')
+        self.assertEqual({e['name']: e['size'] for e in data['entries']}, {'dir/a.txt': 1000, 'b.txt': 5})
+        self.assertEqual(self.entry(icon, 'dir/a.txt'), b'x' * 1000)
+        self.assertEqual(self.entry(icon, 'missing.txt'), 404)
+
+    def test_tar_and_tar_gz(self):
+        files = {'a.txt': b'tar content', 'sub/b.txt': b'more'}
+        for name, mode in (('a.tar', 'w'), ('a.tar.gz', 'w:gz')):
+            _, icon = self.make(name, self.tar_bytes(files, mode))
+            data = self.listing(icon).data
+            self.assertEqual(data['format'], 'tar')
+            self.assertEqual([e['name'] for e in data['entries']], ['a.txt', 'sub/b.txt'])
+            self.assertEqual(self.entry(icon, 'sub/b.txt'), b'more')
+            self.assertEqual(self.entry(icon, 'c.txt'), 404)
+
+    def test_gz(self):
+        buf = io.BytesIO()
+        with gzip.GzipFile('report.csv', 'wb', fileobj=buf, mtime=0) as f:
+            f.write(b'a,b\n' * 100)
+        _, icon = self.make('report.csv.gz', buf.getvalue())
+        data = self.listing(icon).data
+        self.assertEqual(data['format'], 'gz')
+        self.assertEqual([(e['name'], e['size']) for e in data['entries']], [('report.csv', 400)])
+        self.assertEqual(self.entry(icon, 'report.csv'), b'a,b\n' * 100)
+        self.assertEqual(self.entry(icon, 'other.csv'), 404)
+
+    def test_7z_without_py7zr(self):
+        _, icon = self.make('a.7z', b'7z\xbc\xaf\x27\x1c' + b'\x00' * 32)
+        with mock.patch('core.archives.py7zr', None):
+            self.assertEqual(self.listing(icon).status_code, 415)
+        self.assertEqual(self.entry(icon, 'a.txt'), 415)
+
+    def test_corrupt_archives(self):
+        _, icon = self.make('bad.zip', b'PK\x03\x04' + b'\x00' * 100)
+        self.assertEqual(self.listing(icon).status_code, 415)
+        self.assertEqual(self.entry(icon, 'a.txt'), 415)
+        _, icon = self.make('bad.tar.gz', b'\x1f\x8b\x08\x00' + b'\x00' * 100)
+        self.assertEqual(self.listing(icon).status_code, 415)
+        self.assertEqual(self.entry(icon, 'a.txt'), 415)
+        _, icon = self.make('bad.txt', b'plain text')
+        self.assertEqual(self.listing(icon).status_code, 415)
+
+    def test_encrypted_and_unsupported_zip_entries(self):
+        data = bytearray(self.zip_bytes({'a.txt': b'secret'}))
+        local, central = data.find(b'PK\x03\x04'), data.find(b'PK\x01\x02')
+        encrypted = bytearray(data)
+        encrypted[local + 6] |= 0x01
+        encrypted[central + 8] |= 0x01
+        unsupported = bytearray(data)
+        unsupported[local + 8:local + 10] = unsupported[central + 10:central + 12] = (99).to_bytes(2, 'little')
+        for name, content in (('enc.zip', encrypted), ('aes.zip', unsupported)):
+            _, icon = self.make(name, bytes(content))
+            # 列目录只读中央目录，仍可列出；提取时返回 415 而不是 500
+            self.assertEqual(self.listing(icon).status_code, 200)
+            self.assertEqual(self.entry(icon, 'a.txt'), 415)
+
+    def test_listing_follows_replaced_file(self):
+        res, icon = self.make('a.zip', self.zip_bytes({'old.txt': b'1'}))
+        response = self.listing(icon)
+        etag = response['ETag']
+        self.assertEqual(self.listing(icon, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        res.file = SimpleUploadedFile('a.zip', self.zip_bytes({'new.txt': b'2'}))
+        res.save()
+        response = self.listing(icon, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([e['name'] for e in response.data['entries']], ['new.txt'])
+
+        # 记录的 content_hash 被改成别的文件的哈希，也不会读到别人的列表
+        other = User.objects.create_user('archive_other')
+        victim = Resource.objects.create(title='v.zip', author=other,
+                                         file=SimpleUploadedFile('v.zip', self.zip_bytes({'victim.txt': b'v'})))
+        list_entries(victim)
+        Resource.objects.filter(id=res.id).update(content_hash=victim.content_hash)
+        self.assertEqual([e['name'] for e in self.listing(icon).data['entries']], ['new.txt'])
+
+
+class TargetKindMigrationTests(TransactionTestCase):
+    """0012 回填 target_kind：指向已删除资源的图标不能让迁移失败"""
+
+    def test_backfill_with_dangling_resource_icon(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('core', '0011_recentaccess')])
+        old_apps = executor.loader.project_state([('core', '0011_recentaccess')]).apps
+        ContentType = old_apps.get_model('contenttypes', 'ContentType')
+        resource_ct = ContentType.objects.get_or_create(app_label='core', model='resource')[0]
+        user = old_apps.get_model('core', 'User').objects.create(username='migrate_user')
+        Resource = old_apps.get_model('core', 'Resource')
+        res = Resource.objects.create(title='a.png', author_id=user.id, kind='image')
+        DesktopIcon = old_apps.get_model('core', 'DesktopIcon')
+        live = DesktopIcon.objects.create(user_id=user.id, title='a', content_type_id=resource_ct.id, object_id=res.id)
+        dangling = DesktopIcon.objects.create(user_id=user.id, title='b', content_type_id=resource_ct.id,
+                                              object_id=res.id + 1000)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([('core', '0012_desktopicon_target_kind')])
+        new_apps = executor.loader.project_state([('core', '0012_desktopicon_target_kind')]).apps
+        kinds = dict(new_apps.get_model('core', 'DesktopIcon').objects.values_list('id', 'target_kind'))
+        self.assertEqual(kinds, {live.id: 'image', dangling.id: ''})
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+class EventStreamTests(TestCase):
+    """SSE 推送：路由、心跳、断开与取消，以及 broker 的分发"""
+
+    def setUp(self):
+        token = AccessToken()
+        token['user_id'] = 4242
+        self.token = str(token)
+        self.router = EventStreamRouter(self.inner_app)
+
+    async def inner_app(self, scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+
+    def open_stream(self, token, path='/api/events/'):
+        sent = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'path': path, 'query_string': f'token={token}'.encode()}
+        task = asyncio.ensure_future(self.router(scope, receive, send))
+        return task, sent, disconnect
+
+    @staticmethod
+    def body(sent):
+        return ''.join(m['body'].decode() for m in sent if m['type'] == 'http.response.body')
+
+    async def test_routing_and_authentication(self):
+        task, sent, _ = self.open_stream('bad')
+        await task
+        self.assertEqual(sent[0]['status'], 401)
+        task, sent, _ = self.open_stream(self.token, path='/api/desktop/')
+        await task
+        self.assertEqual(sent[0]['status'], 204)
+
+    async def test_events_survive_heartbeats(self):
+        with self.settings(SSE_HEARTBEAT_SECONDS=0.01):
+            task, sent, disconnect = self.open_stream(self.token)
+            while not broker.connection_count():
+                await asyncio.sleep(0.001)
+            broker.dispatch(4242, {'type': 'changed', 'version': 1})
+            broker.dispatch(4243, {'type': 'changed', 'version': 99})
+            await asyncio.sleep(0.05)
+            broker.dispatch(4242, {'type': 'changed', 'version': 2})
+            await asyncio.sleep(0.02)
+            disconnect.set()
+            await task
+
+        body = self.body(sent)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn(': ping', body)
+        self.assertEqual([json.loads(line[6:])['version'] for line in body.splitlines() if line.startswith('data:')],
+                         [1, 2])
+        self.assertEqual(broker.connection_count(), 0)
+
+    async def test_cancellation_propagates(self):
+        task, sent, _ = self.open_stream(self.token)
+        while not broker.connection_count():
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(broker.connection_count(), 0)
+
+    async def test_slow_subscriber_gets_resync(self):
+        with self.settings(EVENTS_QUEUE_SIZE=2):
+            sub = broker.subscribe(4242)
+        try:
+            for version in range(3):
+                broker.dispatch(4242, {'type': 'changed', 'version': version})
+            await asyncio.sleep(0)
+            self.assertEqual(sub.queue.get_nowait(), {'type': 'resync'})
+            self.assertTrue(sub.queue.empty())
+        finally:
+            broker.unsubscribe(sub)
+
+    def test_redis_backend(self):
+        with mock.patch.dict(sys.modules, {'redis': None}):
+            with self.assertRaises(ImproperlyConfigured):
+                RedisBackend(broker)
+
+        published = []
+
+        class PubSub:
+            async def subscribe(self, channel):
+                self.channel = channel
+
+            async def listen(self):
+                yield {'type': 'subscribe', 'data': 1}
+                for data in published:
+                    yield {'type': 'message', 'data': data}
+
+        fake_redis = types.ModuleType('redis')
+        fake_redis.Redis = mock.Mock()
+        fake_redis.Redis.from_url.return_value.publish.side_effect = lambda channel, data: published.append(data)
+        fake_redis.asyncio = types.ModuleType('redis.asyncio')
+        fake_redis.asyncio.Redis = mock.Mock()
+        fake_redis.asyncio.Redis.from_url.return_value.pubsub.return_value = PubSub()
+        target = mock.Mock()
+        with mock.patch.dict(sys.modules, {'redis': fake_redis, 'redis.asyncio': fake_redis.asyncio}):
+            backend = RedisBackend(target)
+            backend.publish(7, {'type': 'changed'})
+            asyncio.run(backend.run())
+        target.dispatch.assert_called_once_with(7, {'type': 'changed'})
+
+
+class StaticDeliveryTests(TestCase):
+    """外壳与静态资源：按 Accept-Encoding 选择压缩版本，ETag 重新验证，按文件名决定缓存策略"""
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(STATIC_ROOT=self.static_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+        self.js = b'console.log("hello");\n' * 100
+        for name in ('app.0123456789ab.js', 'app.js'):
+            with open(os.path.join(self.static_root, name), 'wb') as f:
+                f.write(self.js)
+        with open(os.path.join(self.static_root, 'tiny.css'), 'wb') as f:
+            f.write(b'a{}')
+
+    def test_compress_static(self):
+        out = io.StringIO()
+        call_command('compress_static', stdout=out)
+        names = set(os.listdir(self.static_root))
+        self.assertIn('app.js.gz', names)
+        self.assertIn('app.0123456789ab.js.gz', names)
+        # 太小的文件不压缩
+        self.assertNotIn('tiny.css.gz', names)
+        with gzip.open(os.path.join(self.static_root, 'app.js.gz')) as f:
+            self.assertEqual(f.read(), self.js)
+        out = io.StringIO()
+        call_command('compress_static', stdout=out)
+        self.assertIn('已生成 0 个压缩文件', out.getvalue())
+
+    def test_static_negotiation_and_caching(self):
+        call_command('compress_static', stdout=io.StringIO())
+        with open(os.path.join(self.static_root, 'app.js.br'), 'wb') as f:
+            f.write(b'brotli-bytes')
+
+        response = self.client.get('/static/app.js', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(b''.join(response.streaming_content), b'brotli-bytes')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300, must-revalidate')
+
+        response = self.client.get('/static/app.js', HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.js)
+
+        response = self.client.get('/static/app.js', HTTP_ACCEPT_ENCODING='identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.js)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        etag = response['ETag']
+        response = self.client.get('/static/app.js', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300, must-revalidate')
+
+        response = self.client.get('/static/app.0123456789ab.js', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/static/missing.js').status_code, 404)
+
+    def test_shell(self):
+        response = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        html = gzip.decompress(response.content)
+
+        response = self.client.get('/')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, html)
+
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=response['ETag'].removeprefix('W/'))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+
+class InstrumentationTests(TestCase):
+    """Server-Timing 只在配置允许时输出；慢 SQL 写入 core.perf 日志"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('perf_user')
+        self.staff = User.objects.create_user('perf_staff', is_staff=True)
+
+    def get(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client.get('/api/desktop/')
+
+    def test_server_timing_off_by_default(self):
+        with override_settings(PERF_SERVER_TIMING=False):
+            for user in (None, self.user, self.staff):
+                self.assertFalse(self.get(user).has_header('Server-Timing'))
+
+    @override_settings(PERF_SERVER_TIMING='staff')
+    def test_server_timing_for_staff_only(self):
+        self.assertFalse(self.get().has_header('Server-Timing'))
+        self.assertFalse(self.get(self.user).has_header('Server-Timing'))
+        header = self.get(self.staff)['Server-Timing']
+        self.assertRegex(header, r'^db;desc="\d+ queries";dur=[\d.]+, cache;desc="\d+ hit \d+ miss", total;dur=')
+
+    @override_settings(PERF_SERVER_TIMING=True)
+    def test_server_timing_for_everyone(self):
+        self.assertTrue(self.get().has_header('Server-Timing'))
+
+    @override_settings(PERF_SLOW_QUERY_MS=0, PERF_SLOW_REQUEST_MS=60000, PERF_SLOW_LOG_SAMPLE_RATE=1.0)
+    def test_slow_queries_are_logged(self):
+        with self.assertLogs('core.perf', 'WARNING') as logs:
+            self.get(self.user)
+        record = json.loads(logs.records[0].getMessage().removeprefix('slow_request '))
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_count'], 0)
+        self.assertTrue(record['slow_queries'])
+        self.assertIn('SELECT', record['slow_queries'][0]['sql'])
+
+    @override_settings(PERF_SLOW_QUERY_MS=60000, PERF_SLOW_REQUEST_MS=60000)
+    def test_fast_requests_log_at_info(self):
+        with self.assertLogs('core.perf', 'INFO') as logs:
+            self.get(self.user)
+        self.assertEqual([r.levelname for r in logs.records], ['INFO'])
+        self.assertTrue(logs.records[0].getMessage().startswith('request '))
+
+
+@override_settings(HEALTH_CACHE_SECONDS=0, HEALTH_MIN_FREE_BYTES=0, METRICS_TOKEN='')
+class HealthMetricsTests(TestCase):
+
+    SAMPLE_RE = r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_]+="[^"]*"(,[a-zA-Z_]+="[^"]*")*\})? (-?[0-9.e+-]+|\+Inf)$'
+
+    def setUp(self):
+        health._cached['result'] = None
+        self.addCleanup(health._cached.update, {'result': None})
+
+    def test_health_status_codes(self):
+        response = self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'healthy')
+        self.assertEqual(set(response.json()['checks']), {'database', 'disk', 'cache', 'queues'})
+
+        with override_settings(HEALTH_MIN_FREE_BYTES=2 ** 62):
+            response = self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'degraded')
+        self.assertFalse(response.json()['checks']['disk']['ok'])
+
+    def test_database_down(self):
+        down = mock.Mock()
+        down.cursor.side_effect = OperationalError('database is locked')
+        with mock.patch('core.health.connection', down):
+            response = self.client.get('/api/health/')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json()['status'], 'unhealthy')
+            self.assertEqual(response.json()['checks']['database'], {'ok': False, 'error': 'database is locked'})
+            body = self.client.get('/metrics').content.decode()
+        self.assertIn('\nzmg_db_up 0\n', body)
+        self.assertIn('\nzmg_health_up 0\n', body)
+        self.assertNotIn('zmg_db_latency_seconds', body)
+
+    def test_metrics_format(self):
+        self.client.get('/api/health/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        for line in lines:
+            if line.startswith('#'):
+                self.assertRegex(line, r'^# (HELP|TYPE) [a-zA-Z_:][a-zA-Z0-9_:]* \S')
+            else:
+                self.assertRegex(line, self.SAMPLE_RE)
+        self.assertIn('# TYPE zmg_request_duration_seconds histogram', lines)
+        self.assertIn('zmg_db_up 1', lines)
+        self.assertIn('zmg_health_up 1', lines)
+        route = 'route="health_check",method="GET"'
+        self.assertIn(f'zmg_request_duration_seconds_bucket{{{route},le="+Inf"}} '
+                      f'{self.sample(lines, f"zmg_request_duration_seconds_count{{{route}}}")}', lines)
+        self.assertGreaterEqual(self.sample(lines, f'zmg_requests_total{{{route},status="200"}}'), 1)
+
+    @staticmethod
+    def sample(lines, name):
+        return next(int(line.rsplit(' ', 1)[1]) for line in lines if line.startswith(name + ' '))
+
+    def test_metrics_access(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+            response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.5', HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(response.status_code, 200)
+
+
+class BootstrapTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('bootstrap_user')
+        self.icon = DesktopIcon.objects.create(user=self.user, title='旧名称')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_etag_revalidation(self):
+        response = self.client.get('/api/bootstrap/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        etag = response['ETag']
+        self.assertEqual([i['title'] for i in response.data['data']['desktop']], ['旧名称'])
+
+        response = self.client.get('/api/bootstrap/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+        self.assertEqual(self.client.get('/api/bootstrap/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+        # 桌面变化后旧 ETag 不再匹配
+        response = self.client.patch(f'/api/desktop/{self.icon.id}/', {'title': '新名称'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/bootstrap/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([i['title'] for i in response.data['data']['desktop']], ['新名称'])
+
+        # 其他用户的 ETag 不同，不会命中
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('bootstrap_other'))
+        self.assertEqual(other.get('/api/bootstrap/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class FolderTreeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tree_user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def folder(self, name, parent=None, user=None):
+        cat = Category.objects.create(name=name)
+        DesktopIcon.objects.create(user=user or self.user, title=name, content_object=cat, parent_folder=parent)
+        return cat
+
+    def names(self, nodes):
+        return [(node['name'], self.names(node['children'])) for node in nodes]
+
+    def test_depth_and_root(self):
+        a = self.folder('A')
+        b = self.folder('B', a)
+        c = self.folder('C', b)
+        self.folder('D', c)
+        DesktopIcon.objects.create(user=self.user, title='f.txt', parent_folder=b)
+
+        tree = self.client.get('/api/categories/tree/').data
+        self.assertEqual(self.names(tree), [('A', [('B', [('C', [('D', [])])])])])
+
+        tree = self.client.get('/api/categories/tree/', {'depth': 2}).data
+        self.assertEqual(self.names(tree), [('A', [('B', [])])])
+        # 截断处仍保留计数，客户端知道还能展开
+        node = tree[0]['children'][0]
+        self.assertEqual((node['folder_count'], node['file_count']), (1, 1))
+
+        tree = self.client.get('/api/categories/tree/', {'root': b.id, 'depth': 1}).data
+        self.assertEqual(self.names(tree), [('B', [])])
+        # 截断的是副本，缓存中的完整树不受影响
+        tree = self.client.get('/api/categories/tree/', {'root': b.id}).data
+        self.assertEqual(self.names(tree), [('B', [('C', [('D', [])])])])
+
+        for params in ({'depth': 0}, {'depth': 'x'}, {'root': 'x'}):
+            self.assertEqual(self.client.get('/api/categories/tree/', params).status_code, 400)
+
+    def test_other_users_folders_excluded(self):
+        mine = self.folder('我的')
+        other = User.objects.create_user('tree_other')
+        theirs = self.folder('别人的', user=other)
+        # 别人把文件夹放进与我共用的 Category 中
+        self.folder('别人的子目录', parent=mine, user=other)
+
+        tree = self.client.get('/api/categories/tree/').data
+        self.assertEqual(self.names(tree), [('我的', [])])
+        self.assertEqual(tree[0]['folder_count'], 0)
+        self.assertEqual(self.client.get('/api/categories/tree/', {'root': theirs.id}).status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class GenerateDataTests(MediaTestCase):
+
+    def generate(self, *args):
+        call_command('generate_data', '--depth=2', '--branching=2', '--files-per-user=5', *args,
+                     stdout=io.StringIO())
+
+    def test_generate_and_clear_in_batches(self):
+        self.generate('--users=5', '--chunk=2', '--file-bytes=16')
+        self.generate('--users=1', '--prefix=other')
+        synth = User.objects.filter(username__startswith='synth_')
+        self.assertEqual(synth.count(), 5)
+        self.assertEqual(Category.objects.count(), 6 * (2 + 4))
+        self.assertEqual(Resource.objects.filter(author__in=synth).count(), 25)
+        self.assertEqual(DesktopIcon.objects.filter(user__in=synth).count(), 5 * (6 + 5))
+        # 用量由 reconcile_storage 按实际数据统计
+        self.assertEqual(set(synth.values_list('storage_used', flat=True)), {80})
+        self.assertTrue(os.path.isdir(os.path.join(self.media_root, 'synthetic', 'synth')))
+
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('generate_data', '--users=0', '--clear', '--chunk=2', stdout=io.StringIO())
+        # 每批只删除 2 个用户的数据
+        deletes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('DELETE FROM "core_user"')]
+        self.assertEqual(len(deletes), 3)
+        self.assertFalse(synth.exists())
+        self.assertFalse(Resource.all_objects.filter(author__username__startswith='synth_').exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'synthetic', 'synth')))
+        # 其他前缀的数据不受影响
+        self.assertEqual(Category.objects.count(), 6)
+        self.assertEqual(User.objects.filter(username__startswith='other_').count(), 1)
+
+
+class ImportTreeTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('import_tree_user')
+        self.source = os.path.join(tempfile.mkdtemp(prefix='zmg-test-src-'), '课件')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.source), True)
+        self.files = {'a.txt': b'aaaa', 'sub/b.txt': b'bb', 'sub/c.txt': b'c', 'sub/deep/d.txt': b'dddd',
+                      '.hidden': b'h'}
+        for rel, data in self.files.items():
+            path = os.path.join(self.source, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        self.journal = os.path.join(self.media_root, 'journal.jsonl')
+
+    def run_import(self, *args):
+        out = io.StringIO()
+        call_command('import_tree', self.source, '--user=import_tree_user', f'--journal={self.journal}',
+                     '--workers=1', *args, stdout=out)
+        return out.getvalue()
+
+    def tree(self):
+        """{(所在文件夹路径, 标题): 图标数}"""
+        names = {}
+        icons = list(DesktopIcon.objects.filter(user=self.user).order_by('id'))
+        by_folder = {icon.object_id: icon for icon in icons if icon.target_type == 'category'}
+
+        def path(folder_id):
+            if folder_id is None:
+                return ''
+            icon = by_folder[folder_id]
+            parent = path(icon.parent_folder_id)
+            return f'{parent}/{icon.title}' if parent else icon.title
+        for icon in icons:
+            key = (path(icon.parent_folder_id), icon.title)
+            names[key] = names.get(key, 0) + 1
+        return names
+
+    def assert_imported(self):
+        expected = {('', '课件'): 1, ('课件', 'a.txt'): 1, ('课件', 'sub'): 1, ('课件/sub', 'b.txt'): 1,
+                    ('课件/sub', 'c.txt'): 1, ('课件/sub', 'deep'): 1, ('课件/sub/deep', 'd.txt'): 1}
+        self.assertEqual(self.tree(), expected)
+        self.assertEqual(Resource.objects.filter(author=self.user).count(), 4)
+        for res in Resource.objects.filter(author=self.user):
+            with res.file.open('rb') as f:
+                self.assertEqual(f.read(), next(v for k, v in self.files.items() if k.endswith(res.title)))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 11)
+
+    def test_import(self):
+        output = self.run_import()
+        self.assertIn('导入完成：4 个文件', output)
+        self.assert_imported()
+        folder = Category.objects.get(name='sub')
+        self.assertEqual((folder.file_count, folder.size_bytes), (2, 3))
+
+        # 全部完成后再次运行不会重复导入
+        self.assertIn('导入完成：0 个文件', self.run_import())
+        self.assert_imported()
+
+    def test_interrupted_import_resumes_without_duplicates(self):
+        from core.management.commands import import_tree
+        copy_file, calls = import_tree.copy_file, []
+
+        def flaky_copy(src, dest, link):
+            calls.append(src)
+            if len(calls) == 3:
+                raise OSError('磁盘已满')
+            return copy_file(src, dest, link)
+
+        with mock.patch.object(import_tree, 'copy_file', flaky_copy):
+            with self.assertRaises(OSError):
+                self.run_import('--batch-size=1')
+        # 前两批已提交并写入进度日志
+        self.assertEqual(Resource.objects.filter(author=self.user).count(), 2)
+
+        # 上次中断时写了一半的行被忽略，之后的记录另起一行
+        with open(self.journal, 'a', encoding='utf-8') as f:
+            f.write('{"file": "sub/c.t')
+        output = self.run_import('--batch-size=1')
+        self.assertIn('从进度日志续传：已完成 2 个文件', output)
+        self.assertIn('导入完成：2 个文件', output)
+        self.assert_imported()
+
+        self.assertIn('导入完成：0 个文件', self.run_import())
+        self.assert_imported()
+
+
+class GalleryLayoutTests(TestCase):
+
+    def assert_rows(self, items, container, gap, full_rows):
+        """按 y 分行；满行的右边缘贴齐容器 (允许取整误差)，每项保持原宽高比"""
+        rows = {}
+        for item in items:
+            rows.setdefault(item['layout']['y'], []).append(item)
+        rows = [rows[y] for y in sorted(rows)]
+        for index, row in enumerate(rows):
+            self.assertEqual(len({item['layout']['height'] for item in row}), 1)
+            for left, right in zip(row, row[1:]):
+                self.assertAlmostEqual(right['layout']['x'], left['layout']['x'] + left['layout']['width'] + gap,
+                                       delta=1)
+            last = row[-1]['layout']
+            if index < full_rows:
+                self.assertAlmostEqual(last['x'] + last['width'], container, delta=1)
+            else:
+                self.assertLess(last['x'] + last['width'], container)
+        for item in items:
+            aspect = item['width'] / item['height'] if item.get('width') and item.get('height') else 1.0
+            layout = item['layout']
+            self.assertAlmostEqual(layout['width'] / layout['height'], aspect, delta=0.02 * aspect)
+        return rows
+
+    def test_justify(self):
+        items = [{'width': 800, 'height': 400}, {'width': 400, 'height': 200}, {'width': 600, 'height': 300},
+                 {'width': 300, 'height': 600}, {'width': None, 'height': None}]
+        height = justify(items, 1000, 200, 4)
+        rows = self.assert_rows(items, 1000, 4, full_rows=1)
+        self.assertEqual([len(row) for row in rows], [3, 2])
+        # 第一行缩放到填满：(1000 - 2 * 4) / (3 * 2 * 200) * 200
+        self.assertEqual(rows[0][0]['layout']['height'], 165)
+        # 最后一行不拉伸，保持目标行高；缺少尺寸的图片按正方形处理
+        self.assertEqual([item['layout'] for item in rows[1]], [
+            {'x': 0, 'y': 169, 'width': 100, 'height': 200},
+            {'x': 104, 'y': 169, 'width': 200, 'height': 200},
+        ])
+        self.assertEqual(height, 369)
+
+        # 一张图就超宽时单独成行并缩小到容器宽度
+        items = [{'width': 3000, 'height': 500}, {'width': 100, 'height': 100}]
+        justify(items, 1000, 200, 4)
+        self.assertEqual(items[0]['layout'], {'x': 0, 'y': 0, 'width': 1000, 'height': 167})
+        self.assertEqual(items[1]['layout']['y'], 171)
+        self.assertEqual(justify([], 1000, 200, 4), 0)
+
+    def test_gallery_endpoint(self):
+        user, other = User.objects.create_user('gallery_user'), User.objects.create_user('gallery_other')
+        sizes = [(800, 400), (400, 200), (600, 300), (300, 600), (500, 500)]
+        for owner in (user, other):
+            for n, (w, h) in enumerate(sizes):
+                res = Resource.objects.create(title=f'{n}.png', author=owner, kind='image',
+                                              image_width=w, image_height=h)
+                DesktopIcon.objects.create(user=owner, title=res.title, content_object=res)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        data = client.get('/api/desktop/gallery/', {'width': 1000, 'row_height': 200, 'gap': 4}).data
+        items = data['items']
+        # 新的在前，只有自己的图片
+        self.assertEqual([i['title'] for i in items], ['4.png', '3.png', '2.png', '1.png', '0.png'])
+        self.assertEqual({i['icon_id'] for i in items},
+                         set(DesktopIcon.objects.filter(user=user).values_list('id', flat=True)))
+        rows = self.assert_rows(items, 1000, 4, full_rows=1)
+        self.assertEqual(data['height'], max(i['layout']['y'] + i['layout']['height'] for i in items))
+        self.assertEqual(sum(len(row) for row in rows), 5)
+
+        # 不传 width 时不计算排版；分页按 next 继续
+        page = client.get('/api/desktop/gallery/', {'limit': 2}).data
+        self.assertNotIn('height', page)
+        self.assertNotIn('layout', page['items'][0])
+        rest = client.get('/api/desktop/gallery/', {'limit': 10, 'before': page['next']}).data
+        self.assertEqual([i['title'] for i in rest['items']], ['2.png', '1.png', '0.png'])
+        self.assertIsNone(rest['next'])
+        for params in ({'width': 'wide'}, {'row_height': '1.5'}, {'before': 'x'}):
+            self.assertEqual(client.get('/api/desktop/gallery/', params).status_code, 400)
@@ -0,0 +1,60 @@
+"""
+登录限流 - 在执行密码哈希之前拦截暴力破解 / 撞库请求
+"""
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginIPRateThrottle(SimpleRateThrottle):
+    """
+    按客户端 IP 的滑动窗口限流 (scope: login_ip)。
+    客户端 IP 由 get_ident 按 REST_FRAMEWORK['NUM_PROXIES'] 解析，不直接信任 X-Forwarded-For。
+    """
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
+
+
+class LoginUsernameRateThrottle(SimpleRateThrottle):
+    """按用户名的滑动窗口限流 (scope: login_user)，防止分布式 IP 针对同一账号"""
+    scope = 'login_user'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username')
+        if not username:
+            return None
+        # 用户名可能包含缓存后端不支持的字符，统一取摘要作为 key
+        ident = hashlib.md5(str(username).lower().encode('utf-8')).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def reset(self, request):
+        """登录成功后清空该用户名的失败记录"""
+        key = self.get_cache_key(request, None)
+        if key:
+            self.cache.delete(key)
+
+
+# 进程内同时进行的密码哈希计算上限 (PBKDF2 非常耗 CPU)
+_hash_slots = threading.BoundedSemaphore(getattr(settings, 'LOGIN_MAX_CONCURRENT_HASHES', 4))
+
+
+@contextmanager
+def password_hash_slot():
+    """
+    占用一个密码哈希名额，最多等待 LOGIN_HASH_WAIT_SECONDS 秒。
+    返回 True 表示拿到名额，False 表示服务器繁忙，应直接拒绝请求。
+    """
+    acquired = _hash_slots.acquire(timeout=getattr(settings, 'LOGIN_HASH_WAIT_SECONDS', 0.5))
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            _hash_slots.release()
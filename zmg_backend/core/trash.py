@@ -0,0 +1,285 @@
+"""
+回收站 - 删除只是给图标 / 资源 / 文件夹 (连同整棵子树) 打上 deleted_at 标记，
+默认管理器 (LiveManager) 自动把它们从所有列表中排除；
+
+用户直接删除的那一项记为回收站条目 (purge_after 非空)，可恢复。到期或清空回收站后，
+由 purge_trash 命令分批删除数据库记录，再按限速删除物理文件，不占用请求线程；
+仍被其他资源 (复制出的副本) 引用的文件保留。
+"""
+import os
+import shutil
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .changelog import log_changes
+from .models import Category, DesktopIcon, Resource
+from .quota import USAGE_FIELDS, release_resources
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'TRASH_RETENTION_DAYS', 30))
+
+
+def subtree_folders(user_id, folder_ids, manager, **filters):
+    """
+    沿该用户图标的 parent_folder 逐层向下 (与 walk_folder 相同，移动只改图标的 parent_folder)，
+    返回包含自身在内的所有文件夹 id (每层一次查询)。manager 为 DesktopIcon 的管理器。
+    """
+    result = list(folder_ids)
+    seen = set(result)
+    frontier = list(folder_ids)
+    while frontier:
+        children = manager.filter(
+            user_id=user_id, parent_folder_id__in=frontier, target_type='category', is_shortcut=False, **filters
+        ).values_list('object_id', flat=True)
+        frontier = [folder_id for folder_id in children if folder_id not in seen]
+        seen.update(frontier)
+        result.extend(frontier)
+    return result
+
+
+def _icon_subtrees(roots, manager):
+    """
+    一组回收站条目的整棵子树：返回 (所有文件夹 id, 子树内图标的 Q 条件)。
+    按用户分别遍历，不同用户共用同一个 Category 时互不影响。
+    """
+    by_user = {}
+    for icon in roots:
+        if icon.target_type == 'category' and not icon.is_shortcut:
+            by_user.setdefault(icon.user_id, []).append(icon.object_id)
+    folder_ids, inner = [], Q(pk__in=[])
+    for user_id, ids in by_user.items():
+        ids = subtree_folders(user_id, ids, manager)
+        folder_ids.extend(ids)
+        inner |= Q(user_id=user_id, parent_folder_id__in=ids)
+    return folder_ids, inner
+
+
+def trash_icons(icons, purge_after=None):
+    """
+    把一组图标移入回收站：文件夹连同内部所有图标、资源和子文件夹一起标记。
+    只做 UPDATE，不删除任何记录或文件。返回被标记的图标数。
+    """
+    icons = list(icons)
+    if not icons:
+        return 0
+    now = timezone.now()
+    if purge_after is None:
+        purge_after = now + retention()
+
+    root_ids = [icon.id for icon in icons]
+    # 快捷方式只删除图标本身，不影响它指向的文件夹 / 资源
+    folder_ids, subtree = _icon_subtrees(icons, DesktopIcon.objects)
+    inner = DesktopIcon.objects.filter(subtree).exclude(id__in=root_ids)
+    keys = [(icon.id, icon.user_id) for icon in icons] + list(inner.values_list('id', 'user_id'))
+    resources = Resource.objects.filter(
+        Q(id__in=[icon.object_id for icon in icons if icon.target_type == 'resource' and not icon.is_shortcut])
+        | Q(id__in=list(
+            inner.filter(target_type='resource', is_shortcut=False).values_list('object_id', flat=True)
+        ))
+    )
+
+    with transaction.atomic():
+        # 文件夹统计立即扣减；用户配额在物理清除后才释放
+        release_resources(resources.values(*USAGE_FIELDS), users=False)
+        resources.update(deleted_at=now)
+        inner.update(deleted_at=now)
+        DesktopIcon.objects.filter(id__in=root_ids).update(deleted_at=now, purge_after=purge_after)
+        Category.objects.filter(id__in=folder_ids).update(deleted_at=now)
+        log_changes('delete', keys)
+    return len(keys)
+
+
+def trash_items(user):
+    """回收站中的条目 (最近删除的在前)"""
+    return DesktopIcon.all_objects.filter(user=user, purge_after__gt=timezone.now()) \
+        .select_related('content_type').order_by('-deleted_at')
+
+
+def restore_icons(user, ids):
+    """
+    从回收站恢复条目，返回恢复的条目 id 列表。
+    只恢复与该条目同一次删除的内容 (deleted_at 相同)；原父文件夹已不存在时恢复到桌面。
+    """
+    restored = []
+    roots = DesktopIcon.all_objects.filter(user=user, id__in=ids, purge_after__gt=timezone.now())
+    for root in roots:
+        stamp = root.deleted_at
+        folder_ids = []
+        if root.target_type == 'category' and not root.is_shortcut:
+            folder_ids = subtree_folders(user.id, [root.object_id], DesktopIcon.all_objects, deleted_at=stamp)
+        inner_ids = list(
+            DesktopIcon.all_objects.filter(user=user, parent_folder_id__in=folder_ids, deleted_at=stamp)
+            .exclude(id=root.id).values_list('id', flat=True)
+        )
+        resource_ids = list(
+            DesktopIcon.all_objects.filter(id__in=inner_ids, target_type='resource', is_shortcut=False)
+            .values_list('object_id', flat=True)
+        )
+        if root.target_type == 'resource' and not root.is_shortcut:
+            resource_ids.append(root.object_id)
+        resources = Resource.all_objects.filter(id__in=resource_ids, deleted_at=stamp)
+
+        parent_id = root.parent_folder_id
+        if parent_id and not Category.objects.filter(id=parent_id).exists() and parent_id not in folder_ids:
+            parent_id = None
+
+        with transaction.atomic():
+            if parent_id is None and root.target_type == 'resource' and not root.is_shortcut:
+                # 恢复到桌面时资源也不再属于原文件夹
+                resources.filter(id=root.object_id).update(category_id=None)
+            release_resources(resources.values(*USAGE_FIELDS), users=False, sign=-1)
+            resources.update(deleted_at=None)
+            Category.all_objects.filter(id__in=folder_ids).update(deleted_at=None)
+            DesktopIcon.all_objects.filter(id__in=inner_ids).update(deleted_at=None)
+            DesktopIcon.all_objects.filter(id=root.id).update(
+                deleted_at=None, purge_after=None, parent_folder_id=parent_id,
+            )
+            log_changes('insert', DesktopIcon.objects.filter(id__in=[root.id] + inner_ids))
+        restored.append(root.id)
+    return restored
+
+
+def empty_trash(user, ids=None):
+    """清空回收站 (或其中指定的条目)：只把清除时间提前到现在，实际删除由 purge_trash 完成"""
+    qs = DesktopIcon.all_objects.filter(user=user, purge_after__gt=timezone.now())
+    if ids is not None:
+        qs = qs.filter(id__in=ids)
+    return qs.update(purge_after=timezone.now())
+
+
+def h5_app_root(link):
+    """
+    由 H5 应用的访问链接解析出其解压目录 (MEDIA_ROOT/h5apps/<应用目录>)，无法解析时返回 None。
+    链接来自数据库，不可信：解析结果规范化后必须恰好是 h5apps 目录的直接子目录。
+    """
+    clean_media_url = settings.MEDIA_URL.lstrip('/')
+    clean_link = link.lstrip('/')
+    rel_path = clean_link[len(clean_media_url):] if clean_link.startswith(clean_media_url) else clean_link
+
+    parts = [p for p in rel_path.split('/') if p]
+    # 路径格式: h5apps/app_name_hash/filename
+    if len(parts) < 2 or parts[0] != 'h5apps':
+        return None
+    apps_dir = os.path.realpath(os.path.join(settings.MEDIA_ROOT, 'h5apps'))
+    app_root = os.path.realpath(os.path.join(apps_dir, parts[1]))
+    if os.path.dirname(app_root) != apps_dir:
+        return None
+    return app_root
+
+
+class RateLimiter:
+    """把文件删除操作限制在每秒 rate 次以内，避免清理时占满磁盘 I/O"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self.next_at:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+def _shared_names(rows):
+    """
+    仍被其他资源引用的文件名和链接 (复制出的资源与源资源共享同一份文件)。
+    调用时本批记录已删除，因此查到的都是其他资源。
+    """
+    names = {name for row in rows for name in (row['file'], row['cover']) if name}
+    links = {row['link'] for row in rows if row['link']}
+    shared = set()
+    if names:
+        shared.update(Resource.all_objects.filter(file__in=names).values_list('file', flat=True))
+        shared.update(Resource.all_objects.filter(cover__in=names).values_list('cover', flat=True))
+    if links:
+        shared.update(Resource.all_objects.filter(link__in=links).values_list('link', flat=True))
+    return shared
+
+
+def _remove_files(rows, limiter):
+    removed = 0
+    # 已删除的和仍被引用的都跳过
+    skip = _shared_names(rows)
+    for row in rows:
+        for name in (row['file'], row['cover']):
+            if not name or name in skip:
+                continue
+            skip.add(name)
+            limiter.wait()
+            try:
+                default_storage.delete(name)
+                removed += 1
+                # 顺带清理变空的日期目录
+                os.rmdir(os.path.dirname(default_storage.path(name)))
+            except (OSError, SuspiciousFileOperation):
+                pass
+        link = row['link']
+        if row['kind'] == 'link' and link and '/h5apps/' in link and link not in skip:
+            skip.add(link)
+            app_root = h5_app_root(link)
+            if app_root and os.path.isdir(app_root):
+                limiter.wait()
+                shutil.rmtree(app_root, ignore_errors=True)
+                removed += 1
+    return removed
+
+
+def _purge_resources(resource_ids, icon_filter, folder_ids, limiter):
+    """删除一批记录 (同一事务)，提交后再删除文件；返回删除的文件数"""
+    resources = Resource.all_objects.filter(id__in=resource_ids, deleted_at__isnull=False)
+    rows = list(resources.values('file', 'cover', 'link', 'kind', *USAGE_FIELDS))
+    with transaction.atomic():
+        if icon_filter is not None:
+            DesktopIcon.all_objects.filter(icon_filter).delete()
+        # 文件夹统计在移入回收站时已扣减，这里只释放用户配额
+        release_resources(rows, folders=False)
+        resources.delete()
+        # Category.parent 级联删除，而移动只改图标：已移出子树的文件夹先断开，免得被一起删除
+        Category.all_objects.filter(parent_id__in=folder_ids).exclude(id__in=folder_ids).update(parent=None)
+        Category.all_objects.filter(id__in=folder_ids).delete()
+    return _remove_files(rows, limiter)
+
+
+def purge_due(batch_size=100, files_per_second=None):
+    """
+    物理清除一批到期的回收站条目，返回 (清除的条目数, 删除的文件数)。
+    条目数为 0 表示当前没有到期的内容。
+    """
+    if files_per_second is None:
+        files_per_second = getattr(settings, 'TRASH_PURGE_FILES_PER_SECOND', 50)
+    limiter = RateLimiter(files_per_second)
+    now = timezone.now()
+
+    # 1. 到期的回收站条目 (连同其子树)
+    roots = list(DesktopIcon.all_objects.filter(purge_after__lte=now).order_by('purge_after')[:batch_size])
+    files = 0
+    if roots:
+        root_ids = [icon.id for icon in roots]
+        folder_ids, subtree = _icon_subtrees(roots, DesktopIcon.all_objects)
+        icon_filter = Q(id__in=root_ids) | subtree
+        resource_ids = list(
+            DesktopIcon.all_objects.filter(icon_filter, target_type='resource', is_shortcut=False)
+            .values_list('object_id', flat=True)
+        )
+        files += _purge_resources(resource_ids, icon_filter, folder_ids, limiter)
+
+    # 2. 没有任何图标引用、删除已超过保留期的资源 (例如 cleanup_weekly 清理的无图标资源)
+    linked = DesktopIcon.all_objects.filter(target_type='resource', object_id=OuterRef('id'))
+    strays = list(
+        Resource.all_objects.filter(deleted_at__lte=now - retention())
+        .exclude(Exists(linked)).values_list('id', flat=True)[:batch_size]
+    )
+    if strays:
+        files += _purge_resources(strays, None, [], limiter)
+    return len(roots) + len(strays), files
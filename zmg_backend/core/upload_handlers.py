@@ -0,0 +1,42 @@
+"""
+上传处理器 - 在 Django 接收上传数据的同一遍中计算文件大小、SHA-256 与 MIME
+
+替换默认的内存 / 临时文件处理器 (见 settings.FILE_UPLOAD_HANDLERS)。
+生成的 UploadedFile 上带有 content_info 属性，Resource 保存时直接使用，无需再次读取文件。
+"""
+import time
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+from . import metrics
+from .file_utils import ContentInfo
+
+
+class ContentInfoMixin:
+    def new_file(self, *args, **kwargs):
+        # 先初始化：内存处理器激活时会在 new_file 中抛出 StopFutureHandlers
+        self.content_info = ContentInfo()
+        self.started_at = time.perf_counter()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        # 返回 None 表示本处理器接收了这块数据 (未激活的内存处理器会原样传给下一个处理器)
+        if remaining is None:
+            self.content_info.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file_obj = super().file_complete(file_size)
+        if file_obj is not None:
+            file_obj.content_info = self.content_info.result(self.file_name)
+            metrics.observe_upload(file_size, time.perf_counter() - self.started_at)
+        return file_obj
+
+
+class ContentInfoMemoryFileUploadHandler(ContentInfoMixin, MemoryFileUploadHandler):
+    """小文件：保存在内存中"""
+
+
+class ContentInfoTemporaryFileUploadHandler(ContentInfoMixin, TemporaryFileUploadHandler):
+    """大文件：边写入临时文件边计算"""
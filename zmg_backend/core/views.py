@@ -4,13 +4,37 @@ from rest_framework.response import Response
 from django.contrib.contenttypes.models import ContentType
 from django.core.files.base import ContentFile
 from django.conf import settings
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from urllib.parse import quote
+from django.db.models import Case, OuterRef, Q, Subquery, When
+import logging
+import mimetypes
 import os
 import shutil
+import tarfile
 import zipfile
 import uuid
 from .models import Resource, Category, User, Comment, DesktopIcon
 from .serializers import ResourceSerializer, CategorySerializer, UserSerializer, RegisterSerializer, CommentSerializer, DesktopIconSerializer
+from .cache_utils import bump_user_version, get_user_version
+from .changelog import log_changes, changes_since
+from .desktop_utils import prefetch_icons, walk_folder, folder_tree, find_subtree, prune_tree
+from .zip_stream import stream_zip, unique_name
+from .recent import record_access, recent_icon_ids
+from .facets import invalidate as invalidate_facets, library_facets
+from .quota import exceeds_quota, usage_payload, add_usage, move_resources
+from .trash import trash_icons, trash_items, restore_icons, empty_trash
+from .copying import SubtreeCopy
+from .placement import Placement, requested_position, arrange
+from .image_meta import IMAGE_FIELDS, justify
+from .previews import previewable, preview_key, get_preview
+from .archives import archive_key, list_entries, stream_entry, UnsupportedArchive
+from .portability import stream_export, export_filename, import_stream, ManifestError, QuotaExceeded
+
+logger = logging.getLogger(__name__)
 
 # --- 基础视图 ---
 class RegisterView(generics.CreateAPIView):
@@ -22,6 +46,44 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
+    @action(detail=False, methods=['GET'], permission_classes=[permissions.IsAuthenticated])
+    def tree(self, request):
+        """
+        当前用户的完整文件夹树 (含每个文件夹的子文件夹数 / 文件数)，不分页。
+        root=<文件夹ID> 时只返回该文件夹的子树；depth=<n> 时只返回 n 层 (更深的 children 为空)。
+        结果按 "目录树版本号" 缓存。
+        """
+        root = request.query_params.get('root')
+        if root:
+            try:
+                root = int(root)
+            except ValueError:
+                return Response({'status': 'error', 'msg': 'root 参数必须是整数'}, status=400)
+        depth = request.query_params.get('depth')
+        if depth:
+            try:
+                depth = int(depth)
+            except ValueError:
+                depth = 0
+            if depth < 1:
+                return Response({'status': 'error', 'msg': 'depth 参数必须是正整数'}, status=400)
+
+        user_id = request.user.id
+        key = f'tree:{user_id}:{get_user_version(user_id, "tree")}'
+        tree = cache.get(key)
+        if tree is None:
+            tree = folder_tree(request.user)
+            cache.set(key, tree, 60 * 60)
+
+        if root:
+            node = find_subtree(tree, root)
+            if node is None:
+                return Response({'status': 'error', 'msg': '文件夹不存在'}, status=404)
+            tree = [node]
+        if depth:
+            tree = prune_tree(tree, depth)
+        return Response(tree)
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -31,9 +93,26 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 class ResourceViewSet(viewsets.ModelViewSet):
-    queryset = Resource.objects.all()
+    # 作者与分类随列表一并取出，避免序列化时逐条查询
+    queryset = Resource.objects.select_related('author', 'category').order_by('id')
     serializer_class = ResourceSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def perform_update(self, serializer):
+        # 修改分类时把原有大小从旧文件夹的统计转到新文件夹
+        old_size, old_kind = serializer.instance.file_size or 0, serializer.instance.kind
+        if 'category' in serializer.validated_data:
+            category = serializer.validated_data['category']
+            move_resources([serializer.instance.id], category.id if category else None)
+        # 替换文件时 save() 会重新计算大小，按差值调整作者的已用空间与所在文件夹的统计
+        res = serializer.save()
+        delta = (res.file_size or 0) - old_size
+        if delta:
+            add_usage(res.author_id, res.category_id, delta, files=0)
+        if delta or res.kind != old_kind:
+            # 库统计按类型汇总数量与大小，指向该资源的图标所属用户的缓存都要重新聚合
+            invalidate_facets(DesktopIcon.objects.filter(target_type='resource', object_id=res.id)
+                              .values_list('user_id', flat=True))
     
     @action(detail=True, methods=['POST'])
     def view(self, request, pk=None):
@@ -50,7 +129,8 @@ class ResourceViewSet(viewsets.ModelViewSet):
         
     @action(detail=True, methods=['GET'])
     def comments(self, request, pk=None):
-        return Response(CommentSerializer(self.get_object().comments.all(), many=True).data)
+        comments = self.get_object().comments.select_related('user')
+        return Response(CommentSerializer(comments, many=True).data)
 
 # --- 核心：桌面图标视图 ---
 import os
@@ -59,11 +139,46 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
     serializer_class = DesktopIconSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        # 任何成功的写操作都会让该用户的桌面缓存 (启动数据等) 失效
+        if request.method not in permissions.SAFE_METHODS and response.status_code < 400 \
+                and request.user.is_authenticated:
+            bump_user_version(request.user.id)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        """图标列表：当前页的关联对象与文件夹预览批量加载，查询次数与图标数量无关"""
+        queryset = self.filter_queryset(self.get_queryset()).select_related('content_type')
+        page = self.paginate_queryset(queryset)
+        icons = prefetch_icons(page if page is not None else queryset)
+        serializer = self.get_serializer(icons, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def perform_create(self, serializer):
+        log_changes('insert', [serializer.save()])
+
+    def perform_update(self, serializer):
+        old_parent = serializer.instance.parent_folder_id
+        icon = serializer.save()
+        if icon.parent_folder_id != old_parent:
+            move_resources(self._owned_resource_ids([icon]), icon.parent_folder_id)
+        log_changes('update', [icon])
+
+    @staticmethod
+    def _owned_resource_ids(icons):
+        """图标指向的资源 (快捷方式不改变资源的归属文件夹)"""
+        return [icon.object_id for icon in icons if icon.target_type == 'resource' and not icon.is_shortcut]
+
+    def perform_destroy(self, instance):
+        trash_icons([instance])
+
     def get_queryset(self):
         """
         根据 parent_id 过滤图标。
         parent_id=root 或不传 -> 返回桌面顶级图标
-        parent_id=recent -> 返回最近创建的 20 个图标
+        parent_id=recent -> 返回最近打开过的 20 个图标
         parent_id=image/doc/video/audio -> 返回对应类型的资源
         parent_id=123 -> 返回文件夹 ID 为 123 内部的图标
         """
@@ -73,35 +188,269 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
         # 基础查询：当前用户的图标
         qs = DesktopIcon.objects.filter(user=user)
 
+        # 详情操作 (move/rename/uninstall 等) 按 id 定位图标，不受 parent_id 过滤影响
+        if self.detail:
+            return qs
+
         # === 核心逻辑：侧边栏过滤器 ===
 
         # 1. 桌面 (Root)
         if parent_id == 'root' or not parent_id:
             return qs.filter(parent_folder__isnull=True)
 
-        # 2. 最近访问 (Recent) - 返回最近创建的 20 个图标
+        # 2. 最近访问 (Recent) - 按缓存中的访问记录取图标，保持访问顺序
         elif parent_id == 'recent':
-            return qs.order_by('-created_at')[:20]
+            ids = recent_icon_ids(user.id)
+            if not ids:
+                return qs.none()
+            order = Case(*[When(id=icon_id, then=pos) for pos, icon_id in enumerate(ids)])
+            return qs.filter(id__in=ids).order_by(order)
 
         # 3. 库查询 (图片/文档/视频/音频)
-        # 这里使用了 Django 的 ContentType 来跨表查询 Resource
+        # 使用图标上冗余的 target_kind，走 (user, target_kind, created_at) 索引
         elif parent_id in ['image', 'doc', 'video', 'audio']:
-            # 获取 Resource 模型的 ContentType ID
-            resource_ct = ContentType.objects.get_for_model(Resource)
-
-            # 筛选：图标指向的是 Resource，且 Resource 的 kind 符合要求
-            # 使用子查询获取符合条件的 Resource ID
-            target_resources = Resource.objects.filter(kind=parent_id).values('id')
-
-            return qs.filter(
-                content_type=resource_ct,
-                object_id__in=target_resources
-            )
+            return qs.filter(target_kind=parent_id)
 
         # 4. 普通文件夹进入
         else:
             return qs.filter(parent_folder_id=parent_id)
 
+    @action(detail=False, methods=['GET'])
+    def changes(self, request):
+        """
+        增量同步：返回 since 版本之后的图标变更 (同一图标只返回最新状态)。
+        reset=True 时客户端需要全量重新加载，再从返回的 version 开始增量同步。
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+        except (TypeError, ValueError):
+            return Response({'status': 'error', 'msg': 'since 参数必须是整数'}, status=400)
+
+        version, reset, rows = changes_since(request.user, since)
+        if reset:
+            return Response({'version': version, 'reset': True, 'changes': []})
+
+        upsert_ids = [icon_id for _, icon_id, action in rows if action != 'delete']
+        icons = prefetch_icons(
+            DesktopIcon.objects.filter(user=request.user, id__in=upsert_ids).select_related('content_type')
+        )
+        data = {item['id']: item for item in DesktopIconSerializer(icons, many=True).data}
+
+        changes = []
+        for change_version, icon_id, action in rows:
+            item = data.get(icon_id)
+            # 记录为新增/修改但图标已不存在 (例如被级联删除)，按删除处理
+            if action != 'delete' and item is None:
+                action = 'delete'
+            changes.append({
+                'version': change_version,
+                'id': icon_id,
+                'action': action,
+                'data': item if action != 'delete' else None,
+            })
+        return Response({'version': version, 'reset': False, 'changes': changes})
+
+    @action(detail=False, methods=['GET'])
+    def facets(self, request):
+        """侧边栏库统计：每种类型的数量、总字节数、最近添加时间"""
+        return Response(library_facets(request.user.id))
+
+    GALLERY_LIMIT = 500
+
+    @action(detail=False, methods=['GET'])
+    def gallery(self, request):
+        """
+        图片库：?limit=100&before=<上一页 next>，可选 width=<容器宽度>&row_height=<目标行高>&gap=
+        一次查询返回图片的宽高、主色调与占位色块；传入 width 时同时计算等高行排版 (layout)。
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 100)), 1), self.GALLERY_LIMIT)
+            before = request.query_params.get('before')
+            before = int(before) if before else None
+            width = int(request.query_params.get('width', 0))
+            row_height = int(request.query_params.get('row_height', 200))
+            gap = int(request.query_params.get('gap', 4))
+        except ValueError:
+            return Response({'status': 'error', 'msg': '参数必须是整数'}, status=400)
+
+        # 从用户的图片图标 (走 user + target_kind 索引) 半连接到资源，不扫描其他用户的图片
+        icons = DesktopIcon.objects.filter(user=request.user, target_type='resource', target_kind='image')
+        queryset = Resource.objects.filter(kind='image', id__in=icons.values('object_id')) \
+            .annotate(icon_id=Subquery(icons.filter(object_id=OuterRef('id')).values('id')[:1])) \
+            .order_by('-id')
+        if before is not None:
+            queryset = queryset.filter(id__lt=before)
+        rows = list(queryset.values(
+            'id', 'icon_id', 'title', 'file', 'created_at', *IMAGE_FIELDS,
+        )[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        items = [{
+            'id': row['id'],
+            'icon_id': row['icon_id'],
+            'title': row['title'],
+            'url': default_storage.url(row['file']) if row['file'] else None,
+            'width': row['image_width'],
+            'height': row['image_height'],
+            'orientation': row['image_orientation'],
+            'color': row['dominant_color'],
+            'placeholder': row['placeholder'],
+            'created_at': row['created_at'],
+        } for row in rows]
+        data = {'items': items, 'next': rows[-1]['id'] if has_more else None}
+        if width > 0:
+            data['height'] = justify(items, width, max(row_height, 1), max(gap, 0))
+        return Response(data)
+
+    @action(detail=True, methods=['POST'])
+    def open(self, request, pk=None):
+        """记录一次打开，用于 "最近访问" 列表"""
+        icon = self.get_object()
+        record_access(request.user.id, icon.id)
+        return Response({'status': 'ok'})
+
+    @action(detail=True, methods=['GET'])
+    def preview(self, request, pk=None):
+        """文本类文档的预览：开头一段文本、编码与行数 (每份内容只提取一次)"""
+        icon = self.get_object()
+        res = icon.content_object if icon.target_type == 'resource' else None
+        if res is None:
+            return Response({'status': 'error', 'msg': '只能预览文件'}, status=400)
+        if not previewable(res):
+            return Response({'status': 'error', 'msg': '该文件类型不支持文本预览'}, status=415)
+        # 资源可能换成新文件，客户端按 ETag (存储文件名) 重新验证
+        etag = f'"{preview_key(res)}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            return Response(status=304, headers={'ETag': etag})
+        data = get_preview(res)
+        if data is None:
+            return Response({'status': 'error', 'msg': '文件不存在'}, status=404)
+        response = Response({'id': icon.id, **data})
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def _archive_resource(self, icon):
+        """图标对应的压缩包资源；不是压缩包时返回错误响应"""
+        res = icon.content_object if icon.target_type == 'resource' else None
+        if res is None or not res.file:
+            return None, Response({'status': 'error', 'msg': '只能浏览压缩包文件'}, status=400)
+        if res.kind != 'archive':
+            return None, Response({'status': 'error', 'msg': '该文件不是压缩包'}, status=415)
+        return res, None
+
+    @action(detail=True, methods=['GET'])
+    def archive(self, request, pk=None):
+        """
+        列出压缩包内容 (文件名、原始大小、压缩后大小)，不解压；结果按存储文件名缓存
+        """
+        icon = self.get_object()
+        res, error = self._archive_resource(icon)
+        if error:
+            return error
+        # 与预览相同：资源可能换成新文件，客户端按 ETag 重新验证
+        etag = f'"{archive_key(res)}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            return Response(status=304, headers={'ETag': etag})
+        try:
+            data = list_entries(res)
+        except UnsupportedArchive as e:
+            return Response({'status': 'error', 'msg': str(e)}, status=415)
+        except OSError:
+            return Response({'status': 'error', 'msg': '文件不存在'}, status=404)
+        response = Response({'id': icon.id, **data})
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=True, methods=['GET'], url_path='archive/entry')
+    def archive_entry(self, request, pk=None):
+        """从压缩包中单独下载一个文件 (?name=包内路径)，边解压边输出，不落盘"""
+        icon = self.get_object()
+        res, error = self._archive_resource(icon)
+        if error:
+            return error
+        name = request.query_params.get('name')
+        if not name:
+            return Response({'status': 'error', 'msg': '缺少 name 参数'}, status=400)
+        try:
+            chunks, size = stream_entry(res, name)
+        except KeyError:
+            return Response({'status': 'error', 'msg': '压缩包中没有该文件'}, status=404)
+        except UnsupportedArchive as e:
+            return Response({'status': 'error', 'msg': str(e)}, status=415)
+        except OSError:
+            return Response({'status': 'error', 'msg': '文件不存在'}, status=404)
+
+        filename = name.rstrip('/').rsplit('/', 1)[-1]
+        response = StreamingHttpResponse(
+            chunks, content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        if size is not None:
+            response['Content-Length'] = size
+        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+        return response
+
+    @action(detail=True, methods=['GET'])
+    def download_zip(self, request, pk=None):
+        """
+        将文件夹 (含子文件夹) 打包成 ZIP 流式下载，不生成临时文件
+        """
+        icon = self.get_object()
+        if not icon.content_type or icon.content_type.model != 'category':
+            return Response({'status': 'error', 'msg': '只能打包下载文件夹'}, status=400)
+
+        files = [
+            (path, child) for path, child in walk_folder(icon.user, icon.object_id)
+            if child.content_type and child.content_type.model == 'resource'
+        ]
+        resources = Resource.objects.in_bulk([child.object_id for _, child in files])
+
+        def entries():
+            used = set()
+            for path, child in files:
+                res = resources.get(child.object_id)
+                if not res or not res.file:
+                    continue
+                name = child.title.replace('/', '_')
+                yield unique_name(f'{path}/{name}' if path else name, used), res
+
+        response = StreamingHttpResponse(stream_zip(entries()), content_type='application/zip')
+        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(icon.title)}.zip"
+        return response
+
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        """
+        导出当前用户的桌面：NDJSON 清单流式输出；?files=1 时打包为 tar (含文件)
+        """
+        with_files = request.query_params.get('files') in ('1', 'true')
+        response = StreamingHttpResponse(
+            stream_export(request.user, with_files),
+            content_type='application/x-tar' if with_files else 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(request.user, with_files)}"'
+        return response
+
+    @action(detail=False, methods=['POST'], url_path='import')
+    def import_desktop(self, request):
+        """导入 export 导出的 NDJSON 清单或 tar 包 (字段名 file)，导入内容追加到当前桌面"""
+        error = self._quota_error(request.user, self._content_length(request))
+        if error:
+            return error
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'status': 'error', 'msg': '请上传导出文件'}, status=400)
+        try:
+            stats = import_stream(request.user, upload)
+        except ManifestError as e:
+            return Response({'status': 'error', 'msg': str(e)}, status=400)
+        except tarfile.TarError:
+            return Response({'status': 'error', 'msg': 'tar 包已损坏'}, status=400)
+        except QuotaExceeded:
+            return Response({'status': 'error', 'msg': '存储空间不足', **usage_payload(request.user)}, status=413)
+        return Response({'status': 'success', **stats})
+
     @action(detail=True, methods=['PATCH'])
     def move(self, request, pk=None):
         """
@@ -116,27 +465,378 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
             icon.y = request.data['y']
             
         # 2. 修改父文件夹 (实现拖拽归档)
-        if 'parent_id' in request.data:
+        moved = 'parent_id' in request.data
+        if moved:
             pid = request.data['parent_id']
             if pid == 'root' or pid is None:
                 icon.parent_folder = None
             else:
                 icon.parent_folder_id = pid
                 
-        icon.save()
+        with transaction.atomic():
+            icon.save()
+            if moved:
+                move_resources(self._owned_resource_ids([icon]), icon.parent_folder_id)
+        log_changes('update', [icon])
         return Response({'status': 'moved'})
 
+    # === 批量操作 (多选)：一次查询校验归属，一个事务内批量写入，返回逐项结果 ===
+    BULK_LIMIT = 1000
+
+    def _bulk_icons(self, request, ids):
+        """
+        解析 ids 并一次性取出当前用户拥有的图标。
+        返回 (有序 id 列表, {id: icon}, 错误响应)
+        """
+        if not isinstance(ids, list) or not ids:
+            return None, None, Response({'status': 'error', 'msg': 'ids 必须是非空列表'}, status=400)
+        if len(ids) > self.BULK_LIMIT:
+            return None, None, Response({'status': 'error', 'msg': f'单次最多操作 {self.BULK_LIMIT} 项'}, status=400)
+        try:
+            ids = list(dict.fromkeys(int(i) for i in ids))
+        except (TypeError, ValueError):
+            return None, None, Response({'status': 'error', 'msg': 'ids 必须是整数列表'}, status=400)
+        icons = DesktopIcon.objects.filter(user=request.user, id__in=ids).select_related('content_type')
+        return ids, {icon.id: icon for icon in icons}, None
+
+    @staticmethod
+    def _bulk_result(ids, icons, errors):
+        results = []
+        for icon_id in ids:
+            if icon_id not in icons:
+                results.append({'id': icon_id, 'status': 'error', 'msg': '图标不存在或无权操作'})
+            elif icon_id in errors:
+                results.append({'id': icon_id, 'status': 'error', 'msg': errors[icon_id]})
+            else:
+                results.append({'id': icon_id, 'status': 'ok'})
+        done = sum(1 for r in results if r['status'] == 'ok')
+        return Response({'status': 'success', 'done': done, 'results': results})
+
+    def _folder_ancestors(self, user, folder_id):
+        """目标文件夹及其所有上级文件夹的 id (沿图标的 parent_folder 向上查找)"""
+        category_ct = ContentType.objects.get_for_model(Category)
+        ancestors = set()
+        current = folder_id
+        while current is not None and current not in ancestors:
+            ancestors.add(current)
+            current = DesktopIcon.objects.filter(
+                user=user, content_type=category_ct, object_id=current
+            ).values_list('parent_folder_id', flat=True).first()
+        return ancestors
+
+    @action(detail=False, methods=['POST'])
+    def bulk_move(self, request):
+        """
+        批量移动：{ids: [...], parent_id: 'root' | 文件夹ID, positions: {id: {x, y}} (可选)}
+        """
+        ids, icons, error = self._bulk_icons(request, request.data.get('ids'))
+        if error:
+            return error
+
+        pid = request.data.get('parent_id', 'root')
+        target_id = None if pid in ('root', None) else pid
+        if target_id is not None:
+            try:
+                target_id = int(target_id)
+            except (TypeError, ValueError):
+                return Response({'status': 'error', 'msg': 'parent_id 无效'}, status=400)
+            if not DesktopIcon.objects.filter(user=request.user, target_type='category', object_id=target_id).exists():
+                return Response({'status': 'error', 'msg': '目标文件夹不存在'}, status=404)
+
+        positions = request.data.get('positions') or {}
+        if not isinstance(positions, dict):
+            return Response({'status': 'error', 'msg': 'positions 必须是 {id: {x, y}} 对象'}, status=400)
+        coords = {}
+        try:
+            for key, pos in positions.items():
+                if not isinstance(pos, dict):
+                    raise TypeError
+                coords[int(key)] = {axis: int(pos[axis]) for axis in ('x', 'y') if axis in pos}
+        except (TypeError, ValueError):
+            return Response({'status': 'error', 'msg': 'positions 中的坐标必须是整数'}, status=400)
+
+        # 防止把文件夹移动到自身或其子文件夹中
+        ancestors = self._folder_ancestors(request.user, target_id) if target_id else set()
+        errors = {}
+        changed = []
+        for icon in icons.values():
+            if icon.content_type and icon.content_type.model == 'category' and icon.object_id in ancestors:
+                errors[icon.id] = '不能移动到自身或子文件夹中'
+                continue
+            icon.parent_folder_id = target_id
+            pos = coords.get(icon.id, {})
+            icon.x = pos.get('x', icon.x)
+            icon.y = pos.get('y', icon.y)
+            changed.append(icon)
+
+        with transaction.atomic():
+            DesktopIcon.objects.bulk_update(changed, ['parent_folder', 'x', 'y'])
+            move_resources(self._owned_resource_ids(changed), target_id)
+            log_changes('update', changed)
+        return self._bulk_result(ids, icons, errors)
+
+    @action(detail=False, methods=['POST'])
+    def copy(self, request):
+        """
+        批量复制：{ids: [...], parent_id: 'root' | 文件夹ID (可选，缺省为原位置并命名为副本)}
+        文件夹连同其内容一起复制；只复制数据库记录，副本与原文件共享存储。
+        """
+        ids, icons, error = self._bulk_icons(request, request.data.get('ids'))
+        if error:
+            return error
+        if not icons:
+            return self._bulk_result(ids, icons, {})
+
+        suffix = ''
+        pid = request.data.get('parent_id')
+        if pid is None:
+            parents = {icon.parent_folder_id for icon in icons.values()}
+            if len(parents) != 1:
+                return Response({'status': 'error', 'msg': '原位置复制时所选图标须位于同一文件夹'}, status=400)
+            target_id, suffix = parents.pop(), ' - 副本'
+        elif pid == 'root':
+            target_id = None
+        else:
+            try:
+                target_id = int(pid)
+            except (TypeError, ValueError):
+                return Response({'status': 'error', 'msg': 'parent_id 无效'}, status=400)
+            if not DesktopIcon.objects.filter(user=request.user, target_type='category', object_id=target_id).exists():
+                return Response({'status': 'error', 'msg': '目标文件夹不存在'}, status=404)
+
+        plan = SubtreeCopy(request.user, [icons[i] for i in ids if i in icons])
+        error = self._quota_error(request.user, plan.size)
+        if error:
+            return error
+        created = prefetch_icons(plan.run(target_id, suffix))
+        response = self._bulk_result(ids, icons, {})
+        response.data['items'] = self.get_serializer(created, many=True).data
+        return response
+
+    @action(detail=True, methods=['POST'])
+    def duplicate(self, request, pk=None):
+        """在原位置创建副本"""
+        icon = self.get_object()
+        plan = SubtreeCopy(request.user, [icon])
+        error = self._quota_error(request.user, plan.size)
+        if error:
+            return error
+        created = prefetch_icons(plan.run(icon.parent_folder_id, ' - 副本'))
+        return Response(self.get_serializer(created[0]).data)
+
+    @action(detail=False, methods=['POST'])
+    def bulk_layout(self, request):
+        """
+        批量调整坐标：{items: [{id, x, y}, ...]}
+        """
+        items = request.data.get('items')
+        if not isinstance(items, list):
+            return Response({'status': 'error', 'msg': 'items 必须是列表'}, status=400)
+        ids, icons, error = self._bulk_icons(request, [item.get('id') for item in items if isinstance(item, dict)])
+        if error:
+            return error
+
+        errors = {}
+        changed = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            icon = icons.get(int(item['id']))
+            if icon is None:
+                continue
+            try:
+                icon.x = int(item.get('x', icon.x))
+                icon.y = int(item.get('y', icon.y))
+            except (TypeError, ValueError):
+                errors[icon.id] = '坐标必须是整数'
+                continue
+            changed[icon.id] = icon
+
+        with transaction.atomic():
+            DesktopIcon.objects.bulk_update(list(changed.values()), ['x', 'y'])
+            log_changes('update', changed.values())
+        return self._bulk_result(ids, icons, errors)
+
+    # 自动排列的排序方式
+    ARRANGE_KEYS = {
+        'name': lambda icon: icon.title.lower(),
+        'kind': lambda icon: (icon.target_kind, icon.title.lower()),
+        'created': lambda icon: icon.created_at,
+        'position': lambda icon: (icon.y, icon.x),  # 保持当前的阅读顺序，只是对齐到网格
+    }
+
+    @action(detail=False, methods=['POST'])
+    def arrange(self, request):
+        """
+        自动排列：{parent_id: 'root' | 文件夹ID, order_by: name | kind | created | position}
+        文件夹在前，依次放入网格，只更新位置有变化的图标 (一次 bulk_update)。
+        """
+        pid = request.data.get('parent_id', 'root')
+        key = self.ARRANGE_KEYS.get(request.data.get('order_by', 'position'))
+        if key is None:
+            return Response({'status': 'error', 'msg': f"order_by 可选 {', '.join(self.ARRANGE_KEYS)}"}, status=400)
+        try:
+            parent_id = None if pid in ('root', None) else int(pid)
+        except (TypeError, ValueError):
+            return Response({'status': 'error', 'msg': 'parent_id 无效'}, status=400)
+
+        icons = DesktopIcon.objects.filter(user=request.user, parent_folder_id=parent_id) \
+            .only('id', 'user_id', 'title', 'x', 'y', 'target_type', 'target_kind', 'created_at')
+        changed = arrange(icons, key)
+        with transaction.atomic():
+            DesktopIcon.objects.bulk_update(changed, ['x', 'y'])
+            log_changes('update', changed)
+        return Response({
+            'status': 'success',
+            'moved': len(changed),
+            'items': [{'id': icon.id, 'x': icon.x, 'y': icon.y} for icon in changed],
+        })
+
+    @action(detail=False, methods=['POST'])
+    def bulk_rename(self, request):
+        """
+        按模板批量重命名：{ids: [...], pattern: '照片_{n}'}
+        支持占位符 {n} (从 start 开始的序号，默认 1) 和 {name} (原名称)，同步修改底层资源/文件夹名称。
+        """
+        ids, icons, error = self._bulk_icons(request, request.data.get('ids'))
+        if error:
+            return error
+        pattern = request.data.get('pattern')
+        if not pattern:
+            return Response({'status': 'error', 'msg': '命名模板为空'}, status=400)
+        try:
+            start = int(request.data.get('start', 1))
+        except (TypeError, ValueError):
+            return Response({'status': 'error', 'msg': 'start 必须是整数'}, status=400)
+
+        renamed, resources, categories = [], [], []
+        errors = {}
+        objects = {}
+        for icon in icons.values():
+            if icon.content_type and icon.content_type.model in ('resource', 'category'):
+                objects.setdefault(icon.content_type.model, []).append(icon.object_id)
+        resource_map = Resource.objects.in_bulk(objects.get('resource', []))
+        category_map = Category.objects.in_bulk(objects.get('category', []))
+
+        for n, icon_id in enumerate((i for i in ids if i in icons), start=start):
+            icon = icons[icon_id]
+            try:
+                new_name = pattern.format(n=n, name=icon.title)
+            except (KeyError, IndexError, ValueError):
+                return Response({'status': 'error', 'msg': '命名模板格式错误'}, status=400)
+            new_name = new_name[:100]
+            if not new_name:
+                errors[icon_id] = '名称为空'
+                continue
+            icon.title = new_name
+            renamed.append(icon)
+            model = icon.content_type.model if icon.content_type else None
+            if model == 'resource' and icon.object_id in resource_map:
+                resource_map[icon.object_id].title = new_name
+                resources.append(resource_map[icon.object_id])
+            elif model == 'category' and icon.object_id in category_map:
+                category_map[icon.object_id].name = new_name[:50]
+                categories.append(category_map[icon.object_id])
+
+        with transaction.atomic():
+            DesktopIcon.objects.bulk_update(renamed, ['title'])
+            Resource.objects.bulk_update(resources, ['title'])
+            Category.objects.bulk_update(categories, ['name'])
+            log_changes('update', renamed)
+        return self._bulk_result(ids, icons, errors)
+
+    @action(detail=False, methods=['POST'])
+    def bulk_delete(self, request):
+        """
+        批量删除：{ids: [...]}，移入回收站 (文件夹连同其内部图标)，只做批量 UPDATE。
+        """
+        ids, icons, error = self._bulk_icons(request, request.data.get('ids'))
+        if error:
+            return error
+        trash_icons(icons.values())
+        return self._bulk_result(ids, icons, {})
+
+    # === 回收站 ===
+    @action(detail=False, methods=['GET'])
+    def trash(self, request):
+        """回收站列表 (最近删除的在前)"""
+        queryset = trash_items(request.user)
+        page = self.paginate_queryset(queryset)
+        icons = prefetch_icons(page if page is not None else queryset)
+        serializer = self.get_serializer(icons, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['POST'])
+    def restore(self, request):
+        """从回收站恢复：{ids: [...]}"""
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            return Response({'status': 'error', 'msg': 'ids 必须是非空列表'}, status=400)
+        if len(ids) > self.BULK_LIMIT:
+            return Response({'status': 'error', 'msg': f'一次最多操作 {self.BULK_LIMIT} 项'}, status=400)
+        try:
+            ids = [int(i) for i in ids]
+        except (TypeError, ValueError):
+            return Response({'status': 'error', 'msg': 'ids 必须是整数列表'}, status=400)
+        restored = restore_icons(request.user, ids)
+        return Response({'status': 'success', 'restored': restored, 'missing': sorted(set(ids) - set(restored))})
+
+    @action(detail=False, methods=['POST'])
+    def empty_trash(self, request):
+        """清空回收站；传 {ids: [...]} 时只彻底删除指定条目。文件在后台清除"""
+        ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list):
+                return Response({'status': 'error', 'msg': 'ids 必须是列表'}, status=400)
+            if len(ids) > self.BULK_LIMIT:
+                return Response({'status': 'error', 'msg': f'一次最多操作 {self.BULK_LIMIT} 项'}, status=400)
+            try:
+                ids = [int(i) for i in ids]
+            except (TypeError, ValueError):
+                return Response({'status': 'error', 'msg': 'ids 必须是整数列表'}, status=400)
+        count = empty_trash(request.user, ids)
+        return Response({'status': 'success', 'count': count})
+
+    def _quota_error(self, user, incoming):
+        """incoming 字节超出剩余配额时返回 413 响应"""
+        if exceeds_quota(user, incoming):
+            return Response({'status': 'error', 'msg': '存储空间不足', **usage_payload(user)}, status=413)
+        return None
+
+    def _content_length(self, request):
+        try:
+            return int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return 0
+
+    @action(detail=False, methods=['POST'])
+    def upload_init(self, request):
+        """
+        上传前的配额预检：{size: 待上传的总字节数}
+        文件夹上传时前端先调用一次，避免传了一半才发现空间不足。
+        """
+        try:
+            size = int(request.data.get('size', 0))
+        except (TypeError, ValueError):
+            return Response({'status': 'error', 'msg': 'size 必须是整数'}, status=400)
+        error = self._quota_error(request.user, size)
+        if error:
+            return error
+        return Response({'status': 'success', **usage_payload(request.user)})
+
     @action(detail=False, methods=['POST'])
     def create_folder(self, request):
         user = request.user
         name = request.data.get('name', '新建文件夹')
-        x = request.data.get('x', 50)
-        y = request.data.get('y', 50)
         parent_id = request.data.get('parent_id')
         
         # 处理 parent_id 为 'root' 的情况
         if parent_id == 'root': 
             parent_id = None
+        # 未指定坐标时放到第一个空闲格子
+        x, y = requested_position(request, user.id, parent_id)
 
         # 1. 创建真实的 Category 对象
         real_folder = Category.objects.create(name=name, parent_id=parent_id, icon='folder')
@@ -150,11 +850,17 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
             y=y, 
             parent_folder_id=parent_id
         )
+        log_changes('insert', [icon])
         return Response(DesktopIconSerializer(icon).data)
 
     @action(detail=False, methods=['POST'])
     def upload_file(self, request):
         user = request.user
+        # 在读取请求体 (写入临时文件) 之前按 Content-Length 检查配额
+        error = self._quota_error(user, self._content_length(request))
+        if error:
+            return error
+
         file_obj = request.FILES.get('file')
         # 获取相对路径，例如 "MyFolder/Sub/test.txt"
         # 如果是单文件上传，这个值可能是 "undefined" 或空
@@ -193,16 +899,17 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
                         icon='folder'
                     )
                     # 重要：为新文件夹创建桌面图标，否则在桌面/窗口里看不到它
-                    # 这里坐标随机生成，防止重叠
-                    import random
-                    DesktopIcon.objects.create(
+                    # 放到父文件夹中第一个空闲格子，避免重叠
+                    x, y = Placement(user.id, cat.parent_id).next()
+                    folder_icon = DesktopIcon.objects.create(
                         user=user,
                         title=part_name,
                         content_object=cat,
                         parent_folder=current_parent_cat,
-                        x=random.randint(50, 400),
-                        y=random.randint(50, 300)
+                        x=x,
+                        y=y
                     )
+                    log_changes('insert', [folder_icon])
                 
                 # 3. 深入下一层
                 current_parent_cat = cat
@@ -216,17 +923,19 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
             category=current_parent_cat, 
             status='approved'
         )
+        add_usage(user.id, res.category_id, res.file_size)
         
-        # 创建文件的图标
-        import random
+        # 创建文件的图标 (未指定坐标时放到第一个空闲格子)
+        x, y = requested_position(request, user.id, res.category_id)
         icon = DesktopIcon.objects.create(
             user=user, 
             title=res.title, 
             content_object=res, 
-            x=request.data.get('x', random.randint(50, 500)), 
-            y=request.data.get('y', random.randint(50, 400)), 
+            x=x, 
+            y=y, 
             parent_folder=current_parent_cat # 链接到正确的父文件夹
         )
+        log_changes('insert', [icon])
         
         return Response(DesktopIconSerializer(icon).data)
 
@@ -237,6 +946,7 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
         if new_name:
             icon.title = new_name
             icon.save()
+            log_changes('update', [icon])
             # 可选：同步修改底层资源的名字
             if icon.content_object and hasattr(icon.content_object, 'title'):
                 icon.content_object.title = new_name
@@ -270,7 +980,8 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
             # 现在我们直接存完整的类名，例如 "fa-solid fa-folder-open"
             obj.icon = new_icon_class
             obj.save()
-            
+
+        log_changes('update', [icon])
         return Response({'status': 'success', 'msg': '图标已更新'})
 
     # [新增] H5 应用安装接口
@@ -297,14 +1008,16 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
         )
 
         # 创建桌面图标
+        x, y = requested_position(request, user.id, parent_id)
         icon = DesktopIcon.objects.create(
             user=user,
             title=res.title,
             content_object=res,
-            x=request.data.get('x', 50),
-            y=request.data.get('y', 50),
+            x=x,
+            y=y,
             parent_folder_id=parent_id # 允许指定文件夹
         )
+        log_changes('insert', [icon])
         return Response(DesktopIconSerializer(icon).data)
 
     # [新增] 创建 HTML/富文本文件
@@ -323,14 +1036,20 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
             title=title, author=user, kind='doc',
             icon_class='fa-brands fa-html5', status='approved'
         )
+        res.fill_file_info(file_content, file_name)
         res.file.save(file_name, file_content) # 保存文件
+        add_usage(user.id, res.category_id, res.file_size)
         
         # 创建图标
+        parent_id = request.data.get('parent_id')
+        if parent_id == 'root':
+            parent_id = None
+        x, y = requested_position(request, user.id, parent_id)
         icon = DesktopIcon.objects.create(
             user=user, title=title, content_object=res,
-            x=request.data.get('x', 50), y=request.data.get('y', 50),
-            parent_folder_id=request.data.get('parent_id')
+            x=x, y=y, parent_folder_id=parent_id
         )
+        log_changes('insert', [icon])
         return Response(DesktopIconSerializer(icon).data)
 
     # [新增] H5 应用安装接口 (处理 ZIP 上传与解压)
@@ -340,6 +1059,11 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
         import uuid
         
         user = request.user
+        # 在读取请求体之前按 Content-Length 检查配额
+        error = self._quota_error(user, self._content_length(request))
+        if error:
+            return error
+
         file_obj = request.FILES.get('file')
         
         # 1. 获取基本参数
@@ -365,6 +1089,12 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
                  return Response({'status': 'error', 'msg': '请上传 ZIP 格式的压缩包'}, status=400)
                  
             with zipfile.ZipFile(file_obj, 'r') as zip_ref:
+                # 解压后的大小可从中央目录直接得到，超出配额则不解压
+                app_size = sum(info.file_size for info in zip_ref.infolist())
+                error = self._quota_error(user, app_size)
+                if error:
+                    shutil.rmtree(extract_root)
+                    return error
                 zip_ref.extractall(extract_root)
         except Exception as e:
             # 如果解压出错，清理创建的空文件夹
@@ -399,8 +1129,10 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
             kind='link',         
             link=app_link,       
             icon_class=icon_class,
-            status='approved'
+            status='approved',
+            file_size=app_size
         )
+        add_usage(user.id, None, app_size)
         
         # 7. 创建桌面图标
         # 处理 parent_id 为 'root' 的情况
@@ -408,110 +1140,35 @@ class DesktopIconViewSet(viewsets.ModelViewSet):
         if parent_id == 'root':
             parent_id = None
 
+        x, y = requested_position(request, user.id, parent_id)
         icon = DesktopIcon.objects.create(
             user=user,
             title=title,
             content_object=res,
-            x=request.data.get('x', 50),
-            y=request.data.get('y', 50),
+            x=x,
+            y=y,
             parent_folder_id=parent_id
         )
+        log_changes('insert', [icon])
 
         return Response(DesktopIconSerializer(icon).data)
 
-    # [核心修复] 万能删除接口 (支持文件夹、文件、应用)
+    # [核心修复] 万能删除接口 (支持文件夹、文件、应用)：移入回收站，物理删除由 purge_trash 完成
     @action(detail=True, methods=['DELETE'])
     def uninstall(self, request, pk=None):
         try:
-            # 1. 获取桌面图标
             icon = self.get_object()
-            
+
             # 安全检查：确保图标存在且属于当前用户
             if icon.user != request.user:
                 return Response({'status': 'error', 'msg': '无权删除此项目'}, status=403)
 
-            # 获取图标指向的真实对象 (可能是 文件夹Category 或 文件Resource)
-            obj = icon.content_object
-
-            print(f">>> 正在删除: {icon.title} (类型: {type(obj).__name__ if obj else 'None'}, ID: {pk})")
-
-            # 2. 情况A：如果有有效对象
-            if obj:
-                # 2.1 如果是文件夹 (Category)
-                if isinstance(obj, Category):
-                    try:
-                        # 先删除该文件夹内的所有桌面图标（避免外键约束错误）
-                        DesktopIcon.objects.filter(parent_folder=obj).delete()
-                        
-                        # 删除文件夹本体
-                        obj.delete()
-                        print("✅ 文件夹已删除")
-                    except Exception as folder_error:
-                        print(f"❌ 删除文件夹时出错: {folder_error}")
-                        # 即使文件夹删除失败，也继续删除图标
-                        
-                # 2.2 如果是文件/应用 (Resource)
-                elif isinstance(obj, Resource):
-                    # 特殊处理：如果是 H5 应用，尝试删除物理文件目录
-                    if obj.kind == 'link' and obj.link and '/h5apps/' in obj.link:
-                        import shutil
-                        from django.conf import settings
-                        try:
-                            # 更安全的路径解析
-                            if settings.MEDIA_URL.startswith('/'):
-                                clean_media_url = settings.MEDIA_URL[1:]  # 移除开头的 /
-                            else:
-                                clean_media_url = settings.MEDIA_URL
-                                
-                            if obj.link.startswith('/'):
-                                clean_link = obj.link[1:]  # 移除开头的 /
-                            else:
-                                clean_link = obj.link
-                            
-                            # 解析相对路径
-                            if clean_link.startswith(clean_media_url):
-                                rel_path = clean_link[len(clean_media_url):]
-                            else:
-                                rel_path = clean_link
-                                
-                            if 'h5apps' in rel_path:
-                                parts = [p for p in rel_path.split('/') if p]  # 过滤空字符串
-                                # 路径格式: h5apps/app_name_hash/filename
-                                if len(parts) >= 2:
-                                    app_root = os.path.join(settings.MEDIA_ROOT, parts[0], parts[1])
-                                    if os.path.exists(app_root):
-                                        shutil.rmtree(app_root)
-                                        print(f"✅ 物理文件夹已清除: {app_root}")
-                                    else:
-                                        print(f"⚠️ 物理文件夹不存在: {app_root}")
-                                else:
-                                    print(f"⚠️ H5应用路径格式不正确: {rel_path}")
-                        except Exception as e:
-                            print(f"⚠️ 物理文件清理出错 (不影响数据库删除): {e}")
-                            # 记录错误但不中断删除流程
-
-                    # 删除文件对象
-                    try:
-                        obj.delete()
-                        print("✅ 文件资源已删除")
-                    except Exception as resource_error:
-                        print(f"❌ 删除资源时出错: {resource_error}")
-                        # 即使资源删除失败，也继续删除图标
-            
-            # 3. 无论对象是否存在或删除是否成功，都删除桌面图标本身
-            try:
-                icon.delete()
-                print("✅ 桌面图标已删除")
-            except Exception as icon_error:
-                print(f"❌ 删除图标时出错: {icon_error}")
-                return Response({'status': 'error', 'msg': f'删除图标失败: {str(icon_error)}'}, status=500)
-
-            return Response({'status': 'success', 'msg': '删除成功'})
+            logger.info('移入回收站: %s (类型: %s, ID: %s)', icon.title, icon.target_type or 'None', pk)
+            trash_icons([icon])
+            return Response({'status': 'success', 'msg': '已移入回收站'})
 
         except DesktopIcon.DoesNotExist:
             return Response({'status': 'error', 'msg': '图标不存在'}, status=404)
         except Exception as e:
-            # 打印详细错误方便调试
-            import traceback
-            traceback.print_exc()
+            logger.exception('删除失败: %s', e)
             return Response({'status': 'error', 'msg': f'删除失败: {str(e)}'}, status=500)
\ No newline at end of file
@@ -2,4 +2,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zmg_backend.settings')
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# 桌面变更推送 (SSE) 需要在 ASGI 服务器下运行，例如: uvicorn zmg_backend.asgi:application
+from core.sse import EventStreamRouter  # noqa: E402  (需在 Django 初始化之后导入)
+
+application = EventStreamRouter(django_application)
@@ -26,6 +26,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 性能埋点放最前面，统计覆盖其余中间件 (见 core/instrumentation.py)
+    'core.instrumentation.InstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -85,9 +87,25 @@ STATICFILES_DIRS = [
 # 生产环境使用的静态文件根目录（执行 collectstatic 时使用）
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic 时给文件名加上内容哈希 (app.3f2a9c1b7e4d.js)，这类文件可以设置长期缓存；
+# 之后执行 compress_static 生成 .gz / .br 版本 (见 core/static_delivery.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'},
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 每个用户默认的存储配额 (字节)，None 表示不限；可在用户上单独设置 storage_quota
+STORAGE_QUOTA_DEFAULT = 2 * 1024 ** 3
+
+# 上传时在同一遍读取中计算文件大小 / SHA-256 / MIME (见 core/upload_handlers.py)
+FILE_UPLOAD_HANDLERS = [
+    'core.upload_handlers.ContentInfoMemoryFileUploadHandler',
+    'core.upload_handlers.ContentInfoTemporaryFileUploadHandler',
+]
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -108,10 +126,83 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # 登录限流：按 IP 与按用户名分别计数 (见 core/throttling.py)
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '20/min',
+        'login_user': '10/min',
+    },
+    # 前面的反向代理层数：为 0 时按 REMOTE_ADDR 识别客户端，忽略可伪造的 X-Forwarded-For；
+    # 部署在 Nginx 等代理之后时设为实际层数 (只取代理追加的那一段)
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '0')),
 }
 
+# 缓存：限流计数等依赖缓存框架，多进程部署时请改为 Redis / Memcached
+CACHES = {
+    'default': {
+        # 带命中率统计的 LocMemCache；换 Redis 时可用 CacheStatsMixin 组合
+        'BACKEND': 'core.instrumentation.InstrumentedLocMemCache',
+        'LOCATION': 'zmg-default',
+    }
+}
+
+# 最近访问的刷写 (见 core/recent.py)：进程内缓存时由 Web 进程每 RECENT_FLUSH_INTERVAL 秒刷写一次；
+# 换成共享缓存后改为定期运行 flush_recent 命令 (RECENT_FLUSH_IN_PROCESS 缺省时自动判断)
+RECENT_FLUSH_INTERVAL = 30
+
+# 每个进程同时进行的密码哈希计算上限，以及等待名额的最长秒数
+LOGIN_MAX_CONCURRENT_HASHES = 4
+LOGIN_HASH_WAIT_SECONDS = 0.5
+
+# 桌面变更推送 (SSE, 见 core/events.py)
+# 多进程部署改为 'core.events.RedisBackend' 并设置 EVENTS_REDIS_URL
+EVENTS_BACKEND = 'core.events.LocalBackend'
+EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+EVENTS_QUEUE_SIZE = 100
+SSE_HEARTBEAT_SECONDS = 15
+
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=7),
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+
+# 请求性能埋点 (见 core/instrumentation.py)
+PERF_SERVER_TIMING = 'staff'       # Server-Timing 响应头：False / 'staff' (只对管理员) / True
+PERF_SLOW_REQUEST_MS = 500         # 超过该耗时的请求记为慢请求
+PERF_SLOW_QUERY_MS = 100           # 超过该耗时的 SQL 记录语句文本
+PERF_SLOW_LOG_SAMPLE_RATE = 1.0    # 慢请求日志的抽样比例
+
+# 健康检查 / 指标 (见 core/health.py、core/metrics.py)
+HEALTH_CACHE_SECONDS = 5                 # 探测结果缓存秒数
+HEALTH_MIN_FREE_BYTES = 1024 ** 3        # 媒体目录剩余空间低于该值时报告 degraded
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # 非空时 /metrics 需携带 Bearer token
+# 未设置 METRICS_TOKEN 时，只允许这些地址抓取 /metrics (逗号分隔)
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# 每个请求的结构化日志写入 'core.perf'：WARNING 只记录慢请求，改为 INFO 记录全部请求
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.perf': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'core': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# 回收站 (见 core/trash.py)：删除的内容保留天数，以及 purge_trash 每秒最多删除的文件数
+TRASH_RETENTION_DAYS = 30
+TRASH_PURGE_FILES_PER_SECOND = 50
+
+# 图标网格 (见 core/placement.py)：每行格数与格距 (像素)，新图标自动放到第一个空闲格子
+DESKTOP_GRID_COLUMNS = 8
+DESKTOP_GRID_STEP = 100
+
+# 文档预览 (见 core/previews.py)：最多读取文件开头的字节数，以及返回的预览文本最大字符数
+DOC_PREVIEW_BYTES = 64 * 1024
+DOC_PREVIEW_CHARS = 4000
+
+# 压缩包浏览 (见 core/archives.py)：列表最多返回的条目数
+ARCHIVE_LIST_LIMIT = 5000
@@ -1,10 +1,11 @@
 # 文件路径: zmg_backend/zmg_backend/urls.py
 
+import re
+
 from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.generic import TemplateView  # [新增] 引入通用视图
 
 # 引入 SimpleJWT 的视图
 from rest_framework_simplejwt.views import (
@@ -14,12 +15,13 @@ from rest_framework_simplejwt.views import (
 
 from rest_framework.routers import DefaultRouter
 from core.views import DesktopIconViewSet, CategoryViewSet, ResourceViewSet
+from core.static_delivery import shell_view, static_view
 
 # API视图
 from core.api_views import (
-    api_login, api_logout, api_user_info, 
+    api_login, api_logout, api_user_info, api_bootstrap,
     api_files_list, api_search, api_upload_file,
-    health_check
+    health_check, metrics_view
 )
 
 # 注册 API 路由
@@ -36,20 +38,23 @@ urlpatterns = [
     path('api/token/', api_login, name='api_token'),
     path('api/logout/', api_logout, name='api_logout'),
     path('api/user/', api_user_info, name='api_user_info'),
+    path('api/bootstrap/', api_bootstrap, name='api_bootstrap'),
     path('api/files/', api_files_list, name='api_files_list'),
     path('api/search/', api_search, name='api_search'),
     path('api/upload/', api_upload_file, name='api_upload_file'),
     path('api/health/', health_check, name='health_check'),
+    path('metrics', metrics_view, name='metrics'),
     path('api/verify/', api_user_info, name='api_verify'),
     
     # 3. 业务 API - 必须在根路由之前
     path('api/', include(router.urls)),
 
-    # 4. 静态文件和媒体文件服务 - 仅在非API路径下提供
-    # 这样API请求不会被误认为静态文件
-    
-    # 5. 首页路由：只匹配确切的根路径
-    re_path(r'^$', TemplateView.as_view(template_name='index.html'), name='home'),
+    # 4. 静态文件服务 - 仅在非API路径下提供，这样API请求不会被误认为静态文件
+    # 从 STATIC_ROOT 提供预压缩版本 (collectstatic + compress_static)，带内容哈希的文件长期缓存
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.STATIC_URL.lstrip('/')), static_view, name='static'),
+
+    # 5. 首页路由：只匹配确切的根路径 (预渲染、预压缩的前端外壳，不再逐次渲染模板)
+    re_path(r'^$', shell_view, name='home'),
 ]
 
 # 开发模式下提供媒体文件访问 - 移到urlpatterns外避免冲突